@@ -0,0 +1,274 @@
+"""Aggregate Index
+
+=== Module Description ===
+This module contains AggregateIndex, which answers "what is taking up the
+space" questions about a tree without walking it: the largest leaves, the
+largest subtrees, and the total size of the leaves grouped by a key (for
+files, their extension).
+
+The index keeps one heap of leaves and one heap of subtrees, ordered by
+size, and a total size and count per key. It is attached to the root of a
+tree, and the editing methods of AbstractTree (set_size, adjust_size,
+add_subtree, remove_subtree and deletion) report their changes to it, so it
+stays up to date in time proportional to the nodes changed. A batch of
+edits (see journal.EditJournal) reports each change with ancestors=False,
+and then each changed ancestor once through refresh.
+
+The heaps are updated lazily: a change pushes a new entry for each node
+whose size changed, and entries that no longer match their node (its size
+changed again, it was deleted or moved out of the tree, or it gained or
+lost its subtrees) are only thrown away when a query reaches them. Once
+the heaps hold more than twice as many entries as the tree has nodes, they
+are rebuilt from the tree, so their size stays proportional to it.
+"""
+
+from __future__ import annotations
+from heapq import heapify, heappop, heappush
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# The heaps are rebuilt when they hold more than REBUILD_FACTOR entries per
+# node of the tree, plus REBUILD_SLACK.
+REBUILD_FACTOR = 2
+REBUILD_SLACK = 1024
+
+# A heap entry: (minus the size of the node, a tie-breaking sequence number,
+# the node).
+Entry = Tuple[float, int, Any]
+
+
+class AggregateIndex:
+    """Heaps and per-key totals over the nodes of one tree.
+
+    === Public Attributes ===
+    root: the root of the indexed tree, or None before attach is called.
+    key: the function giving the key of a leaf, or None if a leaf's key is
+        its leaf_key(). Leaves whose key is None are not totalled.
+
+    === Private Attributes ===
+    _leaves: the heap of leaf entries.
+    _subtrees: the heap of entries of trees with subtrees.
+    _totals: the total size of the leaves with each key.
+    _counts: the number of leaves with each key.
+    _nodes: the number of nodes in the tree.
+    _sequence: the source of the sequence numbers of new entries.
+    """
+    root: Optional[Any]
+    key: Optional[Callable[[Any], Optional[object]]]
+    _leaves: List[Entry]
+    _subtrees: List[Entry]
+    _totals: Dict[object, float]
+    _counts: Dict[object, int]
+    _nodes: int
+    _sequence: count
+
+    def __init__(self: AggregateIndex,
+                 key: Optional[Callable[[Any], Optional[object]]] = None) \
+            -> None:
+        """Initialize an empty index that groups leaves by <key>."""
+        self.root = None
+        self.key = key
+        self._leaves = []
+        self._subtrees = []
+        self._totals = {}
+        self._counts = {}
+        self._nodes = 0
+        self._sequence = count()
+
+    def observe(self: AggregateIndex, node: Any) -> Any:
+        """Add the single node <node> to the index, and return it.
+
+        This is used to build the index while a tree is being built, e.g.
+        by wrapping the make_node function of a scan; the heaps are ordered
+        when attach is called.
+        """
+        self._nodes += 1
+        entry = (-node.data_size, next(self._sequence), node)
+        if node._subtrees:
+            self._subtrees.append(entry)
+        else:
+            self._leaves.append(entry)
+            self._add_key(node, 1)
+        return node
+
+    def attach(self: AggregateIndex, root: Any,
+               observed_root: Optional[Any] = None) -> None:
+        """Make this the index of the tree <root>.
+
+        If <observed_root> is given, every node of the tree has already been
+        observed, with <observed_root> observed in place of <root> (a tree
+        whose root was copied after it was built), or <observed_root> is
+        <root>. Otherwise the whole tree is added now.
+        """
+        if observed_root is root:
+            pass
+        elif observed_root is not None:
+            self._nodes -= 1
+            if not observed_root._subtrees:
+                self._add_key(observed_root, -1)
+            self.observe(root)
+        else:
+            self._add_tree(root, heap=False)
+        self.root = root
+        root._aggregates = self
+        heapify(self._leaves)
+        heapify(self._subtrees)
+
+    def resized(self: AggregateIndex, node: Any, old_size: float,
+                ancestors: bool = True) -> None:
+        """Record that the size of <node> changed from <old_size>, and, if
+        <ancestors> is True, that the sizes of its ancestors changed to
+        match."""
+        key = None if node._subtrees else self._key(node)
+        if key is not None:
+            self._totals[key] += node.data_size - old_size
+        self._push(node)
+        if ancestors:
+            self._push_ancestors(node)
+
+    def added(self: AggregateIndex, subtree: Any,
+              ancestors: bool = True) -> None:
+        """Record that <subtree> was added to the tree, and, if <ancestors>
+        is True, that the sizes of its ancestors changed to match."""
+        self._add_tree(subtree, heap=True)
+        if ancestors:
+            self._push_ancestors(subtree)
+
+    def removed(self: AggregateIndex, subtree: Any,
+                ancestors: bool = True) -> None:
+        """Record that <subtree> is being removed from the tree, and, if
+        <ancestors> is True, that the sizes of its ancestors have changed to
+        match.
+
+        Precondition: <subtree> is still part of the tree.
+        """
+        stack = [subtree]
+        while stack:
+            node = stack.pop()
+            if node.is_empty():
+                continue
+            self._nodes -= 1
+            if node._subtrees:
+                stack.extend(node._subtrees)
+            else:
+                self._add_key(node, -1)
+        if ancestors:
+            self._push_ancestors(subtree)
+
+    def refresh(self: AggregateIndex, nodes: Iterable[Any]) -> None:
+        """Record that the sizes of <nodes>, trees with subtrees whose
+        changes were reported with ancestors=False, have changed."""
+        for node in nodes:
+            if not node.is_empty():
+                self._push(node)
+
+    def largest(self: AggregateIndex, k: int,
+                subtrees: bool = False) -> List[Any]:
+        """Return the <k> largest leaves of the tree, or its <k> largest
+        trees with subtrees if <subtrees> is True, largest first."""
+        heap = self._subtrees if subtrees else self._leaves
+        result = []
+        kept = []
+        while heap and len(result) < k:
+            entry = heappop(heap)
+            node = entry[2]
+            if -entry[0] == node.data_size and \
+                    bool(node._subtrees) == subtrees and \
+                    not node.is_empty() and node not in result and \
+                    self._in_tree(node):
+                result.append(node)
+                kept.append(entry)
+        for entry in kept:
+            heappush(heap, entry)
+        return result
+
+    def totals(self: AggregateIndex) -> Dict[object, float]:
+        """Return the total size of the leaves with each key."""
+        return {key: total for key, total in self._totals.items()
+                if self._counts[key]}
+
+    def counts(self: AggregateIndex) -> Dict[object, int]:
+        """Return the number of leaves with each key."""
+        return {key: number for key, number in self._counts.items()
+                if number}
+
+    def _key(self: AggregateIndex, node: Any) -> Optional[object]:
+        """Return the key of the leaf <node>."""
+        if self.key is None:
+            return node.leaf_key()
+        return self.key(node)
+
+    def _add_key(self: AggregateIndex, node: Any, sign: int) -> None:
+        """Add (if <sign> is 1) or subtract (if it is -1) the leaf <node>
+        to or from the totals of its key."""
+        key = self._key(node)
+        if key is not None:
+            self._totals[key] = self._totals.get(key, 0) + \
+                sign * node.data_size
+            self._counts[key] = self._counts.get(key, 0) + sign
+
+    def _add_tree(self: AggregateIndex, tree: Any, heap: bool) -> None:
+        """Add every node of <tree>, pushing their entries onto the heaps if
+        <heap> is True and appending them otherwise."""
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if node.is_empty():
+                continue
+            if heap:
+                self._nodes += 1
+                if not node._subtrees:
+                    self._add_key(node, 1)
+                self._push(node)
+            else:
+                self.observe(node)
+            stack.extend(node._subtrees)
+
+    def _push(self: AggregateIndex, node: Any) -> None:
+        """Push an entry for <node>, with its current size, onto its heap,
+        rebuilding the heaps first if they have grown too large."""
+        if len(self._leaves) + len(self._subtrees) > \
+                REBUILD_FACTOR * self._nodes + REBUILD_SLACK and \
+                self.root is not None:
+            self._rebuild()
+        heappush(self._subtrees if node._subtrees else self._leaves,
+                 (-node.data_size, next(self._sequence), node))
+
+    def _push_ancestors(self: AggregateIndex, node: Any) -> None:
+        """Push an entry for every ancestor of <node>."""
+        node = node._parent_tree
+        while node is not None:
+            self._push(node)
+            node = node._parent_tree
+
+    def _in_tree(self: AggregateIndex, node: Any) -> bool:
+        """Return True if <node> is part of the indexed tree."""
+        while node._parent_tree is not None:
+            node = node._parent_tree
+        return node == self.root
+
+    def _rebuild(self: AggregateIndex) -> None:
+        """Rebuild the heaps, and the node count, from the tree."""
+        self._leaves = []
+        self._subtrees = []
+        self._nodes = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_empty():
+                continue
+            self._nodes += 1
+            entry = (-node.data_size, next(self._sequence), node)
+            if node._subtrees:
+                self._subtrees.append(entry)
+                stack.extend(node._subtrees)
+            else:
+                self._leaves.append(entry)
+        heapify(self._leaves)
+        heapify(self._subtrees)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['heapq', 'itertools']})
@@ -0,0 +1,95 @@
+import os
+import random
+
+import aggregates
+from aggregates import AggregateIndex
+from benchmarks import make_tree
+from tree_data import FileSystemTree
+
+
+def group(node) -> int:
+    """Return the key of the synthetic leaf <node>."""
+    return int(node._root[1:]) % 7
+
+
+def walk(tree) -> tuple:
+    """Return the sizes of the leaves and of the folders of <tree>, largest
+    first, and the total size of its leaves grouped by group()."""
+    leaves, folders, totals = [], [], {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.is_empty():
+            continue
+        if node._subtrees:
+            folders.append(node.data_size)
+            stack.extend(node._subtrees)
+        else:
+            leaves.append(node.data_size)
+            key = group(node)
+            totals[key] = totals.get(key, 0) + node.data_size
+    return sorted(leaves, reverse=True), sorted(folders, reverse=True), \
+        totals
+
+
+def live_leaves(tree) -> list:
+    """Return the live leaves of <tree>."""
+    return [node for node in walk_nodes(tree) if not node._subtrees]
+
+
+def walk_nodes(tree) -> list:
+    """Return the live nodes of <tree>."""
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if not node.is_empty():
+            nodes.append(node)
+            stack.extend(node._subtrees)
+    return nodes
+
+
+def test_index_matches_walk_after_edits(monkeypatch) -> None:
+    monkeypatch.setattr(aggregates, 'REBUILD_SLACK', 0)
+    rnd = random.Random(0)
+    tree = make_tree('balanced', 500)
+    index = AggregateIndex(group)
+    index.attach(tree)
+    for step in range(300):
+        leaf = rnd.choice(live_leaves(tree))
+        choice = rnd.random()
+        if choice < 0.4:
+            leaf.set_size(rnd.randint(0, 10 ** 4))
+        elif choice < 0.7:
+            leaf.adjust_size(rnd.random() < 0.5, rnd.randint(1, 3))
+        elif choice < 0.9:
+            leaf.delete()
+        else:
+            folder = rnd.choice([node for node in walk_nodes(tree)
+                                 if node._subtrees])
+            folder.add_subtree(make_tree('wide', 3, seed=step))
+        leaves, folders, totals = walk(tree)
+        assert [node.data_size for node in tree.largest(20)] == \
+            leaves[:20]
+        assert [node.data_size for node in tree.largest(5, True)] == \
+            folders[:5]
+        assert {key: size for key, size in tree.size_by().items()
+                if index.counts()[key]} == totals
+    assert len(index._leaves) <= 2 * len(walk_nodes(tree))
+
+
+def test_size_by_extension(tmp_path) -> None:
+    for name, size in (('a.log', 10), ('b.LOG', 5), ('c.txt', 3),
+                       ('README', 1)):
+        (tmp_path / name).write_bytes(b'x' * size)
+    os.mkdir(str(tmp_path / 'sub'))
+    (tmp_path / 'sub' / 'd.txt').write_bytes(b'x' * 7)
+    tree = FileSystemTree(str(tmp_path))
+    expected = {'.log': 15, '.txt': 10, '': 1}
+    assert tree.size_by() == expected
+    tree.index_aggregates()
+    assert tree.size_by() == expected
+    assert [leaf._root for leaf in tree.largest(2)] == ['a.log', 'd.txt']
+    tree._subtrees[[sub._root for sub in tree._subtrees].index(
+        'a.log')].delete()
+    assert tree.size_by()['.log'] == 5
@@ -0,0 +1,363 @@
+"""Treemap Benchmarks
+
+=== Module Description ===
+This module times the operations the visualiser depends on, on synthetic
+trees of known shape and size, and writes the timings to a JSON file so that
+two runs can be compared.
+
+Synthetic trees come in three shapes, with leaf sizes drawn uniformly or
+from a Zipfian (heavily skewed) distribution:
+    wide: every leaf is a subtree of the root.
+    deep: the leaves hang off a chain of DEEP_DEPTH nested subtrees.
+    balanced: every internal tree has BALANCED_FANOUT subtrees.
+make_directory_tree builds a similar tree of (sparse) files on disk, for
+timing FileSystemTree.
+
+For each tree, run_benchmarks times construction, a full and an incremental
+generate_treemap, find_rect (building the hit-test index, then queries),
+adjust_size, a batch of resizes through a journal.EditJournal and its undo,
+get_path, a full layout by generate_treemap_parallel (on one
+process per CPU, or --processes), building the index of filters.py,
+switching to a filter matching about half the leaves and laying out the
+filtered view, tree_diff.diff_trees comparing the tree with itself (a full
+merge pass that finds no changes), and, when pygame is installed,
+render_display under the SDL dummy video driver. Each synthetic tree is
+also laid out in full with every layout strategy, recording the mean aspect
+ratio of its rectangles (see layout_strategies.compare_strategies), and its
+memory use per node as an object tree and as a CompactTree is reported (see
+compact_tree.memory_report). The balanced trees, whose
+root has BALANCED_FANOUT large subtrees, show the speedup of the parallel
+layout; it needs as many cores as processes to show it.
+
+Run this module to benchmark from the command line, e.g.
+    python benchmarks.py --leaves 1000 100000 --out results.json
+    python benchmarks.py --compare old.json results.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from tree_data import AbstractTree, FileSystemTree
+from parallel_layout import generate_treemap_parallel
+from journal import EditJournal, RESIZE
+from filters import LeafFilter
+from tree_diff import diff_trees
+from layout_strategies import compare_strategies
+from compact_tree import memory_report
+
+SHAPES = ('wide', 'deep', 'balanced')
+SIZE_DISTRIBUTIONS = ('uniform', 'zipf')
+
+# The number of nested subtrees in a deep tree, and of subtrees per tree in a
+# balanced tree.
+DEEP_DEPTH = 64
+BALANCED_FANOUT = 10
+
+# Leaf sizes: uniform sizes are in 1..UNIFORM_MAX, and the k-th largest Zipf
+# size is ZIPF_MAX / k.
+UNIFORM_MAX = 1000
+ZIPF_MAX = 10 ** 9
+
+RECT = (0, 0, 1024, 738)
+
+
+class SyntheticTree(AbstractTree):
+    """A tree built by the generators in this module."""
+
+    def get_separator(self: SyntheticTree) -> str:
+        """Return the string used to separate nodes in paths."""
+        return '/'
+
+
+def leaf_sizes(count: int, distribution: str = 'uniform',
+               seed: int = 0) -> List[int]:
+    """Return <count> leaf sizes drawn from <distribution>, 'uniform' or
+    'zipf', in random order."""
+    rnd = random.Random(seed)
+    if distribution == 'uniform':
+        return [rnd.randint(1, UNIFORM_MAX) for _ in range(count)]
+    elif distribution == 'zipf':
+        sizes = [max(1, ZIPF_MAX // rank) for rank in range(1, count + 1)]
+        rnd.shuffle(sizes)
+        return sizes
+    raise ValueError('unknown size distribution: {}'.format(distribution))
+
+
+def make_tree(shape: str, leaves: int, distribution: str = 'uniform',
+              seed: int = 0) -> SyntheticTree:
+    """Return a synthetic tree of the given <shape> (one of SHAPES) with
+    <leaves> leaves whose sizes follow <distribution>.
+
+    The tree is built bottom-up, so no shape is limited by the recursion
+    limit.
+    """
+    nodes = [SyntheticTree('f{}'.format(i), [], size) for i, size in
+             enumerate(leaf_sizes(leaves, distribution, seed))]
+    if shape == 'wide':
+        return SyntheticTree('root', nodes)
+    elif shape == 'deep':
+        per_level = -(-len(nodes) // DEEP_DEPTH)
+        node = None
+        for depth in range(DEEP_DEPTH - 1, -1, -1):
+            subtrees = nodes[depth * per_level:(depth + 1) * per_level]
+            if node is not None:
+                subtrees.append(node)
+            node = SyntheticTree('d{}'.format(depth), subtrees)
+        return node
+    elif shape == 'balanced':
+        level = 0
+        while len(nodes) > 1 or level == 0:
+            nodes = [SyntheticTree('n{}_{}'.format(level, i),
+                                   nodes[i:i + BALANCED_FANOUT])
+                     for i in range(0, len(nodes), BALANCED_FANOUT)]
+            level += 1
+        return nodes[0]
+    raise ValueError('unknown tree shape: {}'.format(shape))
+
+
+def make_directory_tree(root: str, files: int, fanout: int = BALANCED_FANOUT,
+                        distribution: str = 'uniform', seed: int = 0) -> None:
+    """Create <files> files under the existing folder <root>, with at most
+    <fanout> files and <fanout> subfolders in each folder.
+
+    The files are sparse, so their sizes (from <distribution>) take no disk
+    space.
+    """
+    digits = 1
+    while fanout ** digits < -(-files // fanout):
+        digits += 1
+    for i, size in enumerate(leaf_sizes(files, distribution, seed)):
+        folder = i // fanout
+        parts = []
+        for _ in range(digits):
+            parts.append('d{}'.format(folder % fanout))
+            folder //= fanout
+        path = os.path.join(root, *reversed(parts))
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'f{}'.format(i)), 'wb') as file:
+            file.truncate(size)
+
+
+def _mean_seconds(function: Callable, args: Sequence) -> float:
+    """Return the mean time taken by calling <function> on each of <args>."""
+    if not args:
+        return 0.0
+    start = time.perf_counter()
+    for arg in args:
+        function(arg)
+    return (time.perf_counter() - start) / len(args)
+
+
+def time_tree(tree: AbstractTree, queries: int = 1000,
+              seed: int = 0, processes: Optional[int] = None) \
+        -> Dict[str, float]:
+    """Return the time, in seconds, of each benchmarked operation on <tree>.
+    The parallel layout uses <processes> processes (one per CPU by default).
+
+    <tree> is laid out and resized, so it is changed by this function.
+    """
+    rnd = random.Random(seed)
+    results = {}
+    start = time.perf_counter()
+    tree.generate_treemap(RECT)
+    results['generate_treemap.full'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree.find_rect((0, 0))
+    results['find_rect.index'] = time.perf_counter() - start
+    points = [(rnd.randrange(RECT[2]), rnd.randrange(RECT[3]))
+              for _ in range(queries)]
+    results['find_rect.query'] = _mean_seconds(tree.find_rect, points)
+
+    leaves = [leaf for leaf in tree._layout_leaves if not leaf._subtrees]
+    sample = [rnd.choice(leaves) for _ in range(queries)] if leaves else []
+    results['get_path'] = _mean_seconds(AbstractTree.get_path, sample)
+    results['adjust_size'] = _mean_seconds(
+        lambda leaf: leaf.adjust_size(True), sample)
+
+    # Per edit, as for adjust_size.
+    journal = EditJournal(tree)
+    edits = [(RESIZE, leaf, rnd.randint(1, UNIFORM_MAX)) for leaf in sample]
+    start = time.perf_counter()
+    journal.apply(edits)
+    results['journal.batch'] = (time.perf_counter() - start) / \
+        max(len(edits), 1)
+    start = time.perf_counter()
+    journal.undo()
+    results['journal.undo'] = (time.perf_counter() - start) / \
+        max(len(edits), 1)
+
+    start = time.perf_counter()
+    tree.generate_treemap(RECT)
+    results['generate_treemap.incremental'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generate_treemap_parallel(tree, RECT, processes=processes)
+    results['generate_treemap.parallel'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree.index_attributes()
+    results['filter.index'] = time.perf_counter() - start
+    sizes = sorted(leaf.data_size for leaf in sample)
+    leaf_filter = LeafFilter(min_size=sizes[len(sizes) // 2] if sizes else 0)
+    start = time.perf_counter()
+    view = tree.filtered(leaf_filter)
+    results['filter.switch'] = time.perf_counter() - start
+    start = time.perf_counter()
+    view.generate_treemap(RECT)
+    results['generate_treemap.filtered'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    diff_trees(tree, tree)
+    results['diff_trees'] = time.perf_counter() - start
+    return results
+
+
+def time_render(tree: AbstractTree, frames: int = 20) \
+        -> Optional[Dict[str, float]]:
+    """Return the time of the first render_display frame of <tree> and the
+    mean time of a frame after adjust_size, or None if pygame is not
+    installed."""
+    try:
+        from treemap_visualiser import measure_render
+    except ImportError:
+        return None
+    first, mean = measure_render(tree, frames)
+    return {'render_display.first': first, 'render_display.frame': mean}
+
+
+def run_benchmarks(leaf_counts: Sequence[int] = (10 ** 3, 10 ** 4, 10 ** 5),
+                   shapes: Sequence[str] = SHAPES,
+                   distributions: Sequence[str] = SIZE_DISTRIBUTIONS,
+                   disk_files: Sequence[int] = (10 ** 3, 10 ** 4),
+                   render: bool = True, queries: int = 1000,
+                   processes: Optional[int] = None) -> Dict:
+    """Run every benchmark and return the results.
+
+    The result is a dictionary with an 'environment' entry describing the
+    machine, a 'results' list and a 'memory' list. Each result has the keys
+    'case' (the shape, or 'disk' for FileSystemTree), 'sizes', 'leaves',
+    'operation' and 'seconds'; the full layout with each strategy, whose
+    operation is 'layout.' followed by the strategy's name, also has the key
+    'mean_aspect_ratio'. Each entry of 'memory' has the keys 'case', 'sizes'
+    and 'leaves' of a synthetic tree and those of memory_report. The
+    parallel layout uses <processes> processes.
+    """
+    results = []
+    memory = []
+
+    def record(case: str, sizes: str, leaves: int,
+               timings: Dict[str, float]) -> None:
+        for operation, seconds in timings.items():
+            results.append({'case': case, 'sizes': sizes, 'leaves': leaves,
+                            'operation': operation, 'seconds': seconds})
+
+    for leaves in leaf_counts:
+        for shape in shapes:
+            for sizes in distributions:
+                start = time.perf_counter()
+                tree = make_tree(shape, leaves, sizes)
+                timings = {'construct': time.perf_counter() - start}
+                # Before time_tree, so that no layout is cached yet.
+                for row in compare_strategies({shape: tree}, RECT):
+                    results.append({
+                        'case': shape, 'sizes': sizes, 'leaves': leaves,
+                        'operation': 'layout.' + row['strategy'],
+                        'seconds': row['seconds'],
+                        'mean_aspect_ratio': row['mean_aspect_ratio']})
+                timings.update(time_tree(tree, queries,
+                                         processes=processes))
+                if render:
+                    timings.update(time_render(tree) or {})
+                record(shape, sizes, leaves, timings)
+                memory.append(dict(case=shape, sizes=sizes, leaves=leaves,
+                                   **memory_report(tree)))
+                del tree
+
+    for files in disk_files:
+        with tempfile.TemporaryDirectory() as root:
+            make_directory_tree(root, files)
+            start = time.perf_counter()
+            tree = FileSystemTree(root)
+            timings = {'construct': time.perf_counter() - start}
+            timings.update(time_tree(tree, queries, processes=processes))
+            record('disk', 'uniform', files, timings)
+
+    return {'environment': {'python': sys.version.split()[0],
+                            'platform': platform.platform(),
+                            'cpus': os.cpu_count(),
+                            'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results, 'memory': memory}
+
+
+def save_results(results: Dict, fname: str) -> None:
+    """Write the output of run_benchmarks to the JSON file <fname>."""
+    with open(fname, 'w') as file:
+        json.dump(results, file, indent=1)
+
+
+def compare_results(old_fname: str, new_fname: str) \
+        -> List[Tuple[Tuple, float, float]]:
+    """Return (key, old seconds, new seconds) for every benchmark found in
+    both of the JSON files <old_fname> and <new_fname>. A key is a
+    (case, sizes, leaves, operation) tuple."""
+    timings = []
+    for fname in (old_fname, new_fname):
+        with open(fname) as file:
+            timings.append({(r['case'], r['sizes'], r['leaves'],
+                             r['operation']): r['seconds']
+                            for r in json.load(file)['results']})
+    old, new = timings
+    return [(key, old[key], new[key]) for key in old if key in new]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmarks, or compare two result files, as described by the
+    command line arguments <argv>."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--leaves', type=int, nargs='+',
+                        default=[10 ** 3, 10 ** 4, 10 ** 5])
+    parser.add_argument('--shapes', nargs='+', default=list(SHAPES),
+                        choices=SHAPES)
+    parser.add_argument('--sizes', nargs='+',
+                        default=list(SIZE_DISTRIBUTIONS),
+                        choices=SIZE_DISTRIBUTIONS)
+    parser.add_argument('--disk-files', type=int, nargs='*',
+                        default=[10 ** 3, 10 ** 4])
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        for key, old, new in compare_results(*args.compare):
+            print('{:<10} {:<8} {:>9} {:<30} {:10.6f} {:10.6f} {:6.2f}x'
+                  .format(*key, old, new, old / new if new else 0.0))
+        return
+    results = run_benchmarks(args.leaves, args.shapes, args.sizes,
+                             args.disk_files, not args.no_render,
+                             processes=args.processes)
+    save_results(results, args.out)
+    for r in results['results']:
+        line = '{case:<10} {sizes:<8} {leaves:>9} {operation:<30} ' \
+            '{seconds:10.6f}'.format(**r)
+        if 'mean_aspect_ratio' in r:
+            line += '  aspect {:.2f}'.format(r['mean_aspect_ratio'])
+        print(line)
+    for r in results['memory']:
+        print('{case:<10} {sizes:<8} {leaves:>9} bytes per node: '
+              '{object_bytes_per_node:.1f} as objects, '
+              '{compact_bytes_per_node:.1f} compact'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import pytest
+
+from benchmarks import BALANCED_FANOUT, DEEP_DEPTH, SHAPES, \
+    compare_results, leaf_sizes, make_directory_tree, make_tree, \
+    run_benchmarks, save_results
+from tree_data import FileSystemTree
+
+
+def depth_and_leaves(tree) -> tuple:
+    """Return the depth of the deepest leaf of <tree> and its leaf
+    sizes, in order."""
+    deepest = 0
+    sizes = []
+    stack = [(tree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node._subtrees:
+            stack.extend((sub, depth + 1) for sub in reversed(node._subtrees))
+        else:
+            deepest = max(deepest, depth)
+            sizes.append(node.data_size)
+    return deepest, sizes
+
+
+def test_make_tree_shapes() -> None:
+    for shape, depth in (('wide', 1), ('deep', DEEP_DEPTH), ('balanced', 4)):
+        tree = make_tree(shape, 1024, seed=3)
+        deepest, sizes = depth_and_leaves(tree)
+        assert deepest == depth
+        assert sorted(sizes) == sorted(leaf_sizes(1024, seed=3))
+        assert tree.data_size == sum(sizes)
+    tree = make_tree('balanced', 1000)
+    assert len(tree._subtrees) == BALANCED_FANOUT
+    with pytest.raises(ValueError):
+        make_tree('round', 10)
+
+
+def test_leaf_sizes() -> None:
+    assert leaf_sizes(500, 'zipf', 1) == leaf_sizes(500, 'zipf', 1)
+    assert leaf_sizes(500, 'uniform', 1) != leaf_sizes(500, 'uniform', 2)
+    zipf = sorted(leaf_sizes(100, 'zipf'), reverse=True)
+    assert zipf[0] == 100 * zipf[99]
+    with pytest.raises(ValueError):
+        leaf_sizes(10, 'normal')
+
+
+def test_make_directory_tree(tmp_path) -> None:
+    make_directory_tree(str(tmp_path), 250)
+    tree = FileSystemTree(str(tmp_path))
+    assert tree.scan_stats.files == 250
+    assert tree.data_size == sum(leaf_sizes(250))
+
+
+def test_run_and_compare(tmp_path) -> None:
+    results = run_benchmarks((200,), SHAPES[:1], ('uniform',), (30,),
+                             render=False, queries=10, processes=1)
+    cases = {(r['case'], r['leaves']) for r in results['results']}
+    assert cases == {('wide', 200), ('disk', 30)}
+    operations = {r['operation'] for r in results['results']}
+    assert 'construct' in operations and len(operations) > 5
+    ratios = {r['operation']: r['mean_aspect_ratio']
+              for r in results['results'] if 'mean_aspect_ratio' in r}
+    assert set(ratios) == {'layout.slice-and-dice', 'layout.squarified'}
+    assert 1 <= ratios['layout.squarified'] < ratios['layout.slice-and-dice']
+    memory, = results['memory']
+    assert (memory['case'], memory['leaves'], memory['nodes']) == \
+        ('wide', 200, 201)
+    assert 0 < memory['compact_bytes_per_node'] < \
+        memory['object_bytes_per_node']
+    fname = str(tmp_path / 'results.json')
+    save_results(results, fname)
+    compared = compare_results(fname, fname)
+    assert len(compared) == len(results['results'])
+    assert all(old == new for _, old, new in compared)
@@ -0,0 +1,617 @@
+"""Compact, Array-Backed Trees
+
+=== Module Description ===
+This module contains CompactTree, an AbstractTree whose hierarchy is stored
+in parallel typed arrays instead of one Python object per node.
+
+A CompactStore holds, for every node index:
+
+    parent        int32     index of the parent node, -1 for the root
+    first_child   int32     index of the first child, -1 for none
+    next_sibling  int32     index of the next sibling, -1 for none
+    size          float64   data_size
+    name_start    uint64    offset of the node's name in the name blob
+    name_len      uint16    length of the node's name in bytes
+    colour        uint32    packed 0xRRGGBB colour
+    dirty         uint8     the _dirty flag used by incremental layout
+
+plus the layout bookkeeping of each node (see AbstractTree._placed), which is
+only allocated once the tree is first laid out, and the attributes that
+AbstractTree only sets on a few nodes (the layout of a tree that was laid
+out, the indexes of a root), kept by node index.
+
+A CompactTree is a lightweight view of one node index of a store. Views are
+created on demand (for example by _subtrees) and compare equal when they
+refer to the same node, so generate_treemap, find_rect, get_path,
+adjust_size and the visualiser work with them unchanged.
+
+Use memory_report to compare the memory used per node against the object
+tree representation.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import weakref
+from array import array
+from random import getrandbits
+from typing import Dict, List, Optional, Tuple
+
+from scanner import DEFAULT_WORKERS, Listing, Scanner
+from tree_data import AbstractTree
+
+_NO_NODE = -1
+_DELETED = 0xFFFFFFFFFFFFFFFF
+# The longest name, in bytes, that fits in the name_len column.
+_MAX_NAME_LEN = 0xFFFF
+
+
+def _encode_name(name: str) -> bytes:
+    """Return <name> as it is stored in the name blob.
+
+    Raise ValueError if it is too long for the name_len column.
+    """
+    encoded = name.encode('utf-8', 'surrogateescape')
+    if len(encoded) > _MAX_NAME_LEN:
+        raise ValueError('name of {} bytes is longer than {}'.format(
+            len(encoded), _MAX_NAME_LEN))
+    return encoded
+
+
+class CompactStore:
+    """The parallel arrays holding every node of a compact tree.
+
+    === Public Attributes ===
+    separator: the separator returned by get_separator for every node.
+    parent, first_child, next_sibling, size, name_start, name_len, colour,
+    dirty: the per-node arrays described in the module docstring.
+    names: the name blob.
+    node_state: the values of the attributes kept for the views of each
+        node (see _NodeState), by node index.
+
+    === Private Attributes ===
+    _last_child: the index of the last child of each node, used while the
+        store is being built and when subtrees are added.
+    _placed_pass, _placed_x, _placed_y, _placed_w, _placed_h, _placed_at,
+    _placed_count, _placed_source: the fields of each node's _placed tuple,
+        or None if no node has been laid out yet. The passes are stored as
+        integer keys, and 0 stands for None.
+    _pass_keys: the key of each layout pass that laid out a node.
+    _passes: the layout pass for each key. Keys are never reused, so a key
+        whose pass no longer exists maps to nothing.
+    _next_key: the key of the next pass to be added.
+    """
+    separator: str
+    parent: array
+    first_child: array
+    next_sibling: array
+    size: array
+    name_start: array
+    name_len: array
+    colour: array
+    dirty: array
+    names: bytearray
+    node_state: Dict[int, Dict[str, object]]
+    _last_child: array
+    _placed_pass: Optional[array]
+    _pass_keys: weakref.WeakKeyDictionary
+    _passes: weakref.WeakValueDictionary
+    _next_key: int
+
+    def __init__(self: CompactStore, separator: str = ' -> ') -> None:
+        """Initialize an empty store."""
+        self.separator = separator
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.size = array('d')
+        self.name_start = array('Q')
+        self.name_len = array('H')
+        self.colour = array('I')
+        self.dirty = array('B')
+        self.names = bytearray()
+        self.node_state = {}
+        self._last_child = array('i')
+        self._placed_pass = None
+        self._placed_x = self._placed_y = None
+        self._placed_w = self._placed_h = None
+        self._placed_at = self._placed_count = None
+        self._placed_source = None
+        self._pass_keys = weakref.WeakKeyDictionary()
+        self._passes = weakref.WeakValueDictionary()
+        self._next_key = 1
+
+    def __len__(self: CompactStore) -> int:
+        return len(self.parent)
+
+    def add_node(self: CompactStore, parent: int, name: str,
+                 size: float = 0) -> int:
+        """Add a node called <name> as the last child of the node at index
+        <parent> (or as a root if <parent> is -1), and return its index.
+
+        The sizes of its ancestors are not updated; see finish_sizes. Raise
+        ValueError if <name> is longer than 65535 bytes.
+        """
+        index = len(self.parent)
+        encoded = _encode_name(name)
+        self.parent.append(parent)
+        self.first_child.append(_NO_NODE)
+        self.next_sibling.append(_NO_NODE)
+        self.size.append(size)
+        self.name_start.append(len(self.names))
+        self.name_len.append(len(encoded))
+        self.colour.append(getrandbits(24))
+        self.dirty.append(0)
+        self._last_child.append(_NO_NODE)
+        self.names += encoded
+        if self._placed_pass is not None:
+            for column in self._placed_columns():
+                column.append(0)
+        if parent != _NO_NODE:
+            last = self._last_child[parent]
+            if last == _NO_NODE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self._last_child[parent] = index
+        return index
+
+    def finish_sizes(self: CompactStore, start: int = 0) -> None:
+        """Add the size of every node from index <start> onwards to its
+        parent's size.
+
+        Every node comes after its parent in the store, so one backwards
+        pass computes the size of every directory from its children.
+        """
+        parent = self.parent
+        size = self.size
+        for index in range(len(parent) - 1, start - 1, -1):
+            if parent[index] != _NO_NODE:
+                size[parent[index]] += size[index]
+
+    def name(self: CompactStore, index: int) -> Optional[str]:
+        """Return the name of the node at <index>, or None if it is deleted.
+        """
+        start = self.name_start[index]
+        if start == _DELETED:
+            return None
+        return self.names[start:start + self.name_len[index]].decode(
+            'utf-8', 'surrogateescape')
+
+    def children(self: CompactStore, index: int) -> List[int]:
+        """Return the indices of the children of the node at <index>."""
+        result = []
+        child = self.first_child[index]
+        while child != _NO_NODE:
+            result.append(child)
+            child = self.next_sibling[child]
+        return result
+
+    def unlink(self: CompactStore, index: int) -> None:
+        """Remove the node at <index> from its parent's children."""
+        parent = self.parent[index]
+        if parent == _NO_NODE:
+            return
+        previous = _NO_NODE
+        child = self.first_child[parent]
+        while child != index:
+            previous = child
+            child = self.next_sibling[child]
+        if previous == _NO_NODE:
+            self.first_child[parent] = self.next_sibling[index]
+        else:
+            self.next_sibling[previous] = self.next_sibling[index]
+        if self._last_child[parent] == index:
+            self._last_child[parent] = previous
+        self.parent[index] = _NO_NODE
+        self.next_sibling[index] = _NO_NODE
+
+    def link(self: CompactStore, index: int, parent: int,
+             after: int = _NO_NODE) -> None:
+        """Make the node at <index>, which has no parent, a child of the node
+        at <parent>, right after its child <after>, or as its first child if
+        <after> is -1."""
+        self.parent[index] = parent
+        if after == _NO_NODE:
+            self.next_sibling[index] = self.first_child[parent]
+            self.first_child[parent] = index
+        else:
+            self.next_sibling[index] = self.next_sibling[after]
+            self.next_sibling[after] = index
+        if self.next_sibling[index] == _NO_NODE:
+            self._last_child[parent] = index
+
+    def _placed_columns(self: CompactStore) -> Tuple[array, ...]:
+        """Return the arrays holding the _placed tuple of each node."""
+        return (self._placed_pass, self._placed_x, self._placed_y,
+                self._placed_w, self._placed_h, self._placed_at,
+                self._placed_count, self._placed_source)
+
+    def get_placed(self: CompactStore, index: int) -> tuple:
+        """Return the _placed tuple of the node at <index>."""
+        if self._placed_pass is None:
+            return AbstractTree._placed
+        layout = self._passes.get(self._placed_pass[index])
+        if layout is None:
+            return AbstractTree._placed
+        return (layout, (self._placed_x[index], self._placed_y[index],
+                         self._placed_w[index], self._placed_h[index]),
+                self._placed_at[index], self._placed_count[index],
+                self._passes.get(self._placed_source[index]))
+
+    def set_placed(self: CompactStore, index: int, placed: tuple) -> None:
+        """Set the _placed tuple of the node at <index>."""
+        if self._placed_pass is None:
+            n = len(self.parent)
+            self._placed_pass = array('i', bytes(4 * n))
+            self._placed_x = array('i', bytes(4 * n))
+            self._placed_y = array('i', bytes(4 * n))
+            self._placed_w = array('i', bytes(4 * n))
+            self._placed_h = array('i', bytes(4 * n))
+            self._placed_at = array('i', bytes(4 * n))
+            self._placed_count = array('i', bytes(4 * n))
+            self._placed_source = array('i', bytes(4 * n))
+        layout, rect, at, count, source = placed
+        self._placed_pass[index] = self._pass_key(layout)
+        (self._placed_x[index], self._placed_y[index], self._placed_w[index],
+         self._placed_h[index]) = rect
+        self._placed_at[index] = at
+        self._placed_count[index] = count
+        self._placed_source[index] = self._pass_key(source)
+
+    def _pass_key(self: CompactStore, layout: Optional[object]) -> int:
+        """Return the key of the layout pass <layout>, or 0 if it is None.
+        """
+        if layout is None:
+            return 0
+        key = self._pass_keys.get(layout)
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+            self._pass_keys[layout] = key
+            self._passes[key] = layout
+        return key
+
+    def nbytes(self: CompactStore) -> int:
+        """Return the number of bytes used by the arrays of this store."""
+        columns = [self.parent, self.first_child, self.next_sibling,
+                   self.size, self.name_start, self.name_len, self.colour,
+                   self.dirty, self._last_child]
+        if self._placed_pass is not None:
+            columns.extend(self._placed_columns())
+        total = len(self.names)
+        for column in columns:
+            total += column.itemsize * len(column)
+        return total
+
+
+class _NodeState:
+    """An attribute that AbstractTree only sets on a few nodes, such as the
+    layout of a tree that was laid out or the indexes of a root, kept in
+    the node_state of a CompactTree's store, so that every view of a node
+    sees the same value.
+
+    === Private Attributes ===
+    _name: the name of the attribute.
+    """
+    _name: str
+
+    def __set_name__(self: _NodeState, owner: type, name: str) -> None:
+        self._name = name
+
+    def __get__(self: _NodeState, view: Optional[CompactTree],
+                owner: type) -> object:
+        if view is None:
+            return self
+        state = view._store.node_state.get(view._index)
+        if state is None or self._name not in state:
+            return getattr(AbstractTree, self._name)
+        return state[self._name]
+
+    def __set__(self: _NodeState, view: CompactTree, value: object) -> None:
+        view._store.node_state.setdefault(view._index, {})[self._name] = \
+            value
+
+
+class CompactTree(AbstractTree):
+    """A view of one node of a CompactStore, usable as an AbstractTree.
+
+    === Private Attributes ===
+    _store: the store holding the node.
+    _index: the index of the node in the store.
+    """
+    _store: CompactStore
+    _index: int
+    _layout_bounds = _NodeState()
+    _layout_pass = _NodeState()
+    _layout_output = _NodeState()
+    _layout_leaves = _NodeState()
+    _hit_index = _NodeState()
+    _aggregates = _NodeState()
+    _attributes = _NodeState()
+
+    def __init__(self: CompactTree, store: CompactStore,
+                 index: int = 0) -> None:
+        """Initialize a view of the node at <index> of <store>.
+
+        Unlike other AbstractTrees, creating a view does not create a node.
+        """
+        self._store = store
+        self._index = index
+
+    def __eq__(self: CompactTree, other: object) -> bool:
+        return isinstance(other, CompactTree) and \
+            self._store is other._store and self._index == other._index
+
+    def __hash__(self: CompactTree) -> int:
+        return hash((id(self._store), self._index))
+
+    @classmethod
+    def from_tree(cls, tree: AbstractTree,
+                  separator: Optional[str] = None) -> CompactTree:
+        """Return a compact copy of the non-empty nodes of <tree>.
+
+        The separator of <tree> is used unless <separator> is given.
+        """
+        if separator is None:
+            separator = tree.get_separator()
+        store = CompactStore(separator)
+        queue = [(tree, _NO_NODE)]
+        i = 0
+        while i < len(queue):
+            node, parent = queue[i]
+            index = store.add_node(parent, str(node._root),
+                                   node.data_size if not node._subtrees
+                                   else 0)
+            r, g, b = node.colour
+            store.colour[index] = (r << 16) | (g << 8) | b
+            for sub in node._subtrees:
+                if not sub.is_empty():
+                    queue.append((sub, index))
+            queue[i] = None
+            i += 1
+        store.finish_sizes()
+        return cls(store, 0)
+
+    @classmethod
+    def from_path(cls, path: str,
+                  workers: int = DEFAULT_WORKERS) -> CompactTree:
+        """Return a compact tree of the files and folders in <path>, built
+        without creating a Python object per file.
+
+        Precondition: <path> is a valid path to a folder on this computer.
+        """
+        store = CompactStore(' -> ')
+        scanner = _CompactScanner(store, workers)
+        store.add_node(_NO_NODE, os.path.basename(path))
+        scanner.pending[path] = 0
+        scanner.walk(path)
+        store.finish_sizes()
+        return cls(store, 0)
+
+    @property
+    def data_size(self: CompactTree) -> float:
+        """The data_size of this node."""
+        return self._store.size[self._index]
+
+    @data_size.setter
+    def data_size(self: CompactTree, value: float) -> None:
+        self._store.size[self._index] = value
+
+    @property
+    def colour(self: CompactTree) -> Tuple[int, int, int]:
+        """The colour of this node."""
+        packed = self._store.colour[self._index]
+        return (packed >> 16) & 255, (packed >> 8) & 255, packed & 255
+
+    @colour.setter
+    def colour(self: CompactTree, value: Tuple[int, int, int]) -> None:
+        r, g, b = value
+        self._store.colour[self._index] = (r << 16) | (g << 8) | b
+
+    @property
+    def _root(self: CompactTree) -> Optional[str]:
+        """The name of this node, or None if it is deleted."""
+        return self._store.name(self._index)
+
+    @_root.setter
+    def _root(self: CompactTree, value: Optional[object]) -> None:
+        store = self._store
+        if value is None:
+            store.name_start[self._index] = _DELETED
+            return
+        encoded = _encode_name(str(value))
+        store.name_start[self._index] = len(store.names)
+        store.name_len[self._index] = len(encoded)
+        store.names += encoded
+
+    @property
+    def _subtrees(self: CompactTree) -> List[CompactTree]:
+        """Views of the children of this node.
+
+        The list is created on every access; use add_subtree and
+        remove_subtree to change the children. Assigning a list of views of
+        nodes of this store that have no parent makes those nodes the
+        children of this node, in order, in place of its current children.
+        """
+        store = self._store
+        return [CompactTree(store, child)
+                for child in store.children(self._index)]
+
+    @_subtrees.setter
+    def _subtrees(self: CompactTree, value: List[CompactTree]) -> None:
+        store = self._store
+        for child in store.children(self._index):
+            store.unlink(child)
+        previous = _NO_NODE
+        for subtree in value:
+            store.link(subtree._index, self._index, previous)
+            previous = subtree._index
+
+    @property
+    def _parent_tree(self: CompactTree) -> Optional[CompactTree]:
+        """A view of the parent of this node, or None."""
+        parent = self._store.parent[self._index]
+        if parent == _NO_NODE:
+            return None
+        return CompactTree(self._store, parent)
+
+    @property
+    def _dirty(self: CompactTree) -> bool:
+        """The _dirty flag of this node."""
+        return bool(self._store.dirty[self._index])
+
+    @_dirty.setter
+    def _dirty(self: CompactTree, value: bool) -> None:
+        self._store.dirty[self._index] = 1 if value else 0
+
+    @property
+    def _placed(self: CompactTree) -> tuple:
+        """The _placed tuple of this node."""
+        return self._store.get_placed(self._index)
+
+    @_placed.setter
+    def _placed(self: CompactTree, value: tuple) -> None:
+        self._store.set_placed(self._index, value)
+
+    def get_separator(self: CompactTree) -> str:
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf.
+        """
+        return self._store.separator
+
+    def add_subtree(self: CompactTree, subtree: AbstractTree) \
+            -> CompactTree:
+        """Add a copy of <subtree> as the last subtree of this tree, update
+        the sizes of this tree and its ancestors to match, and return the
+        view of the copy.
+
+        Unlike AbstractTree.add_subtree, the nodes of <subtree> are copied
+        into the store, so later edits must be made through the returned
+        view, not through <subtree>.
+        """
+        store = self._store
+        start = len(store)
+        queue = [(subtree, self._index)]
+        i = 0
+        while i < len(queue):
+            node, parent = queue[i]
+            index = store.add_node(parent, str(node._root),
+                                   node.data_size if not node._subtrees
+                                   else 0)
+            r, g, b = node.colour
+            store.colour[index] = (r << 16) | (g << 8) | b
+            queue.extend((sub, index) for sub in node._subtrees
+                         if not sub.is_empty())
+            i += 1
+        # Sizes of the copied nodes only, then the ancestors of the copy.
+        for index in range(len(store) - 1, start, -1):
+            store.size[store.parent[index]] += store.size[index]
+        x = self
+        while x:
+            x.data_size += store.size[start]
+            x = x._parent_tree
+        self.invalidate_layout()
+        copy = CompactTree(store, start)
+        index = self._aggregate_index()
+        if index is not None:
+            index.added(copy)
+        return copy
+
+    def remove_subtree(self: CompactTree, subtree: CompactTree) -> None:
+        """Remove <subtree> from the subtrees of this tree, and update the
+        sizes of this tree and its ancestors to match.
+
+        Precondition: <subtree> is a subtree of this tree.
+        """
+        subtree.del_update_parents()
+        self._store.unlink(subtree._index)
+        self.invalidate_layout()
+
+    def _bury(self: CompactTree, subtree: CompactTree) -> None:
+        """Record that <subtree>, one of the subtrees of this tree, has just
+        been deleted. Unlinking a node is cheap, so it is unlinked at once
+        rather than left as a tombstone."""
+        self._store.unlink(subtree._index)
+
+    def _unbury(self: CompactTree, subtree: CompactTree,
+                siblings: List[CompactTree], tombstones: int) -> None:
+        """Link <subtree>, which _bury unlinked from this tree, back in
+        after the subtree it followed in <siblings>, the subtrees of this
+        tree just before it was unlinked. There are no tombstones, so
+        <tombstones> is ignored.
+
+        Precondition: every change made to the subtrees of this tree since
+        then has been undone.
+        """
+        position = siblings.index(subtree)
+        after = siblings[position - 1]._index if position else _NO_NODE
+        self._store.link(subtree._index, self._index, after)
+
+
+class _CompactScanner(Scanner):
+    """A Scanner that adds every listed entry straight to a CompactStore,
+    instead of keeping the listings.
+
+    === Public Attributes ===
+    store: the store being filled.
+    pending: the store index of every directory still to be listed.
+    """
+    store: CompactStore
+    pending: Dict[str, int]
+
+    def __init__(self: _CompactScanner, store: CompactStore,
+                 workers: int = DEFAULT_WORKERS) -> None:
+        """Initialize a scanner that fills <store>."""
+        Scanner.__init__(self, workers)
+        self.store = store
+        self.pending = {}
+
+    def _record(self: _CompactScanner, path: str, listing: Listing,
+                queue: List[str]) -> None:
+        """Add the entries of the directory <path> to the store, and add its
+        subdirectories to <queue>.
+        """
+        parent = self.pending.pop(path)
+        self.stats.dirs += 1
+        add_node = self.store.add_node
+        for name, is_dir, size, _ in listing[1]:
+            index = add_node(parent, name, size)
+            if is_dir:
+                subdir = os.path.join(path, name)
+                self.pending[subdir] = index
+                queue.append(subdir)
+            else:
+                self.stats.files += 1
+
+
+def object_tree_bytes(tree: AbstractTree) -> int:
+    """Return an estimate of the bytes used by the nodes of the object tree
+    <tree>: each node, its attribute dictionary, colour tuple, subtree list,
+    name and size.
+    """
+    total = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        total += sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+        total += sys.getsizeof(node.colour) + sys.getsizeof(node._subtrees)
+        total += sys.getsizeof(node._root) + sys.getsizeof(node.data_size)
+        stack.extend(node._subtrees)
+    return total
+
+
+def memory_report(tree: AbstractTree) -> Dict[str, float]:
+    """Return the memory used per node by <tree> as an object tree and as a
+    CompactTree.
+
+    The returned dictionary has the keys 'nodes', 'object_bytes_per_node'
+    and 'compact_bytes_per_node'.
+    """
+    compact = CompactTree.from_tree(tree)
+    nodes = len(compact._store)
+    return {
+        'nodes': nodes,
+        'object_bytes_per_node': object_tree_bytes(tree) / nodes,
+        'compact_bytes_per_node': compact._store.nbytes() / nodes,
+    }
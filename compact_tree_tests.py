@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from aggregates import AggregateIndex
+from benchmarks import RECT, make_tree
+from compact_tree import CompactTree, memory_report
+from tree_data import FileSystemTree
+
+
+def shape(tree) -> list:
+    """Return the names and sizes of <tree> in preorder."""
+    rows = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        rows.append((node._root, float(node.data_size)))
+        stack.extend(reversed(node._subtrees))
+    return rows
+
+
+def test_from_tree_same_layout() -> None:
+    tree = make_tree('balanced', 2000)
+    compact = CompactTree.from_tree(tree)
+    assert shape(compact) == shape(tree)
+    assert compact.generate_treemap(RECT) == tree.generate_treemap(RECT)
+    assert compact.get_separator() == tree.get_separator()
+
+
+def test_state_shared_between_views() -> None:
+    compact = CompactTree.from_tree(make_tree('balanced', 1000))
+    output = compact.generate_treemap(RECT)
+    view = CompactTree(compact._store, 0)
+    assert view._layout_output == compact._layout_output
+    (x, y, _, _), _ = output[10]
+    assert view.find_rect((x, y)) == compact.find_rect((x, y))
+
+    compact.index_aggregates()
+    leaf = view.largest(1000)[-1]
+    CompactTree(compact._store, leaf._index).set_size(10 ** 6)
+    assert CompactTree(compact._store, 0).largest(1) == [leaf]
+    assert compact.data_size == sum(sub.data_size
+                                    for sub in compact._subtrees)
+
+
+def test_incremental_layout_after_edit() -> None:
+    compact = CompactTree.from_tree(make_tree('balanced', 1000))
+    compact.generate_treemap(RECT)
+    leaf = compact._subtrees[3]._subtrees[2]._subtrees[1]
+    leaf.set_size(5000)
+    leaf = compact._subtrees[7]._subtrees[0]._subtrees[4]
+    leaf.delete()
+    expected = CompactTree.from_tree(compact).generate_treemap(RECT)
+    assert compact.generate_treemap(RECT) == expected
+
+
+def test_from_path_matches_scan(tmp_path) -> None:
+    for i in range(3):
+        folder = tmp_path / 'd{}'.format(i)
+        folder.mkdir()
+        for j in range(4):
+            (folder / 'f{}'.format(j)).write_bytes(b'x' * (i * 10 + j))
+    path = str(tmp_path)
+    compact = CompactTree.from_path(path)
+    tree = FileSystemTree(path)
+    assert sorted(shape(compact)) == sorted(shape(tree))
+    assert compact._root == os.path.basename(path)
+
+
+def test_memory_report() -> None:
+    report = memory_report(make_tree('balanced', 2000))
+    assert report['nodes'] == 2223
+    assert report['compact_bytes_per_node'] < \
+        report['object_bytes_per_node']
+
+
+def test_add_subtree_returns_indexed_copy() -> None:
+    compact = CompactTree.from_tree(make_tree('balanced', 500))
+    AggregateIndex(lambda leaf: 'k').attach(compact)
+    folder = compact._subtrees[2]
+    size = compact.data_size
+    added = make_tree('wide', 20, seed=5)
+    copy = folder.add_subtree(added)
+    assert copy._parent_tree == folder
+    assert shape(copy) == shape(added)
+    assert compact.data_size == size + added.data_size
+
+    leaf = copy._subtrees[0]
+    leaf.set_size(10 ** 6)
+    assert compact.largest(1) == [leaf]
+    assert copy.largest(1) == [leaf]
+    assert folder in compact.largest(3, True)
+    assert compact.data_size == size + added.data_size - \
+        added._subtrees[0].data_size + 10 ** 6
+    assert compact.size_by() == {'k': compact.data_size}
+    assert compact.generate_treemap(RECT) == \
+        CompactTree.from_tree(compact).generate_treemap(RECT)
+
+
+def test_long_names_rejected() -> None:
+    compact = CompactTree.from_tree(make_tree('balanced', 50))
+    leaf = compact._subtrees[0]._subtrees[0]
+    with pytest.raises(ValueError):
+        leaf._root = 'x' * 65536
+    leaf._root = 'x' * 65535
+    assert leaf._root == 'x' * 65535
+    with pytest.raises(ValueError):
+        compact._store.add_node(0, 'é' * 40000)
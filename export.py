@@ -0,0 +1,141 @@
+"""Headless Treemap Export
+
+=== Module Description ===
+This module writes treemaps to image files without opening a window, so
+that treemaps can be produced in batch jobs on machines with no display.
+
+write_svg streams one <rect> element per treemap rectangle straight to the
+file as AbstractTree.iter_treemap produces it; the list returned by
+generate_treemap is never built. write_png draws the same rectangles, again
+one at a time, to an off-screen pygame surface and saves it. pygame is only
+imported by write_png, so SVG export works where pygame is not installed.
+
+export_batch exports many trees in parallel across a process pool. A job can
+name a folder instead of a tree, in which case the folder is scanned in the
+worker process, and no tree has to be sent between processes.
+"""
+
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from tree_data import AbstractTree, FileSystemTree
+from layout_strategies import LayoutStrategy
+
+# The default size of exported treemaps, in pixels.
+WIDTH = 1024
+HEIGHT = 768
+
+# How many <rect> elements are buffered before they are written out.
+_SVG_CHUNK = 4096
+
+
+def write_svg(tree: AbstractTree, fname: str, size: Tuple[int, int] =
+              (WIDTH, HEIGHT), strategy: Optional[LayoutStrategy] = None,
+              min_area: int = 0) -> int:
+    """Write the treemap of <tree>, <size> pixels wide and high, to the SVG
+    file <fname>, and return the number of rectangles written.
+
+    <strategy> and <min_area> are as in AbstractTree.generate_treemap.
+    """
+    width, height = size
+    count = 0
+    with open(fname, 'w', encoding='utf-8') as file:
+        file.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0}" '
+                   'height="{1}" viewBox="0 0 {0} {1}" '
+                   'shape-rendering="crispEdges">\n'.format(width, height))
+        file.write('<rect width="100%" height="100%" fill="#000000"/>\n')
+        chunk = []
+        for (x, y, w, h), (r, g, b) in tree.iter_treemap(
+                (0, 0, width, height), strategy, min_area):
+            chunk.append('<rect x="{}" y="{}" width="{}" height="{}" '
+                         'fill="#{:02x}{:02x}{:02x}"/>\n'.format(
+                             x, y, w, h, r, g, b))
+            if len(chunk) == _SVG_CHUNK:
+                file.writelines(chunk)
+                count += len(chunk)
+                chunk = []
+        file.writelines(chunk)
+        count += len(chunk)
+        file.write('</svg>\n')
+    return count
+
+
+def write_png(tree: AbstractTree, fname: str, size: Tuple[int, int] =
+              (WIDTH, HEIGHT), strategy: Optional[LayoutStrategy] = None,
+              min_area: int = 0) -> int:
+    """Write the treemap of <tree>, <size> pixels wide and high, to the PNG
+    file <fname>, and return the number of rectangles drawn.
+
+    The treemap is drawn to an off-screen surface, so no display is needed.
+    <strategy> and <min_area> are as in AbstractTree.generate_treemap.
+    """
+    import pygame
+
+    width, height = size
+    surface = pygame.Surface((width, height))
+    surface.fill((0, 0, 0))
+    count = 0
+    for rect, colour in tree.iter_treemap((0, 0, width, height), strategy,
+                                          min_area):
+        pygame.draw.rect(surface, colour, rect)
+        count += 1
+    pygame.image.save(surface, fname)
+    return count
+
+
+def export_treemap(tree: AbstractTree, fname: str, size: Tuple[int, int] =
+                   (WIDTH, HEIGHT), strategy: Optional[LayoutStrategy] = None,
+                   min_area: int = 0) -> int:
+    """Write the treemap of <tree> to <fname> with write_svg if its name
+    ends in .svg, and with write_png otherwise. Return the number of
+    rectangles written."""
+    if fname.lower().endswith('.svg'):
+        return write_svg(tree, fname, size, strategy, min_area)
+    return write_png(tree, fname, size, strategy, min_area)
+
+
+def export_batch(jobs: Sequence[Tuple[Union[AbstractTree, str], str]],
+                 processes: Optional[int] = None,
+                 size: Tuple[int, int] = (WIDTH, HEIGHT),
+                 strategy: Optional[LayoutStrategy] = None,
+                 min_area: int = 0) -> List[Dict]:
+    """Export every (source, fname) pair in <jobs> with export_treemap, on a
+    pool of <processes> worker processes (one per CPU by default).
+
+    A source is either a tree, which is pickled and sent to a worker, or the
+    path of a file or folder, which the worker scans into a FileSystemTree.
+
+    Return one result per job, in order: a dictionary with the keys
+    'fname', 'rectangles' and 'seconds' (the time the worker spent on the
+    job, including any scan).
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(_export_job, source, fname, size, strategy,
+                               min_area)
+                   for source, fname in jobs]
+        return [future.result() for future in futures]
+
+
+def _export_job(source: Union[AbstractTree, str], fname: str,
+                size: Tuple[int, int], strategy: Optional[LayoutStrategy],
+                min_area: int) -> Dict:
+    """Run a single job of export_batch in a worker process."""
+    start = time.perf_counter()
+    if isinstance(source, str):
+        source = FileSystemTree(os.path.abspath(source))
+    count = export_treemap(source, fname, size, strategy, min_area)
+    return {'fname': fname, 'rectangles': count,
+            'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'time', 'concurrent.futures', 'pygame',
+                              'tree_data', 'layout_strategies'],
+            'generated-members': 'pygame.*'})
@@ -0,0 +1,61 @@
+import xml.etree.ElementTree as ElementTree
+
+import pygame
+
+from benchmarks import make_tree
+from export import export_batch, export_treemap, write_png, write_svg
+from layout_strategies import SQUARIFIED
+
+SIZE = (400, 300)
+
+
+def svg_rects(fname: str) -> list:
+    """Return the rectangles and colours of the treemap in the SVG file
+    <fname>, without the background."""
+    root = ElementTree.parse(fname).getroot()
+    rects = []
+    for element in list(root)[1:]:
+        fill = element.get('fill')
+        rects.append(((int(element.get('x')), int(element.get('y')),
+                       int(element.get('width')),
+                       int(element.get('height'))),
+                      tuple(int(fill[i:i + 2], 16) for i in (1, 3, 5))))
+    return rects
+
+
+def test_svg_matches_generate_treemap(tmp_path) -> None:
+    tree = make_tree('balanced', 5000)
+    for strategy, min_area in ((None, 0), (SQUARIFIED, 9)):
+        fname = str(tmp_path / 'tree.svg')
+        expected = tree.generate_treemap((0, 0) + SIZE, strategy, min_area)
+        assert write_svg(tree, fname, SIZE, strategy, min_area) == \
+            len(expected)
+        assert svg_rects(fname) == expected
+
+
+def test_png_pixels(tmp_path) -> None:
+    tree = make_tree('wide', 20)
+    fname = str(tmp_path / 'tree.png')
+    assert export_treemap(tree, fname, SIZE, SQUARIFIED) == 20
+    image = pygame.image.load(fname)
+    assert image.get_size() == SIZE
+    for (x, y, w, h), colour in tree.generate_treemap((0, 0) + SIZE,
+                                                      SQUARIFIED):
+        if w > 2 and h > 2:
+            assert tuple(image.get_at((x + w // 2, y + h // 2)))[:3] == \
+                colour
+    assert write_png(make_tree('wide', 1), fname, (10, 10)) == 1
+
+
+def test_export_batch(tmp_path) -> None:
+    folder = tmp_path / 'folder'
+    folder.mkdir()
+    for i in range(5):
+        (folder / str(i)).write_bytes(b'x' * (i + 1))
+    jobs = [(make_tree('balanced', 300), str(tmp_path / 'a.svg')),
+            (str(folder), str(tmp_path / 'b.png'))]
+    results = export_batch(jobs, processes=2, size=SIZE)
+    assert [result['fname'] for result in results] == \
+        [fname for _, fname in jobs]
+    assert [result['rectangles'] for result in results] == [300, 5]
+    assert len(svg_rects(str(tmp_path / 'a.svg'))) == 300
@@ -0,0 +1,409 @@
+"""Filtered Views
+
+=== Module Description ===
+This module shows a tree with only the leaves that match a LeafFilter (for
+example, only the files of 100 MB or more, only the .log files, or only the
+files not modified for a year) without copying or changing the tree.
+
+AttributeIndex numbers the live nodes of a tree in preorder, so that the
+nodes of every subtree have consecutive numbers, and records where each
+subtree's numbers end. It also indexes the leaves by the attributes that
+filters test: by leaf_key (for files, the extension), by data_size and by
+leaf_time (for files, the modification time recorded by the scan).
+AbstractTree.index_attributes builds the index, e.g. at the end of a
+ProgressiveScan, so that the first filter does not wait for it.
+
+Applying a filter takes the leaves that match its most selective condition
+from the index, keeps those that match its other conditions, and adds up
+their sizes in preorder. The filtered size of any tree is then the
+difference of two of those running totals, found by binary search. A
+filter therefore takes time proportional to the number of leaves it could
+match, not to the size of the tree.
+
+A FilteredTree is a view of one node of a tree under a filter: an
+AbstractTree whose data_size is the filtered size, and whose subtrees are
+views of the subtrees that have matching leaves. A view's subtrees are
+created when they are first used, e.g. by generate_treemap, which with a
+minimum area only visits a number of trees bounded by the size of the
+screen. They are kept as long as the view of the root is, so that
+generate_treemap lays out a view incrementally, as it does a tree.
+
+Views cannot be edited. An index describes its tree as it was when the
+index was built, so after the tree is edited, a new index must be built
+(see AbstractTree.filtered).
+"""
+
+from __future__ import annotations
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tree_data import AbstractTree
+
+
+class LeafFilter:
+    """A condition on the leaves of a tree. A leaf matches if it meets
+    every condition that is not None.
+
+    === Public Attributes ===
+    name: a short description of the filter.
+    min_size: the smallest data_size of a matching leaf.
+    max_size: the largest data_size of a matching leaf.
+    keys: the leaf_keys of matching leaves.
+    after: the earliest leaf_time of a matching leaf.
+    before: the latest leaf_time of a matching leaf.
+    """
+    name: str
+    min_size: Optional[float]
+    max_size: Optional[float]
+    keys: Optional[frozenset]
+    after: Optional[float]
+    before: Optional[float]
+
+    def __init__(self: LeafFilter, name: str = '',
+                 min_size: Optional[float] = None,
+                 max_size: Optional[float] = None,
+                 keys: Optional[Iterable[object]] = None,
+                 after: Optional[float] = None,
+                 before: Optional[float] = None) -> None:
+        """Initialize a filter with the given name and conditions."""
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.keys = None if keys is None else frozenset(keys)
+        self.after = after
+        self.before = before
+
+    def matches(self: LeafFilter, leaf: AbstractTree) -> bool:
+        """Return True if the leaf <leaf> matches this filter. A tree whose
+        subtrees have not been loaded (e.g. an unscanned folder of a lazy
+        FileSystemTree) is not a real leaf, so it never matches."""
+        if leaf.is_empty() or leaf.is_unloaded():
+            return False
+        size = leaf.data_size
+        if self.min_size is not None and size < self.min_size or \
+                self.max_size is not None and size > self.max_size:
+            return False
+        if self.keys is not None and leaf.leaf_key() not in self.keys:
+            return False
+        if self.after is not None or self.before is not None:
+            when = leaf.leaf_time()
+            if when is None or \
+                    self.after is not None and when < self.after or \
+                    self.before is not None and when > self.before:
+                return False
+        return True
+
+
+def larger_than(size: float) -> LeafFilter:
+    """Return a filter for the leaves of at least <size>."""
+    return LeafFilter('size >= {}'.format(size), min_size=size)
+
+
+def with_keys(*keys: object) -> LeafFilter:
+    """Return a filter for the leaves whose leaf_key is one of <keys>, e.g.
+    with_keys('.log') for the .log files."""
+    return LeafFilter(' or '.join(map(str, keys)), keys=keys)
+
+
+def unchanged_for(seconds: float, now: Optional[float] = None) -> LeafFilter:
+    """Return a filter for the leaves whose leaf_time is at least <seconds>
+    before <now> (by default, the current time)."""
+    if now is None:
+        now = time.time()
+    return LeafFilter('unchanged for {} days'.format(round(seconds / 86400)),
+                      before=now - seconds)
+
+
+class AttributeIndex:
+    """The nodes of a tree in preorder, and its leaves by attribute.
+
+    === Public Attributes ===
+    root: the root of the indexed tree.
+
+    === Private Attributes ===
+    _nodes: the non-empty nodes of the tree, in preorder.
+    _ends: for each position in _nodes, the position just after the last
+        node of the subtree there.
+    _parents: for each position in _nodes, the position of its parent, or
+        -1 for the root.
+    _leaves: the positions of the leaves whose size is not 0, in preorder.
+        Leaves of size 0 are never drawn, so filters leave them out, as they
+        do trees whose subtrees have not been loaded, whose size and
+        leaf_time are not those of a real leaf.
+    _by_key: the positions of the leaves in _leaves with each leaf_key,
+        in preorder.
+    _sorted: for 'size' and 'time', once built, the data_sizes or
+        leaf_times of the leaves in _leaves that have one, in increasing
+        order, and the position of each of those leaves.
+    """
+    root: AbstractTree
+    _nodes: List[AbstractTree]
+    _ends: array
+    _parents: array
+    _leaves: array
+    _by_key: Dict[object, array]
+    _sorted: Dict[str, Tuple[list, array]]
+
+    def __init__(self: AttributeIndex, root: AbstractTree) -> None:
+        """Index the tree <root>."""
+        self.root = root
+        nodes = []
+        parents = array('q')
+        leaves = array('q')
+        by_key = {}
+        stack = [root]
+        stack_parents = [-1]
+        while stack:
+            node = stack.pop()
+            parent = stack_parents.pop()
+            if node._root is None:
+                continue
+            position = len(nodes)
+            nodes.append(node)
+            parents.append(parent)
+            if node._subtrees:
+                stack.extend(reversed(node._subtrees))
+                stack_parents.extend([position] * len(node._subtrees))
+            elif node.data_size > 0 and not node.is_unloaded():
+                leaves.append(position)
+                key = node.leaf_key()
+                if key is not None:
+                    if key not in by_key:
+                        by_key[key] = array('q')
+                    by_key[key].append(position)
+
+        # A subtree ends where its last descendant does; children come after
+        # their parents, so one backwards pass finds every end.
+        ends = array('q', range(1, len(nodes) + 1))
+        for position in range(len(nodes) - 1, 0, -1):
+            parent = parents[position]
+            if ends[position] > ends[parent]:
+                ends[parent] = ends[position]
+        self._nodes = nodes
+        self._ends = ends
+        self._parents = parents
+        self._leaves = leaves
+        self._by_key = by_key
+        self._sorted = {}
+
+    def select(self: AttributeIndex,
+               leaf_filter: LeafFilter) -> Tuple[array, List[float]]:
+        """Return the positions of the leaves matching <leaf_filter>, in
+        preorder, and the running total of their sizes: the i-th total is
+        the total size of the first i of them. Leaves of size 0 are left
+        out, since they would not be drawn."""
+        candidates, exact = self._candidates(leaf_filter)
+        nodes = self._nodes
+        if exact:
+            positions = array('q', sorted(candidates))
+        else:
+            matches = leaf_filter.matches
+            positions = array('q', sorted(
+                position for position in candidates
+                if matches(nodes[position])))
+        totals = [0]
+        totals.extend(accumulate(nodes[position].data_size
+                                 for position in positions))
+        return positions, totals
+
+    def _candidates(self: AttributeIndex,
+                    leaf_filter: LeafFilter) -> Tuple[Iterable[int], bool]:
+        """Return the positions of the leaves that match the condition of
+        <leaf_filter> that the fewest leaves match, in any order, and
+        whether they are exactly the leaves that match <leaf_filter>."""
+        best = self._leaves
+        conditions = 0
+        if leaf_filter.keys is not None:
+            conditions += 1
+            best = [position for key in leaf_filter.keys
+                    for position in self._by_key.get(key, ())]
+        for name, low, high in (
+                ('size', leaf_filter.min_size, leaf_filter.max_size),
+                ('time', leaf_filter.after, leaf_filter.before)):
+            if low is None and high is None:
+                continue
+            conditions += 1
+            values, positions = self.sorted_by(name)
+            start = 0 if low is None else bisect_left(values, low)
+            end = len(values) if high is None else bisect_right(values, high)
+            if conditions == 1 or end - start < len(best):
+                best = positions[start:end]
+        return best, conditions <= 1
+
+    def sorted_by(self: AttributeIndex, name: str) -> Tuple[list, array]:
+        """Return the sizes (if <name> is 'size') or times (if it is
+        'time') of the leaves that have one, sorted, and the positions of
+        those leaves in the same order, building them if needed."""
+        if name not in self._sorted:
+            nodes = self._nodes
+            leaves = self._leaves
+            if name == 'size':
+                values = [nodes[position].data_size for position in leaves]
+            else:
+                values = [nodes[position].leaf_time() for position in leaves]
+                if None in values:
+                    leaves = array('q', [position for position, value
+                                         in zip(leaves, values)
+                                         if value is not None])
+                    values = [value for value in values if value is not None]
+            order = sorted(range(len(values)), key=values.__getitem__)
+            self._sorted[name] = ([values[i] for i in order],
+                                  array('q', [leaves[i] for i in order]))
+        return self._sorted[name]
+
+
+class _Selection:
+    """The leaves of an indexed tree that match a filter.
+
+    === Attributes ===
+    index: the index of the tree.
+    leaf_filter: the filter.
+    positions: the positions in the index of the matching leaves, in
+        preorder.
+    totals: the running totals of the sizes of the matching leaves, as
+        returned by AttributeIndex.select.
+    """
+    index: AttributeIndex
+    leaf_filter: LeafFilter
+    positions: array
+    totals: List[float]
+
+    def __init__(self: _Selection, index: AttributeIndex,
+                 leaf_filter: LeafFilter, positions: array,
+                 totals: List[float]) -> None:
+        """Initialize the selection of <positions> from <index>."""
+        self.index = index
+        self.leaf_filter = leaf_filter
+        self.positions = positions
+        self.totals = totals
+
+
+class FilteredTree(AbstractTree):
+    """A view of a tree that only shows the leaves matching a filter.
+
+    The view of the root is returned by AbstractTree.filtered, and the views
+    of other nodes are created from it as its subtrees are used.
+
+    === Public Attributes ===
+    source: the tree this is a view of.
+
+    === Private Attributes ===
+    _selection: the leaves matching the filter, shared by all the views of
+        the same filter.
+    _position: the position of <source> in the index.
+    _children: the views of the subtrees of <source> with matching leaves,
+        or None until they are first needed.
+    """
+    source: AbstractTree
+    _selection: _Selection
+    _position: int
+    _children: Optional[List[FilteredTree]]
+
+    def __init__(self: FilteredTree, index: AttributeIndex,
+                 leaf_filter: LeafFilter) -> None:
+        """Initialize the view of the root of the tree indexed by <index>
+        under <leaf_filter>.
+
+        Unlike other AbstractTrees, creating a view does not create a node.
+        """
+        positions, totals = index.select(leaf_filter)
+        self._selection = _Selection(index, leaf_filter, positions, totals)
+        self._position = 0
+        # An empty (deleted) root is not in the index, and has no subtrees.
+        self._children = None if index._nodes else []
+        self._parent_tree = None
+        self.source = index.root
+        self._root = self.source._root
+        self.colour = self.source.colour
+        self.data_size = totals[-1]
+
+    @property
+    def leaf_filter(self: FilteredTree) -> LeafFilter:
+        """The filter of this view."""
+        return self._selection.leaf_filter
+
+    @property
+    def _subtrees(self: FilteredTree) -> List[FilteredTree]:
+        """The views of the subtrees of <source> that have matching
+        leaves."""
+        if self._children is None:
+            self._children = self._find_children()
+        return self._children
+
+    def _find_children(self: FilteredTree) -> List[FilteredTree]:
+        """Return the views of the subtrees of <source> with matching
+        leaves, in order, visiting only those subtrees."""
+        selection = self._selection
+        index = selection.index
+        nodes = index._nodes
+        ends = index._ends
+        parents = index._parents
+        positions = selection.positions
+        totals = selection.totals
+        position = self._position
+        end = ends[position]
+        children = []
+        i = bisect_left(positions, position + 1)
+        while i < len(positions) and positions[i] < end:
+            # The subtree containing the next matching leaf.
+            child = positions[i]
+            while parents[child] != position:
+                child = parents[child]
+            after = bisect_left(positions, ends[child], i)
+            # Views are made without __init__, which only makes the root's.
+            view = FilteredTree.__new__(FilteredTree)
+            view._selection = selection
+            view._position = child
+            view._children = None
+            view._parent_tree = self
+            view.source = source = nodes[child]
+            view._root = source._root
+            view.colour = source.colour
+            view.data_size = totals[after] - totals[i]
+            children.append(view)
+            i = after
+        return children
+
+    def view_of(self: FilteredTree,
+                tree: AbstractTree) -> Optional[FilteredTree]:
+        """Return the view of <tree>, a node of the tree this view's source
+        is part of, or None if it has no matching leaves or is not below
+        this view's source."""
+        chain = []
+        while tree is not None and tree != self.source:
+            chain.append(tree)
+            tree = tree._parent_tree
+        if tree is None:
+            return None
+        view = self
+        for node in reversed(chain):
+            for subtree in view._subtrees:
+                if subtree.source == node:
+                    view = subtree
+                    break
+            else:
+                return None
+        return view
+
+    def leaf_key(self: FilteredTree) -> Optional[object]:
+        """Return the leaf_key of the source."""
+        return self.source.leaf_key()
+
+    def leaf_time(self: FilteredTree) -> Optional[float]:
+        """Return the leaf_time of the source."""
+        return self.source.leaf_time()
+
+    def get_separator(self: FilteredTree) -> str:
+        """Return the separator of the source."""
+        return self.source.get_separator()
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={'extra-imports': ['time', 'array', 'bisect', 'itertools',
+                                  'tree_data']})
@@ -0,0 +1,91 @@
+import os
+
+from benchmarks import RECT, make_tree
+from filters import LeafFilter, larger_than, unchanged_for, with_keys
+from tree_data import FileSystemTree
+
+
+def filtered_size(tree, leaf_filter: LeafFilter) -> float:
+    """Return the total size of the leaves of <tree> matching
+    <leaf_filter>, by walking it."""
+    if not tree._subtrees:
+        return tree.data_size if leaf_filter.matches(tree) else 0
+    return sum(filtered_size(sub, leaf_filter) for sub in tree._subtrees)
+
+
+def check_view(view, leaf_filter: LeafFilter) -> int:
+    """Check the sizes of <view> and its subtrees against a walk of their
+    sources, and return the number of views checked."""
+    assert view.data_size == filtered_size(view.source, leaf_filter)
+    expected = [sub for sub in view.source._subtrees
+                if filtered_size(sub, leaf_filter)]
+    assert [sub.source for sub in view._subtrees] == expected
+    return 1 + sum(check_view(sub, leaf_filter) for sub in view._subtrees)
+
+
+def test_filtered_sizes_match_walk() -> None:
+    tree = make_tree('balanced', 2000, 'zipf')
+    before = tree.generate_treemap(RECT)
+    for leaf_filter in (larger_than(0), larger_than(500),
+                        LeafFilter(min_size=100, max_size=300),
+                        larger_than(10 ** 9), with_keys('.log')):
+        view = tree.filtered(leaf_filter)
+        assert check_view(view, leaf_filter) > 0
+        output = view.generate_treemap(RECT)
+        assert output == list(view.iter_treemap(RECT))
+    assert tree.generate_treemap(RECT) == before
+
+
+def test_reindex_after_edit() -> None:
+    tree = make_tree('balanced', 500)
+    leaf_filter = larger_than(100)
+    tree.filtered(leaf_filter)
+    leaf = tree._subtrees[0]._subtrees[0]._subtrees[0]
+    leaf.set_size(10 ** 6)
+    tree._subtrees[1].delete()
+    view = tree.filtered(leaf_filter, reindex=True)
+    check_view(view, leaf_filter)
+    assert view.view_of(leaf).data_size == 10 ** 6
+    assert view.view_of(tree._subtrees[1]) is None
+
+
+def test_extension_and_age_filters(tmp_path) -> None:
+    now = 10 ** 9
+    os.mkdir(str(tmp_path / 'logs'))
+    for name, size, age in (('logs/a.log', 10, 400), ('logs/b.LOG', 5, 1),
+                            ('c.txt', 3, 400), ('d.log', 7, 2)):
+        path = str(tmp_path / name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (now - age * 86400, now - age * 86400))
+    tree = FileSystemTree(str(tmp_path))
+    for leaf_filter, size in ((with_keys('.log'), 22),
+                              (unchanged_for(365 * 86400, now), 13),
+                              (larger_than(6), 17)):
+        view = tree.filtered(leaf_filter)
+        assert view.data_size == size
+        check_view(view, leaf_filter)
+
+
+def test_unscanned_folders_never_match(tmp_path) -> None:
+    now = 10 ** 9
+    os.makedirs(str(tmp_path / 'a' / 'b'))
+    for name, size in (('a/f', 10), ('a/b/g', 100), ('a/b/h', 1000)):
+        path = str(tmp_path / name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (now, now))
+    tree = FileSystemTree(str(tmp_path), max_depth=1, estimate=True)
+    folder = tree._subtrees[0]._subtrees[
+        [sub._root for sub in tree._subtrees[0]._subtrees].index('b')]
+    assert folder.is_unloaded() and folder.data_size == 1100
+    for leaf_filter in (unchanged_for(86400, now + 10 ** 6), larger_than(1),
+                        LeafFilter()):
+        view = tree.filtered(leaf_filter)
+        assert view.data_size == 10
+        assert view.view_of(folder) is None
+        check_view(view, leaf_filter)
+    assert folder.expand()
+    view = tree.filtered(larger_than(1), reindex=True)
+    assert view.data_size == 1110
+    check_view(view, larger_than(1))
@@ -0,0 +1,327 @@
+"""Edit Journal
+
+=== Module Description ===
+This module contains EditJournal, which makes the edits a user can make to
+a tree in the visualiser (resizing a leaf, and deleting a leaf or a
+subtree) and records them, so that they can be undone and redone.
+
+Edits are applied in batches. A batch first changes the leaves and the
+structure of the tree, only noting how much the total size of each tree's
+subtrees changed, and then brings the sizes of the trees above the edits
+up to date in one pass, deepest first. An ancestor shared by many edits is
+therefore updated once, not once per edit, and the same pass marks it for
+layout and reports it to the tree's AggregateIndex. A batch of k edits
+costs time proportional to k plus the number of distinct trees above them,
+rather than to k times their depth.
+
+Deleting a tree keeps what is needed to put it back exactly as it was: its
+contents, and the subtrees list and tombstone count of its parent, which
+the parent uses to take it back (see AbstractTree._bury and _unbury).
+Undoing a batch makes the inverse edits, in reverse
+order, as another batch, and redoing it makes the same edits again.
+
+Sizes set through the journal are whole numbers (see
+AbstractTree.adjusted_size), so the size of every tree stays exactly the sum
+of the sizes of its subtrees; check_tree verifies this and the other
+invariants of a tree.
+
+The journal assumes that all edits to its tree are made through it. If
+the tree is changed in any other way (for example, by a TreeWatcher), call
+clear afterwards.
+"""
+
+from __future__ import annotations
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from tree_data import AbstractTree
+
+# The kinds of edit passed to EditJournal.apply: (RESIZE, leaf, new size) and
+# (DELETE, tree).
+RESIZE = 'resize'
+DELETE = 'delete'
+
+# The most batches that can be undone; older ones are forgotten.
+UNDO_LIMIT = 1000
+
+# A deleted tree, as recorded by _Batch.remove: the tree, its root value,
+# subtrees and their total size, its parent, and the subtrees list and
+# tombstone count of the parent before the deletion.
+Removal = Tuple[AbstractTree, object, float, List[AbstractTree],
+                Optional[AbstractTree], Optional[List[AbstractTree]], int]
+
+
+class EditJournal:
+    """The edits made to a tree, which can be undone and redone.
+
+    === Public Attributes ===
+    tree: the root of the tree edited through this journal.
+
+    === Private Attributes ===
+    _done: the batches that undo can revert, most recent last. Each batch
+        is a list of (RESIZE, leaf, old size, new size) and
+        (DELETE, [Removal, ...]) records, in the order they were made.
+    _undone: the batches undo has reverted, which redo can make again,
+        most recently undone last.
+    """
+    tree: AbstractTree
+    _done: Deque[list]
+    _undone: List[list]
+
+    def __init__(self: EditJournal, tree: AbstractTree) -> None:
+        """Initialize an empty journal for the tree <tree>."""
+        self.tree = tree
+        self._done = deque(maxlen=UNDO_LIMIT)
+        self._undone = []
+
+    def resize(self: EditJournal, leaf: AbstractTree, size: int) -> None:
+        """Set the data_size of the leaf <leaf> to <size>."""
+        self.apply([(RESIZE, leaf, size)])
+
+    def adjust(self: EditJournal, leaf: AbstractTree, case: bool,
+               times: int = 1) -> None:
+        """Grow (if <case> is True) or shrink the leaf <leaf> by <times>
+        steps, as AbstractTree.adjust_size does."""
+        self.resize(leaf, leaf.adjusted_size(case, times))
+
+    def delete(self: EditJournal, tree: AbstractTree) -> None:
+        """Delete <tree>, a leaf or a subtree, as AbstractTree.delete
+        does."""
+        self.apply([(DELETE, tree)])
+
+    def apply(self: EditJournal, edits: Iterable[tuple]) -> None:
+        """Make <edits>, a sequence of (RESIZE, leaf, size) and
+        (DELETE, tree) tuples, in order, as one batch that is undone and
+        redone as a whole.
+
+        Edits of trees that have already been deleted, or that are inside a
+        subtree that has, e.g. by an earlier edit of the same batch, are
+        ignored.
+        """
+        batch = _Batch(self.tree)
+        records = []
+        for edit in edits:
+            if not self._attached(edit[1]):
+                continue
+            if edit[0] == RESIZE:
+                leaf, size = edit[1], edit[2]
+                records.append((RESIZE, leaf, batch.resize(leaf, size),
+                                size))
+            elif edit[0] == DELETE:
+                records.append((DELETE, batch.remove(edit[1])))
+            else:
+                raise ValueError('unknown edit: {}'.format(edit[0]))
+        batch.finish()
+        if records:
+            self._done.append(records)
+            self._undone.clear()
+
+    def _attached(self: EditJournal, tree: AbstractTree) -> bool:
+        """Return True if <tree> has not been deleted and is still part of
+        the tree of this journal."""
+        x = tree
+        while not x.is_empty():
+            parent = x._parent_tree
+            if parent is None:
+                return x == self.tree
+            x = parent
+        return False
+
+    def undo(self: EditJournal) -> bool:
+        """Revert the most recent batch that has not been undone, and return
+        True, or return False if there is none."""
+        if not self._done:
+            return False
+        records = self._done.pop()
+        batch = _Batch(self.tree)
+        for record in reversed(records):
+            if record[0] == RESIZE:
+                batch.resize(record[1], record[2])
+            else:
+                batch.restore(record[1])
+        batch.finish()
+        self._undone.append(records)
+        return True
+
+    def redo(self: EditJournal) -> bool:
+        """Make the most recently undone batch again, and return True, or
+        return False if there is none (or an edit has been made since)."""
+        if not self._undone:
+            return False
+        records = self._undone.pop()
+        batch = _Batch(self.tree)
+        for i, record in enumerate(records):
+            if record[0] == RESIZE:
+                batch.resize(record[1], record[3])
+            else:
+                records[i] = (DELETE, batch.remove(record[1][0][0]))
+        batch.finish()
+        self._done.append(records)
+        return True
+
+    def clear(self: EditJournal) -> None:
+        """Forget every recorded batch, e.g. after the tree was changed
+        without this journal."""
+        self._done.clear()
+        self._undone.clear()
+
+
+class _Batch:
+    """The edits of one batch, before the sizes of the trees above them are
+    brought up to date by finish.
+
+    Until then, for every tree t whose subtrees have been edited,
+    t.data_size + deltas[t] is the sum of the data_sizes of its subtrees.
+
+    === Attributes ===
+    deltas: the change in the total size of the subtrees of each tree that
+        has not yet been added to its data_size.
+    touched: the leaves resized and the trees restored by this batch.
+    index: the AggregateIndex of the tree, or None.
+    """
+    deltas: Dict[AbstractTree, float]
+    touched: List[AbstractTree]
+    index: Optional[object]
+
+    def __init__(self: _Batch, tree: AbstractTree) -> None:
+        """Initialize an empty batch of edits to <tree>."""
+        self.deltas = {}
+        self.touched = []
+        self.index = tree._aggregate_index()
+
+    def resize(self: _Batch, leaf: AbstractTree, size: float) -> float:
+        """Set the data_size of <leaf> to <size>, and return its old
+        size."""
+        old_size = leaf.data_size
+        leaf.data_size = size
+        parent = leaf._parent_tree
+        if parent is not None:
+            self.deltas[parent] = self.deltas.get(parent, 0) + size - old_size
+        self.touched.append(leaf)
+        if self.index is not None:
+            self.index.resized(leaf, old_size, ancestors=False)
+        return old_size
+
+    def remove(self: _Batch, tree: AbstractTree) -> List[Removal]:
+        """Delete <tree>, and then each ancestor it leaves with no
+        subtrees, except the root, as AbstractTree.delete does, and return
+        what was deleted, in order."""
+        removals = []
+        deltas = self.deltas
+        while True:
+            if self.index is not None:
+                self.index.removed(tree, ancestors=False)
+            parent = tree._parent_tree
+            if parent is None:
+                siblings, tombstones = None, 0
+            else:
+                siblings, tombstones = parent._subtrees, parent._tombstones
+            # The size recorded is the total of the subtrees recorded, which
+            # differs from data_size if some of them were removed earlier in
+            # this batch.
+            removals.append((tree, tree._root,
+                             tree.data_size + deltas.pop(tree, 0),
+                             tree._subtrees, parent, siblings, tombstones))
+            if parent is not None:
+                deltas[parent] = deltas.get(parent, 0) - tree.data_size
+            tree._root = None
+            tree.data_size = 0
+            tree._subtrees = []
+            if parent is None:
+                return removals
+            parent._bury(tree)
+            if parent._parent_tree is None or \
+                    len(parent._subtrees) > parent._tombstones:
+                return removals
+            tree = parent
+
+    def restore(self: _Batch, removals: List[Removal]) -> None:
+        """Put back the trees deleted by remove, as they were, assuming
+        every edit made since has been undone."""
+        deltas = self.deltas
+        for tree, root, size, subtrees, parent, siblings, tombstones in \
+                reversed(removals):
+            tree._root = root
+            tree._subtrees = subtrees
+            if subtrees:
+                size = sum(subtree.data_size for subtree in subtrees)
+            tree.data_size = size
+            deltas.pop(tree, None)
+            if parent is not None:
+                parent._unbury(tree, siblings, tombstones)
+                deltas[parent] = deltas.get(parent, 0) + size
+            self.touched.append(tree)
+            if self.index is not None:
+                self.index.added(tree, ancestors=False)
+
+    def finish(self: _Batch) -> None:
+        """Add the changes in deltas to the data_sizes of the trees above
+        the edits, deepest first, so that each is updated once, and mark
+        them for layout."""
+        deltas = self.deltas
+        # The depth of every tree above an edit, counted from the root of
+        # the tree (or of the deleted subtree) it is in.
+        depth = {}
+        for tree in list(deltas) + self.touched:
+            chain = []
+            while tree is not None and tree not in depth:
+                chain.append(tree)
+                tree = tree._parent_tree
+            level = depth[tree] if tree is not None else -1
+            for tree in reversed(chain):
+                level += 1
+                depth[tree] = level
+
+        changed = []
+        for tree in sorted(depth, key=depth.__getitem__, reverse=True):
+            tree._dirty = True
+            change = deltas.get(tree)
+            if change and not tree.is_empty():
+                tree.data_size += change
+                changed.append(tree)
+                parent = tree._parent_tree
+                if parent is not None:
+                    deltas[parent] = deltas.get(parent, 0) + change
+        if self.index is not None:
+            self.index.refresh(changed)
+
+
+def check_tree(tree: AbstractTree) -> List[Tuple[AbstractTree, str]]:
+    """Return every tree in <tree> that breaks an invariant of
+    AbstractTree, with a description of the problem; an empty list if there
+    are none.
+
+    The invariants checked are that the data_size of a tree with subtrees
+    is the sum of theirs, that every subtree's _parent_tree is the tree it
+    is in, and that _tombstones counts the empty subtrees.
+    """
+    problems = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.is_empty() or not node._subtrees:
+            continue
+        total = 0
+        empty = 0
+        for subtree in node._subtrees:
+            if subtree.is_empty():
+                empty += 1
+            else:
+                total += subtree.data_size
+                if subtree._parent_tree != node:
+                    problems.append((subtree, 'wrong _parent_tree'))
+                stack.append(subtree)
+        if node.data_size != total:
+            problems.append((node, 'data_size {} != sum of subtrees {}'
+                             .format(node.data_size, total)))
+        if node._tombstones != empty:
+            problems.append((node, '_tombstones {} != empty subtrees {}'
+                             .format(node._tombstones, empty)))
+    return problems
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['collections',
+                                                  'tree_data']})
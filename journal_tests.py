@@ -0,0 +1,128 @@
+import random
+
+from aggregates import AggregateIndex
+from benchmarks import RECT, make_tree
+from compact_tree import CompactTree
+from journal import DELETE, RESIZE, EditJournal, check_tree
+
+
+def shape(tree) -> list:
+    """Return the names and sizes of the live trees of <tree>, in
+    preorder."""
+    rows = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if not node.is_empty():
+            rows.append((node._root, float(node.data_size)))
+            stack.extend(reversed(node._subtrees))
+    return rows
+
+
+def trees() -> list:
+    """Return an object tree and a compact tree to edit."""
+    return [make_tree('balanced', 500), CompactTree.from_tree(
+        make_tree('balanced', 500, seed=1))]
+
+
+def leaves(tree) -> list:
+    """Return the live leaves of <tree>."""
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node._subtrees:
+            stack.extend(node._subtrees)
+        elif not node.is_empty():
+            result.append(node)
+    return result
+
+
+def test_delete_and_undo_both_tree_types() -> None:
+    for tree in trees():
+        before = shape(tree)
+        journal = EditJournal(tree)
+        leaf = tree._subtrees[2]._subtrees[5]._subtrees[3]
+        journal.delete(leaf)
+        journal.delete(tree._subtrees[4])
+        assert len(shape(tree)) < len(before)
+        assert check_tree(tree) == []
+        assert journal.undo() and journal.undo()
+        assert shape(tree) == before
+        assert check_tree(tree) == []
+        assert not journal.undo()
+
+
+def test_undo_redo_random_batches() -> None:
+    rnd = random.Random(0)
+    for tree in trees():
+        tree.index_aggregates()
+        journal = EditJournal(tree)
+        states = [shape(tree)]
+        for _ in range(30):
+            edits = []
+            for leaf in rnd.sample(leaves(tree), 5):
+                if rnd.random() < 0.5:
+                    edits.append((DELETE, leaf))
+                else:
+                    edits.append((RESIZE, leaf, rnd.randint(1, 5000)))
+            journal.apply(edits)
+            assert check_tree(tree) == []
+            states.append(shape(tree))
+        for state in reversed(states[:-1]):
+            assert journal.undo()
+            assert shape(tree) == state
+        for state in states[1:]:
+            assert journal.redo()
+            assert shape(tree) == state
+        assert not journal.redo()
+        largest = max(leaves(tree), key=lambda leaf: leaf.data_size)
+        assert tree.largest(1)[0].data_size == largest.data_size
+
+
+def test_whole_directory_deleted_with_last_leaf() -> None:
+    for tree in trees():
+        folder = tree._subtrees[1]._subtrees[0]
+        size = tree.data_size
+        journal = EditJournal(tree)
+        journal.apply([(DELETE, leaf) for leaf in folder._subtrees])
+        assert folder.is_empty()
+        assert tree.data_size < size
+        journal.undo()
+        assert tree.data_size == size
+        assert check_tree(tree) == []
+
+
+def test_layout_after_undo() -> None:
+    for tree in trees():
+        expected = tree.generate_treemap(RECT)
+        journal = EditJournal(tree)
+        journal.adjust(leaves(tree)[7], True, 20)
+        journal.delete(leaves(tree)[3])
+        assert tree.generate_treemap(RECT) != expected
+        journal.undo()
+        journal.undo()
+        assert tree.generate_treemap(RECT) == expected
+
+
+def walk_size_by(tree) -> dict:
+    """Return the total size of the live leaves of <tree> under the key
+    'k', by walking it."""
+    return {'k': sum(leaf.data_size for leaf in leaves(tree))}
+
+
+def test_edits_inside_deleted_subtree_ignored() -> None:
+    for tree in trees():
+        AggregateIndex(lambda leaf: 'k').attach(tree)
+        journal = EditJournal(tree)
+        folder = tree._subtrees[2]._subtrees[1]
+        leaf = folder._subtrees[0]
+        size = tree.data_size - folder.data_size
+        journal.apply([(DELETE, folder), (RESIZE, leaf, 1000),
+                       (DELETE, leaf._parent_tree)])
+        assert check_tree(tree) == []
+        assert tree.data_size == size
+        assert tree.size_by() == walk_size_by(tree) == {'k': size}
+        journal.undo()
+        assert check_tree(tree) == []
+        assert tree.size_by() == walk_size_by(tree)
@@ -0,0 +1,226 @@
+"""Treemap Layout Strategies
+
+=== Module Description ===
+This module contains the strategies AbstractTree.generate_treemap can use to
+divide the rectangle of a tree between its subtrees.
+
+A strategy only decides how one tree's rectangle is split among its direct
+subtrees; generate_treemap applies it recursively, and keeps handling
+empty trees, leaves and the incremental layout cache itself.
+
+SliceAndDice is the original treemap algorithm and the default. Squarified
+(Bruls, Huizing and van Wijk) lays subtrees out in rows chosen to keep each
+rectangle as close to square as possible, which avoids the one-pixel slivers
+slice-and-dice produces for wide folders. It sorts the subtrees by size, so
+it takes O(n log n) time per folder of n subtrees.
+"""
+
+from __future__ import annotations
+import time
+from typing import Dict, List, Sequence, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+
+class LayoutStrategy:
+    """A way of dividing a rectangle between the subtrees of a tree.
+
+    This is an abstract class that should not be instantiated directly.
+
+    === Public Attributes ===
+    name: a short name for this strategy.
+    """
+    name: str = ''
+
+    def split(self: LayoutStrategy, rect: Rect, sizes: Sequence[float],
+              total: float) -> List[Rect]:
+        """Return one rectangle inside <rect> for each subtree, where <sizes>
+        are the data_sizes of the subtrees in order and <total> is the
+        data_size of the tree.
+
+        Precondition: <sizes> is not empty and <total> > 0.
+        """
+        raise NotImplementedError
+
+    def __repr__(self: LayoutStrategy) -> str:
+        return '{}()'.format(type(self).__name__)
+
+
+class SliceAndDice(LayoutStrategy):
+    """The original treemap layout: subtrees are laid side by side along the
+    longer side of the rectangle, each getting a share proportional to its
+    size, and the last subtree taking what is left.
+    """
+    name = 'slice-and-dice'
+
+    def split(self: SliceAndDice, rect: Rect, sizes: Sequence[float],
+              total: float) -> List[Rect]:
+        """Return the slice-and-dice rectangles of the subtrees."""
+        x, y, width, height = rect
+        last = len(sizes) - 1
+        rects = []
+        if width > height:
+            for i, size in enumerate(sizes):
+                if i == last:
+                    new_width = abs(width - x)
+                else:
+                    new_width = int((size / total) * width)
+                rects.append((x, y, new_width, height))
+                x += new_width
+        else:  # if height >= width
+            for i, size in enumerate(sizes):
+                if i == last:
+                    new_height = abs(height - y)
+                else:
+                    new_height = int((size / total) * height)
+                rects.append((x, y, width, new_height))
+                y += new_height
+        return rects
+
+
+class Squarified(LayoutStrategy):
+    """The squarified treemap layout.
+
+    Subtrees are placed from largest to smallest in rows along the shorter
+    side of the remaining space. A subtree is added to the current row as
+    long as that does not make the worst aspect ratio in the row worse.
+    Subtrees with no size get an empty rectangle at the corner of <rect>.
+    Rectangle edges are rounded to whole pixels, so the rectangles tile
+    <rect> without gaps.
+    """
+    name = 'squarified'
+
+    def split(self: Squarified, rect: Rect, sizes: Sequence[float],
+              total: float) -> List[Rect]:
+        """Return the squarified rectangles of the subtrees."""
+        x, y, width, height = rect
+        rects = [(x, y, 0, 0)] * len(sizes)
+        order = [i for i in range(len(sizes)) if sizes[i] > 0]
+        positive = sum(sizes[i] for i in order)
+        if width <= 0 or height <= 0 or positive <= 0:
+            return rects
+        order.sort(key=lambda i: -sizes[i])
+        scale = width * height / positive
+
+        # The free space, in floating point.
+        fx, fy, fw, fh = float(x), float(y), float(width), float(height)
+        row = []
+        row_area = 0.0
+        i = 0
+        while i < len(order):
+            area = sizes[order[i]] * scale
+            side = min(fw, fh)
+            if not row or _worst(row_area + area, area, sizes[row[0]] * scale,
+                                 side) <= \
+                    _worst(row_area, sizes[row[-1]] * scale,
+                           sizes[row[0]] * scale, side):
+                row.append(order[i])
+                row_area += area
+                i += 1
+            else:
+                fx, fy, fw, fh = _place_row(row, row_area, sizes, scale,
+                                            (fx, fy, fw, fh), rects)
+                row = []
+                row_area = 0.0
+        if row:
+            _place_row(row, row_area, sizes, scale, (fx, fy, fw, fh), rects,
+                       True)
+        return rects
+
+
+def _worst(row_area: float, smallest: float, largest: float,
+           side: float) -> float:
+    """Return the worst aspect ratio of a row with total area <row_area>,
+    whose smallest and largest items have the given areas, laid along a side
+    of length <side>.
+    """
+    if row_area <= 0 or smallest <= 0:
+        return float('inf')
+    side2 = side * side
+    area2 = row_area * row_area
+    return max(side2 * largest / area2, area2 / (side2 * smallest))
+
+
+def _place_row(row: List[int], row_area: float, sizes: Sequence[float],
+               scale: float, free: Tuple[float, float, float, float],
+               rects: List[Rect], last: bool = False) \
+        -> Tuple[float, float, float, float]:
+    """Place the subtrees in <row> along the shorter side of the <free>
+    space, store their rectangles in <rects>, and return the free space that
+    is left.
+
+    If <last> is True, this is the last row, and it fills all of the free
+    space.
+    """
+    fx, fy, fw, fh = free
+    column = fw >= fh
+    # Lay the row out along the y axis for a column, the x axis otherwise.
+    start, length = (fy, fh) if column else (fx, fw)
+    across, depth = (fx, fw) if column else (fy, fh)
+    thickness = depth if last else row_area / length
+    near, far = round(across), round(across + thickness)
+
+    pos = start
+    edge = round(start)
+    for k, i in enumerate(row):
+        pos += sizes[i] * scale / thickness
+        next_edge = round(start + length) if k == len(row) - 1 else round(pos)
+        if column:
+            rects[i] = (near, edge, far - near, next_edge - edge)
+        else:
+            rects[i] = (edge, near, next_edge - edge, far - near)
+        edge = next_edge
+
+    if column:
+        return fx + thickness, fy, fw - thickness, fh
+    return fx, fy + thickness, fw, fh - thickness
+
+
+SLICE_AND_DICE = SliceAndDice()
+SQUARIFIED = Squarified()
+
+# The available strategies, by name.
+STRATEGIES = {strategy.name: strategy
+              for strategy in (SLICE_AND_DICE, SQUARIFIED)}
+
+
+def mean_aspect_ratio(rects: Sequence[Tuple[Rect, object]]) -> float:
+    """Return the mean aspect ratio (longer side / shorter side) of the
+    non-degenerate rectangles in the generate_treemap output <rects>.
+
+    Rectangles with no area are skipped. Return 0.0 if there are none left.
+    """
+    total = 0.0
+    count = 0
+    for (_, _, w, h), _ in rects:
+        if w > 0 and h > 0:
+            total += max(w, h) / min(w, h)
+            count += 1
+    return total / count if count else 0.0
+
+
+def compare_strategies(trees: Dict[str, object], rect: Rect,
+                       strategies: Sequence[LayoutStrategy] =
+                       (SLICE_AND_DICE, SQUARIFIED)) -> List[Dict]:
+    """Lay out each of the named <trees> in <rect> with each of <strategies>,
+    and return one result per (tree, strategy) pair.
+
+    Each result is a dictionary with the keys 'tree', 'strategy',
+    'rectangles', 'degenerate' (the rectangles with no area, which
+    mean_aspect_ratio skips), 'seconds' and 'mean_aspect_ratio'. Every
+    layout is a full one: the incremental layout cache is not reused between
+    strategies.
+    """
+    results = []
+    for name, tree in trees.items():
+        for strategy in strategies:
+            start = time.perf_counter()
+            rects = tree.generate_treemap(rect, strategy)
+            seconds = time.perf_counter() - start
+            degenerate = sum(1 for (_, _, w, h), _ in rects
+                             if w <= 0 or h <= 0)
+            results.append({'tree': name, 'strategy': strategy.name,
+                            'rectangles': len(rects),
+                            'degenerate': degenerate, 'seconds': seconds,
+                            'mean_aspect_ratio': mean_aspect_ratio(rects)})
+    return results
@@ -0,0 +1,59 @@
+import random
+
+from benchmarks import RECT, make_tree
+from layout_strategies import SLICE_AND_DICE, SQUARIFIED, STRATEGIES, \
+    mean_aspect_ratio
+
+
+def test_squarified_tiles_rect() -> None:
+    rnd = random.Random(0)
+    for _ in range(200):
+        rect = (rnd.randint(0, 50), rnd.randint(0, 50),
+                rnd.randint(1, 120), rnd.randint(1, 120))
+        sizes = [rnd.choice([0, rnd.random(), rnd.randint(1, 1000)])
+                 for _ in range(rnd.randint(1, 25))]
+        total = sum(sizes)
+        if total <= 0:
+            continue
+        rects = SQUARIFIED.split(rect, sizes, total)
+        assert len(rects) == len(sizes)
+        x, y, w, h = rect
+        covered = set()
+        for (rx, ry, rw, rh), size in zip(rects, sizes):
+            assert rw >= 0 and rh >= 0
+            assert x <= rx and rx + rw <= x + w
+            assert y <= ry and ry + rh <= y + h
+            if size == 0:
+                assert (rx, ry, rw, rh) == (x, y, 0, 0)
+            pixels = {(px, py) for px in range(rx, rx + rw)
+                      for py in range(ry, ry + rh)}
+            assert not pixels & covered
+            covered |= pixels
+        assert len(covered) == w * h
+
+
+def test_squarified_areas_proportional() -> None:
+    sizes = [600, 300, 100, 50, 25, 25]
+    rects = SQUARIFIED.split((0, 0, 600, 400), sizes, sum(sizes))
+    for (_, _, w, h), size in zip(rects, sizes):
+        expected = size / sum(sizes) * 600 * 400
+        assert abs(w * h - expected) <= 0.05 * expected + 600
+
+
+def test_squarified_rectangles_are_squarer() -> None:
+    for shape in ('wide', 'balanced'):
+        tree = make_tree(shape, 2000, 'zipf')
+        sliced = tree.generate_treemap(RECT, SLICE_AND_DICE)
+        squarified = tree.generate_treemap(RECT, SQUARIFIED)
+        assert mean_aspect_ratio(squarified) < 3
+        assert mean_aspect_ratio(squarified) < mean_aspect_ratio(sliced)
+        assert len(squarified) == len(sliced)
+
+
+def test_strategies_by_name() -> None:
+    assert STRATEGIES == {'slice-and-dice': SLICE_AND_DICE,
+                          'squarified': SQUARIFIED}
+    tree = make_tree('balanced', 500)
+    assert tree.generate_treemap(RECT) == \
+        tree.generate_treemap(RECT, STRATEGIES['slice-and-dice'])
+    assert mean_aspect_ratio([]) == 0.0
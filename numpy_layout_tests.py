@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from benchmarks import RECT, SHAPES, SIZE_DISTRIBUTIONS, make_tree
+
+pytest.importorskip('numpy')
+from numpy_layout import generate_treemap_numpy  # noqa: E402
+
+
+def test_numpy_equals_generate_treemap() -> None:
+    for shape in SHAPES:
+        for distribution in SIZE_DISTRIBUTIONS:
+            for min_area in (0, 16):
+                tree = make_tree(shape, 3000, distribution)
+                expected = tree.generate_treemap(RECT, min_area=min_area)
+                leaves = list(tree._layout_leaves)
+                assert generate_treemap_numpy(tree, RECT, min_area) == \
+                    expected
+                assert list(tree._layout_leaves) == leaves
+
+
+def test_numpy_after_deletions() -> None:
+    rnd = random.Random(0)
+    tree = make_tree('balanced', 2000)
+    tree.generate_treemap(RECT)
+    for leaf in rnd.sample(list(tree._layout_leaves), 300):
+        leaf.delete_leaf()
+    assert generate_treemap_numpy(tree, RECT) == list(tree.iter_treemap(RECT))
+
+
+def test_find_rect_and_next_layout() -> None:
+    tree = make_tree('balanced', 2000)
+    tree.generate_treemap(RECT)
+    output = generate_treemap_numpy(tree, (0, 0, 800, 600))
+    for (x, y, w, h), _ in output[::50]:
+        pos = (x + w // 2, y + h // 2)
+        first = next(i for i, ((rx, ry, rw, rh), _) in enumerate(output)
+                     if rx <= pos[0] <= rx + rw and ry <= pos[1] <= ry + rh)
+        assert tree.find_rect(pos) is tree._layout_leaves[first]
+    tree._layout_leaves[7].adjust_size(True)
+    assert tree.generate_treemap(RECT) == list(tree.iter_treemap(RECT))
@@ -0,0 +1,240 @@
+"""Parallel Treemap Layout
+
+=== Module Description ===
+This module contains generate_treemap_parallel, a layout engine that
+produces exactly the same rectangles as AbstractTree.generate_treemap, but
+lays out the subtrees of the root in a pool of worker processes.
+
+The rectangle of the root is split between its subtrees as usual, and each
+subtree is then an independent job: its rectangles depend only on the
+subtree and the rectangle it was given. The workers are forked from this
+process while the layout runs, and the tree is handed to them through the
+pool's initializer, so they see it as it is without it being pickled; each
+worker sends back the rectangles of its subtrees, with
+the child indexes leading from the subtree to the tree drawn in each
+rectangle, and the results are joined in the order of the subtrees.
+
+No layout state is shared between calls or kept in module globals of this
+process, and the trees are not changed apart from the layout recorded on
+the root for find_rect, so calls on different trees, even at the same
+time, do not interfere.
+
+Each call forks its own pool, which takes a few milliseconds, and the
+parent still walks the trees drawn to record them for find_rect, so this
+only pays off for large trees whose root has several large subtrees, on a
+machine with several cores. Where fork is not available (e.g. on Windows),
+or with a single process, the layout is done by generate_treemap.
+"""
+
+from __future__ import annotations
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import attrgetter
+from typing import List, Optional, Tuple
+
+import profiling
+from layout_strategies import LayoutStrategy, SLICE_AND_DICE
+from tree_data import AbstractTree
+
+# The number of jobs each worker is given, on average, in batches; more
+# batches balance the work better, fewer cost less to send.
+BATCHES_PER_PROCESS = 4
+
+# The tree being laid out, in a worker process; set by _start_worker.
+_worker_tree = None
+
+# The result of laying out a subtree (see layout_subtree): flat arrays of
+# the rectangles and of the paths to the trees drawn in them.
+Layout = Tuple[array, array, array, array]
+
+_get_colour = attrgetter('colour')
+
+
+def generate_treemap_parallel(tree: AbstractTree,
+                              rect: Tuple[int, int, int, int],
+                              strategy: Optional[LayoutStrategy] = None,
+                              min_area: int = 0,
+                              processes: Optional[int] = None) \
+        -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+    """Run the treemap algorithm on <tree> and return the rectangles, like
+    tree.generate_treemap(rect, strategy, min_area), using up to
+    <processes> worker processes (one per CPU by default).
+
+    The layout is recorded on <tree> so that tree.find_rect searches it. The
+    incremental layout cache of generate_treemap is not used or updated; the
+    next generate_treemap call on <tree> lays it out in full.
+    """
+    if strategy is None:
+        strategy = SLICE_AND_DICE
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes < 2 or len(tree._subtrees) < 2 or tree.is_empty() or \
+            tree.data_size <= 0 or rect[2] * rect[3] < min_area or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        return tree.generate_treemap(rect, strategy, min_area)
+    return _layout_parallel(tree, rect, strategy, min_area, processes)
+
+
+def _layout_parallel(tree: AbstractTree, rect: Tuple[int, int, int, int],
+                     strategy: LayoutStrategy, min_area: int,
+                     processes: int) \
+        -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+    """Lay out <tree> as generate_treemap_parallel does, on <processes>
+    forked workers.
+
+    Precondition: <tree> has at least two subtrees and a positive
+    data_size, and <rect> is at least <min_area>.
+    """
+    profiler = profiling.current
+    if profiler is not None:
+        start = time.perf_counter()
+    subtrees = tree._subtrees
+    sub_rects = strategy.split(
+        rect, [subtree.data_size for subtree in subtrees], tree.data_size)
+    placed = [(i, sub_rect) for i, sub_rect in enumerate(sub_rects)
+              if min_area <= 0 or (sub_rect[2] > 0 and sub_rect[3] > 0)]
+    # Runs of consecutive subtrees, so that a root with many small subtrees
+    # does not cost a job for each.
+    batches = min(len(placed), processes * BATCHES_PER_PROCESS)
+    jobs = [(placed[len(placed) * b // batches:
+                    len(placed) * (b + 1) // batches], strategy, min_area)
+            for b in range(batches)]
+
+    output = []
+    leaves = []
+    # With fork, the initializer's arguments reach the workers by being
+    # inherited, not pickled.
+    with ProcessPoolExecutor(
+            min(processes, max(batches, 1)),
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_start_worker, initargs=(tree,)) as pool:
+        for rects, kept, counts, indexes in pool.map(_layout_job, jobs):
+            first = len(leaves)
+            _find_drawn(tree, kept, counts, indexes, leaves)
+            output.extend(zip(zip(*[iter(rects)] * 4),
+                              map(_get_colour, leaves[first:])))
+
+    tree._layout_bounds = rect
+    tree._layout_pass = None
+    tree._layout_output = output
+    tree._layout_leaves = leaves
+    tree._hit_index = None
+    if profiler is not None:
+        profiler.record('layout', start, rectangles=len(output),
+                        visited=len(output))
+    return list(output)
+
+
+def _start_worker(tree: AbstractTree) -> None:
+    """Keep <tree>, the tree whose subtrees this worker process lays
+    out."""
+    global _worker_tree
+    _worker_tree = tree
+
+
+def _layout_job(job: Tuple[List[Tuple[int, Tuple[int, int, int, int]]],
+                           LayoutStrategy, int]) -> Layout:
+    """Lay out a run of subtrees of the root in a worker process. <job> is
+    the position of each subtree in the root's subtrees with its rect, the
+    strategy and the minimum area. The paths in the result start at the
+    root."""
+    placed, strategy, min_area = job
+    subtrees = _worker_tree._subtrees
+    return _layout_stack([(subtrees[i], rect, 1, i)
+                          for i, rect in reversed(placed)],
+                         strategy, min_area)
+
+
+def layout_subtree(tree: AbstractTree, rect: Tuple[int, int, int, int],
+                   strategy: LayoutStrategy, min_area: int = 0) -> Layout:
+    """Lay out <tree> in <rect>, as generate_treemap does, and return the
+    rectangles and the path to the tree drawn in each of them, without
+    recording anything on the trees.
+
+    The result is four arrays, which are much quicker to send between
+    processes than tuples:
+        rects: x, y, width and height of each rectangle in turn.
+        kept: for each rectangle, the number of child indexes its path
+            shares with the path of the previous rectangle (0 for the first).
+        counts: for each rectangle, the number of child indexes that follow
+            the shared ones.
+        indexes: those child indexes, for all the rectangles in turn.
+    The path of <tree> itself is empty. Colours are not included; they are
+    read from the trees drawn.
+    """
+    return _layout_stack([(tree, rect, 0, 0)], strategy, min_area)
+
+
+def _layout_stack(stack: List[Tuple[AbstractTree, Tuple[int, int, int, int],
+                                    int, int]],
+                  strategy: LayoutStrategy, min_area: int) -> Layout:
+    """Lay out the trees on <stack>, last first, as layout_subtree does.
+    Each entry is a tree, its rect, its depth below the tree the paths
+    start at, and its position in its parent's subtrees (ignored at depth
+    0)."""
+    rects = array('q')
+    kept_at = array('l')
+    counts = array('l')
+    indexes = array('l')
+    cull = min_area > 0
+    # The child indexes leading to the tree being laid out, and the fewest
+    # of them kept since the last rectangle was produced.
+    path = []
+    kept = 0
+    while stack:
+        node, rect, depth, index = stack.pop()
+        if depth:
+            del path[depth - 1:]
+            if len(path) < kept:
+                kept = len(path)
+            path.append(index)
+        if node.data_size <= 0 or node._root is None:
+            continue
+        subtrees = node._subtrees
+        if not subtrees or rect[2] * rect[3] < min_area:
+            # A leaf, or a subtree too small to show its leaves.
+            if not cull or (rect[2] > 0 and rect[3] > 0):
+                rects.extend(rect)
+                kept_at.append(kept)
+                counts.append(len(path) - kept)
+                indexes.extend(path[kept:])
+                kept = len(path)
+            continue
+        sub_rects = strategy.split(
+            rect, [subtree.data_size for subtree in subtrees],
+            node.data_size)
+        for i in range(len(subtrees) - 1, -1, -1):
+            sub_rect = sub_rects[i]
+            if not cull or (sub_rect[2] > 0 and sub_rect[3] > 0):
+                stack.append((subtrees[i], sub_rect, depth + 1, i))
+    return rects, kept_at, counts, indexes
+
+
+def _find_drawn(tree: AbstractTree, kept_at: array, counts: array,
+                indexes: array, leaves: List[AbstractTree]) -> None:
+    """Append the tree drawn in each rectangle of <tree>, found by following
+    the paths in <kept_at>, <counts> and <indexes> (as returned by
+    layout_subtree) from <tree>, to <leaves>."""
+    nodes = [tree]
+    at = 0
+    for kept, count in zip(kept_at, counts):
+        del nodes[kept + 1:]
+        node = nodes[-1]
+        for i in indexes[at:at + count]:
+            node = node._subtrees[i]
+            nodes.append(node)
+        at += count
+        leaves.append(node)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'extra-imports': ['multiprocessing', 'os', 'time',
+                              'concurrent.futures', 'profiling',
+                              'layout_strategies', 'tree_data']})
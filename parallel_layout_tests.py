@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import RECT, make_tree
+from layout_strategies import SQUARIFIED
+from parallel_layout import generate_treemap_parallel, layout_subtree
+
+
+def test_parallel_equals_generate_treemap() -> None:
+    for shape in ('wide', 'balanced', 'deep'):
+        for strategy, min_area in ((None, 0), (SQUARIFIED, 4)):
+            tree = make_tree(shape, 3000)
+            expected = tree.generate_treemap(RECT, strategy, min_area)
+            leaves = list(tree._layout_leaves)
+            tree.invalidate_layout()
+            assert generate_treemap_parallel(tree, RECT, strategy, min_area,
+                                             processes=2) == expected
+            assert tree._layout_leaves == leaves
+            for x, y in ((0, 0), (500, 300), (1023, 737)):
+                hit = [leaf for ((rx, ry, w, h), _), leaf
+                       in zip(expected, leaves)
+                       if rx <= x <= rx + w and ry <= y <= ry + h]
+                assert tree.find_rect((x, y)) is (hit[0] if hit else None)
+
+
+def test_concurrent_calls() -> None:
+    trees = [make_tree('balanced', 2000, seed=seed) for seed in range(3)]
+    expected = [tree.generate_treemap(RECT) for tree in trees]
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(
+            lambda tree: generate_treemap_parallel(tree, RECT, processes=2),
+            trees))
+    assert results == expected
+
+
+def test_layout_subtree_rectangles() -> None:
+    tree = make_tree('balanced', 500)
+    rects, kept, counts, _ = layout_subtree(tree, RECT, SQUARIFIED)
+    expected = [rect for rect, _ in tree.generate_treemap(RECT, SQUARIFIED)]
+    assert list(zip(*[iter(rects)] * 4)) == expected
+    assert len(kept) == len(counts) == len(expected)
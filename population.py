@@ -18,7 +18,7 @@ Recommended steps:
    so don't feel like you need to understand it all the first time.
    It may be helpful to draw a small diagram of how all the helper functions
    fit together - we've provided most of the structure for you already.
-2. Complete the helpers _get_population_data and _get_region_data.
+2. Complete the helpers _get_population_series and _get_region_data.
    Both of these can be completed without recursion or any use of trees
    at all: they are simply exercises in taking some complex JSON data,
    and extracting the necessary information from them.
@@ -29,11 +29,28 @@ Recommended steps:
    only need to pass in False for the first argument (this allows you to
    create the region and country nodes directly, without trying to access
    the World Bank file again).
+
+=== Dataset Cache ===
+Parsing the World Bank files is the slowest part of building a
+PopulationTree, so the two files are compiled once into a small dataset,
+which is saved to POPULATION_CACHE and read back by later runs. The dataset
+holds the years in the population file and, for every country, an array of
+its population in each of those years. The cache records the modification
+time and size of both source files, and is compiled again whenever either
+of them changes; if it cannot be written, the compiled dataset is still
+used for this run.
+
+A PopulationTree shows one of the years at a time, the latest by default.
+show_year switches to another year in place, by setting the sizes of the
+country leaves, so that a treemap of the tree is laid out again only where
+it changed; it also accepts positions between two years, so that playback
+can move smoothly from one year to the next.
 """
 
 from __future__ import annotations
 import json
-from typing import Optional, List, Dict
+import os
+from typing import Optional, List, Dict, Tuple
 
 from tree_data import AbstractTree
 
@@ -42,6 +59,39 @@ from tree_data import AbstractTree
 WORLD_BANK_POPULATIONS = 'populations.json'
 WORLD_BANK_REGIONS = 'regions.json'
 
+# The file the compiled dataset is cached in, next to this module rather
+# than in the current directory, and the version of its format.
+POPULATION_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'populations.cache')
+CACHE_VERSION = 1
+
+# The number of countries at the start of the population file that are
+# really aggregates of countries (regions, income groups and the world).
+AGGREGATE_COUNTRIES = 47
+
+
+class PopulationDataset:
+    """The World Bank population data, compiled for building trees.
+
+    === Public Attributes ===
+    years: the years with population data, oldest first.
+    regions: the names of the countries with population data in each
+        region, for the regions with at least one such country.
+    values: the population of each country in each of <years>, in the same
+        order; 0 where the World Bank has no data for that year.
+    """
+    years: List[str]
+    regions: Dict[str, List[str]]
+    values: Dict[str, List[int]]
+
+    def __init__(self: PopulationDataset, years: List[str],
+                 regions: Dict[str, List[str]],
+                 values: Dict[str, List[int]]) -> None:
+        """Initialize a new dataset."""
+        self.years = years
+        self.regions = regions
+        self.values = values
+
 
 class PopulationTree(AbstractTree):
     """A tree representation of country population data.
@@ -51,10 +101,24 @@ class PopulationTree(AbstractTree):
       - Each node in the second level is a region (defined by the World Bank).
       - Each node in the third level is a country.
 
-    The data_size attribute corresponds to the 2019 population of the country,
-    as reported by the World Bank.
+    The data_size attribute corresponds to the population of the country in
+    the year shown, as reported by the World Bank.
+
+    === Public Attributes ===
+    years: the years that can be shown, oldest first. Only set on the root;
+        other trees share the empty class default.
+    position: the year shown, as a position in <years>: a whole number for
+        one of the years, or a fraction between two of them. Only set on
+        the root.
 
+    === Private Attributes ===
+    _series: each country leaf, with its population in each of <years>.
+        Only set on the root.
     """
+    years: List[str] = ()
+    position: float = 0
+    _series: List[Tuple[PopulationTree, List[int]]] = ()
+
     def __init__(self: PopulationTree, world: bool,
                  root: Optional[object] = None,
                  subtrees: Optional[List[PopulationTree]] = None,
@@ -62,14 +126,18 @@ class PopulationTree(AbstractTree):
         """Initialize a new PopulationTree.
 
         If <world> is True, then this tree is the root of the population tree,
-        and it should load data from the World Bank files.
+        and it should load data from the World Bank files (through the
+        dataset cache). The latest year is shown.
         In this case, none of the other parameters are used.
 
         If <world> is False, pass the other arguments directly to the superclass
         constructor. Do NOT load new data from the World Bank files.
         """
         if world:
-            region_trees = _load_data()
+            dataset = load_dataset()
+            self.years = dataset.years
+            self.position = len(self.years) - 1
+            region_trees, self._series = _load_data(dataset, self.position)
             AbstractTree.__init__(self, 'World', region_trees)
         else:
             if subtrees is None:
@@ -85,31 +153,125 @@ class PopulationTree(AbstractTree):
         """
         return " -> "
 
+    def show_year(self: PopulationTree, position: float) -> None:
+        """Show the year at <position> in years: set the data_size of every
+        country to its population in that year, and update the sizes of the
+        regions and the world to match.
+
+        If <position> is between two years, each population is interpolated
+        linearly between its values in those years (and rounded). Countries
+        that have been deleted stay deleted.
 
-def _load_data() -> List[PopulationTree]:
-    """Create a list of trees corresponding to different world regions.
+        Precondition: this tree is the root of the population tree, and
+        0 <= position <= len(self.years) - 1.
+        """
+        self.position = position
+        for leaf, values in self._series:
+            if not leaf.is_empty():
+                size = _value_at(values, position)
+                if size != leaf.data_size:
+                    leaf.set_size(size)
+
+    def year_label(self: PopulationTree) -> str:
+        """Return the year shown, or the last year passed while moving
+        between two years."""
+        if not self.years:
+            return ''
+        return self.years[int(self.position)]
+
+
+def load_dataset(populations: str = WORLD_BANK_POPULATIONS,
+                 regions: str = WORLD_BANK_REGIONS,
+                 cache: Optional[str] = POPULATION_CACHE) \
+        -> PopulationDataset:
+    """Return the dataset compiled from the World Bank files <populations>
+    and <regions>.
+
+    The dataset is read from the file <cache> if it was compiled from the
+    current versions of both files; otherwise it is compiled now and saved
+    to <cache>. If <cache> is None, the dataset is always compiled and not
+    saved.
+    """
+    sources = [_source_stamp(populations), _source_stamp(regions)]
+    if cache is not None:
+        try:
+            with open(cache, encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] == CACHE_VERSION and \
+                    data['sources'] == sources:
+                return PopulationDataset(data['years'], data['regions'],
+                                         data['values'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # missing, unreadable or stale: compile it again
+
+    years, values = _get_population_series(populations)
+    dataset = PopulationDataset(years, {}, values)
+    for region, countries in _get_region_data(regions).items():
+        countries = [country for country in countries if country in values]
+        if countries:
+            dataset.regions[region] = countries
+
+    if cache is not None:
+        data = {'version': CACHE_VERSION, 'sources': sources,
+                'years': dataset.years, 'regions': dataset.regions,
+                'values': dataset.values}
+        temporary = cache + '.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temporary, cache)
+        except OSError:
+            pass  # e.g. a read-only folder; the cache is only an optimisation
+    return dataset
+
+
+def _source_stamp(fname: str) -> List[object]:
+    """Return what the cache records about the source file <fname>: its
+    name, modification time (in nanoseconds) and size."""
+    info = os.stat(fname)
+    return [fname, info.st_mtime_ns, info.st_size]
+
+
+def _value_at(values: List[int], position: float) -> int:
+    """Return the value at <position> in <values>, interpolated linearly
+    between the two nearest values if <position> is not a whole number."""
+    i = int(position)
+    fraction = position - i
+    if fraction == 0 or i + 1 >= len(values):
+        return values[i]
+    return round(values[i] + (values[i + 1] - values[i]) * fraction)
+
+
+def _load_data(dataset: PopulationDataset, position: float) \
+        -> Tuple[List[PopulationTree],
+                 List[Tuple[PopulationTree, List[int]]]]:
+    """Create a list of trees corresponding to different world regions,
+    showing the year at <position> in the years of <dataset>.
 
     Each tree consists of a root node -- the region -- attached to one or
     more leaves -- the countries in that region.
-    """
-    # Get data from World Bank files.
-    country_populations = _get_population_data()
-    regions = _get_region_data()
 
+    Also return each country leaf with its population in each year.
+
+    Unlike a tree built from one year, a country with no data in the year
+    shown (and a region with no such country) is kept, with a size of 0,
+    so that show_year can give it a size when another year is shown. A tree
+    of size 0 is not drawn by generate_treemap, so find_rect never selects
+    it.
+    """
     region_subtrees = []
+    series = []
 
-    for region in regions:
+    for region, countries in dataset.regions.items():
         subtrees = []
-        for i in regions[region]:
-            if i in country_populations:
-                subtrees.append(PopulationTree(False, i, [],
-                                               country_populations[i]))
-
-        x = PopulationTree(False, region, subtrees)
-        if x.data_size != 0:
-            region_subtrees.append(x)
+        for i in countries:
+            values = dataset.values[i]
+            leaf = PopulationTree(False, i, [], _value_at(values, position))
+            subtrees.append(leaf)
+            series.append((leaf, values))
+        region_subtrees.append(PopulationTree(False, region, subtrees))
 
-    return region_subtrees
+    return region_subtrees, series
 
     # Be sure to read the docstring of the PopulationTree constructor to see
     # how to call it.
@@ -121,35 +283,41 @@ def _load_data() -> List[PopulationTree]:
     #   - zero or more leaves, each representing a country in the region
 
 
-def _get_population_data() -> Dict[str, int]:
-    """Return country population data from the World Bank.
-
-    The return value is a dictionary, where the keys are country names,
-    and the values are the corresponding populations of those countries.
+def _get_population_series(fname: str = WORLD_BANK_POPULATIONS) \
+        -> Tuple[List[str], Dict[str, List[int]]]:
+    """Return the years with population data in the World Bank file
+    <fname>, oldest first, and the population of each country in each of
+    those years, 0 where there is no data.
 
     Ignore all countries that do not have any population data,
     or population data that cannot be read as an int.
     """
-    # We are doing some pre-processing of the data for you.
     # The first element returned is ignored because it's just metadata.
-    # The second element's first 47 elements are ignored because they aren't
+    # The second element lists each country's years together, and its first
+    # AGGREGATE_COUNTRIES countries are ignored because they aren't
     # countries.
-    _, population_data = _get_json_data(WORLD_BANK_POPULATIONS)
-    population_data = population_data[47:]
-
-    # The following line is a good place to put a breakpoint, so that you can
-    # pause the program and use the debugger to inspect the contents of
-    # population_data.
-    countries = {}
-
+    _, population_data = _get_json_data(fname)
+    names = list(dict.fromkeys(data['country']['value']
+                               for data in population_data))
+    aggregates = set(names[:AGGREGATE_COUNTRIES])
+    years = sorted({data['date'] for data in population_data})
+    year_index = {year: i for i, year in enumerate(years)}
+
+    series = {}
     for data in population_data:
-        if isinstance(data['value'], int) and data['value'] != 0:
-            countries[data['country']['value']] = data['value']
+        country = data['country']['value']
+        if country in aggregates or not isinstance(data['value'], int) or \
+                data['value'] == 0:
+            continue
+        if country not in series:
+            series[country] = [0] * len(years)
+        series[country][year_index[data['date']]] = data['value']
 
-    return countries
+    return years, series
 
 
-def _get_region_data() -> Dict[str, List[str]]:
+def _get_region_data(fname: str = WORLD_BANK_REGIONS) \
+        -> Dict[str, List[str]]:
     """Return country region data from the World Bank.
 
     The return value is a dictionary, where the keys are region names,
@@ -158,7 +326,7 @@ def _get_region_data() -> Dict[str, List[str]]:
     Ignore all regions that do not contain any countries.
     """
     # We ignore the first component of the returned JSON, which is metadata.
-    _, country_data = _get_json_data(WORLD_BANK_REGIONS)
+    _, country_data = _get_json_data(fname)
 
     # The following line is a good place to put a breakpoint to help inspect
     # the contents of country_data.
@@ -178,17 +346,14 @@ def _get_region_data() -> Dict[str, List[str]]:
 
 
 def _get_json_data(fname: str) -> dict:
-    """Return a dictionary representing the JSON data from file fname.
-
-    You should not modify this function.
-    """
-    f = open(fname)
-    return json.loads(f.read())
+    """Return a dictionary representing the JSON data from file fname."""
+    with open(fname) as f:
+        return json.load(f)
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
-            'allowed-io': ['_get_json_data'],
-            'extra-imports': ['json', 'tree_data']})
+            'allowed-io': ['_get_json_data', 'load_dataset'],
+            'extra-imports': ['json', 'os', 'tree_data']})
@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import population
+from population import PopulationDataset, PopulationTree, _load_data, \
+    load_dataset
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+POPULATIONS = os.path.join(HERE, 'populations.json')
+REGIONS = os.path.join(HERE, 'regions.json')
+
+
+def test_cache_is_next_to_module() -> None:
+    assert population.POPULATION_CACHE == \
+        os.path.join(HERE, 'populations.cache')
+
+
+def test_cached_dataset_matches_compiled(tmp_path) -> None:
+    cache = str(tmp_path / 'populations.cache')
+    compiled = load_dataset(POPULATIONS, REGIONS, None)
+    first = load_dataset(POPULATIONS, REGIONS, cache)
+    assert os.path.exists(cache)
+    cached = load_dataset(POPULATIONS, REGIONS, cache)
+    for dataset in (first, cached):
+        assert dataset.years == compiled.years
+        assert dataset.regions == compiled.regions
+        assert dataset.values == compiled.values
+
+
+def test_cache_recompiled_when_source_changes(tmp_path) -> None:
+    regions = str(tmp_path / 'regions.json')
+    shutil.copy(REGIONS, regions)
+    cache = str(tmp_path / 'populations.cache')
+    before = load_dataset(POPULATIONS, regions, cache)
+    with open(regions, 'w') as f:
+        f.write('[{}, []]')
+    after = load_dataset(POPULATIONS, regions, cache)
+    assert before.regions and not after.regions
+
+
+def test_show_year_sizes() -> None:
+    tree = PopulationTree(True)
+    dataset = load_dataset(POPULATIONS, REGIONS, None)
+    tree.show_year(0)
+    assert tree.year_label() == dataset.years[0]
+    for region in tree._subtrees:
+        for country in region._subtrees:
+            assert country.data_size == dataset.values[country._root][0]
+        assert region.data_size == \
+            sum(c.data_size for c in region._subtrees)
+    assert tree.data_size == sum(r.data_size for r in tree._subtrees)
+
+
+def test_show_year_between_years() -> None:
+    dataset = PopulationDataset(['2000', '2001'], {'R': ['a', 'b']},
+                                {'a': [10, 20], 'b': [5, 1]})
+    regions, series = _load_data(dataset, 0)
+    tree = PopulationTree(False, 'World', regions)
+    tree.years, tree._series = dataset.years, series
+    tree.show_year(0.5)
+    assert [leaf.data_size for leaf, _ in series] == [15, 3]
+    assert tree.data_size == 18
+    tree.show_year(1)
+    assert tree.year_label() == '2001'
+    assert tree.data_size == 21
+
+
+def test_countries_without_data_hidden_until_shown() -> None:
+    dataset = PopulationDataset(['2000', '2001'],
+                                {'R': ['a', 'b'], 'S': ['c']},
+                                {'a': [10, 20], 'b': [5, 0], 'c': [7, 0]})
+    regions, series = _load_data(dataset, 1)
+    tree = PopulationTree(False, 'World', regions)
+    tree.years, tree._series = dataset.years, series
+    rect = (0, 0, 100, 100)
+    output = tree.generate_treemap(rect)
+    assert tree._layout_leaves == [series[0][0]]
+    assert output == [(rect, series[0][0].colour)]
+    assert all(tree.find_rect((x, y)) is series[0][0]
+               for x in (0, 50, 100) for y in (0, 50, 100))
+    tree.show_year(0)
+    tree.generate_treemap(rect)
+    assert [leaf._root for leaf in tree._layout_leaves] == ['a', 'b', 'c']
+    assert tree.data_size == 22
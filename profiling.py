@@ -0,0 +1,142 @@
+"""Profiling Hooks
+
+=== Module Description ===
+This module contains Profiler, which collects per-phase timings and counters
+from the layout, hit-testing, rendering and event handling code while the
+visualiser runs.
+
+Instrumentation is off unless a profiler is enabled with enable(). The
+instrumented code only checks whether the module variable <current> is None,
+once per call of the instrumented function, so it costs next to nothing
+when profiling is off.
+
+The time of every phase is added to the frame being drawn; end_frame closes
+the frame, and the breakdown of the last complete frame can be read with
+last_frame or shown with frame_summary. Every timed phase is also kept as a
+trace event, and dump_trace writes the events in the Chrome trace event
+format, which chrome://tracing and Perfetto can display.
+"""
+
+from __future__ import annotations
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# The number of complete frames, and of trace events, that are kept.
+MAX_FRAMES = 1000
+MAX_EVENTS = 100000
+
+
+class Profiler:
+    """Timings and counters of the instrumented phases of the visualiser.
+
+    === Public Attributes ===
+    totals: the total seconds spent in each phase.
+    counters: the running total of each counter, e.g. 'rectangles' (emitted
+        by layouts), 'visited' (trees laid out rather than copied from the
+        previous layout) and 'frames' (frames drawn).
+    frames: the most recent complete frames, oldest first. Each frame maps
+        phase names to seconds (floats) and counter names to counts (ints).
+
+    === Private Attributes ===
+    _frame: the phases and counters of the frame being drawn.
+    _events: the most recent trace events, as (name, start, seconds) tuples
+        with start in perf_counter seconds.
+    _origin: the perf_counter time this profiler was created.
+    """
+    totals: Dict[str, float]
+    counters: Dict[str, int]
+    frames: Deque[Dict[str, float]]
+    _frame: Dict[str, float]
+    _events: Deque[Tuple[str, float, float]]
+    _origin: float
+
+    def __init__(self: Profiler) -> None:
+        """Initialize a profiler with no recorded phases."""
+        self.totals = {}
+        self.counters = {}
+        self.frames = deque(maxlen=MAX_FRAMES)
+        self._frame = {}
+        self._events = deque(maxlen=MAX_EVENTS)
+        self._origin = time.perf_counter()
+
+    def record(self: Profiler, phase: str, start: float,
+               **counts: int) -> None:
+        """Record that <phase> ran from the perf_counter time <start> until
+        now, and add <counts> to the counters."""
+        seconds = time.perf_counter() - start
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+        self._frame[phase] = self._frame.get(phase, 0.0) + seconds
+        self._events.append((phase, start, seconds))
+        self.count(**counts)
+
+    def count(self: Profiler, **counts: int) -> None:
+        """Add <counts> to the counters and to the frame being drawn."""
+        for name, value in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+            self._frame[name] = self._frame.get(name, 0) + value
+
+    def end_frame(self: Profiler) -> None:
+        """Close the frame being drawn, and start a new one."""
+        self.count(frames=1)
+        self.frames.append(self._frame)
+        self._frame = {}
+
+    def last_frame(self: Profiler) -> Dict[str, float]:
+        """Return the phases and counters of the last complete frame."""
+        return self.frames[-1] if self.frames else {}
+
+    def frame_summary(self: Profiler) -> str:
+        """Return a one-line description of the last complete frame: the
+        milliseconds spent in each phase, then its counters."""
+        frame = self.last_frame()
+        # Phase times are floats, and counters are ints.
+        parts = ['{} {:.1f}ms'.format(name, 1000 * value)
+                 for name, value in frame.items() if isinstance(value, float)]
+        parts.extend('{} {}'.format(value, name)
+                     for name, value in frame.items()
+                     if isinstance(value, int) and name != 'frames')
+        return '  '.join(parts)
+
+    def dump_trace(self: Profiler, fname: str) -> None:
+        """Write the recorded phases to <fname> in the Chrome trace event
+        format."""
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': 0,
+                   'ts': (start - self._origin) * 1e6, 'dur': seconds * 1e6}
+                  for name, start, seconds in self._events]
+        with open(fname, 'w') as file:
+            json.dump({'traceEvents': events,
+                       'otherData': {'totals': self.totals,
+                                     'counters': self.counters}}, file)
+
+
+# The enabled profiler, or None if profiling is off.
+current: Optional[Profiler] = None
+
+
+def enable() -> Profiler:
+    """Turn profiling on, and return the profiler collecting the data. If
+    profiling is already on, return the profiler already in use."""
+    global current
+    if current is None:
+        current = Profiler()
+    return current
+
+
+def disable() -> Optional[Profiler]:
+    """Turn profiling off, and return the profiler that was in use, if
+    any."""
+    global current
+    profiler, current = current, None
+    return profiler
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'extra-imports': ['json', 'os', 'time', 'collections']})
@@ -0,0 +1,77 @@
+import json
+import os
+import time
+
+import pygame
+
+import profiling
+from benchmarks import RECT, make_tree
+from treemap_visualiser import HEIGHT, WIDTH, TreemapRenderer
+
+
+def iter_nodes(tree):
+    """Yield every node of <tree>."""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node._subtrees)
+
+
+def test_enable_and_disable() -> None:
+    assert profiling.current is None
+    profiler = profiling.enable()
+    try:
+        assert profiling.enable() is profiler
+        tree = make_tree('balanced', 1000)
+        tree.generate_treemap(RECT)
+        tree.find_rect((10, 10))
+        assert profiler.counters['rectangles'] == 1000
+        assert profiler.counters['visited'] == len(list(iter_nodes(tree)))
+        assert set(profiler.totals) == {'layout', 'hit_test'}
+    finally:
+        assert profiling.disable() is profiler
+    assert profiling.current is None and profiling.disable() is None
+    tree.generate_treemap((0, 0, 10, 10))
+    assert profiler.counters['rectangles'] == 1000
+
+
+def test_frames_and_summary() -> None:
+    profiler = profiling.Profiler()
+    assert profiler.last_frame() == {} and profiler.frame_summary() == ''
+    profiler.record('layout', time.perf_counter(), rectangles=7)
+    profiler.record('draw', time.perf_counter())
+    profiler.record('layout', time.perf_counter(), rectangles=3)
+    profiler.end_frame()
+    frame = profiler.last_frame()
+    assert frame['rectangles'] == 10 and frame['frames'] == 1
+    assert list(frame)[:2] == ['layout', 'rectangles']
+    summary = profiler.frame_summary()
+    assert summary.startswith('layout ') and '10 rectangles' in summary
+    assert 'frames' not in summary
+    profiler.end_frame()
+    assert profiler.last_frame() == {'frames': 1}
+    assert profiler.counters == {'rectangles': 10, 'frames': 2}
+
+
+def test_render_phases_and_trace(tmp_path) -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    renderer = TreemapRenderer(pygame.display.set_mode((WIDTH, HEIGHT)))
+    renderer.show_hud = True
+    profiler = profiling.enable()
+    try:
+        for _ in range(3):
+            renderer.render(make_tree('wide', 50), 'text')
+    finally:
+        profiling.disable()
+    assert len(profiler.frames) == 3
+    assert {'layout', 'draw', 'text', 'present'} <= set(profiler.last_frame())
+    fname = str(tmp_path / 'trace.json')
+    profiler.dump_trace(fname)
+    with open(fname) as file:
+        trace = json.load(file)
+    assert len(trace['traceEvents']) == 12
+    assert all(event['ph'] == 'X' and event['dur'] >= 0
+               for event in trace['traceEvents'])
+    assert trace['otherData']['counters']['frames'] == 3
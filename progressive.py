@@ -0,0 +1,217 @@
+"""Progressive Scanning
+
+=== Module Description ===
+This module contains ProgressiveScan, which scans a folder on a background
+thread and publishes partial FileSystemTrees while the scan is running, so
+that the visualiser can show the folder before the scan has finished.
+
+Each partial tree is built from the directories listed so far, with the
+directories still waiting to be listed built as empty folders, so every
+published tree is a complete, consistent FileSystemTree: the data_size of
+every folder is the sum of the data_sizes of its subtrees. Published trees
+are never changed afterwards; each one is a new tree, in which every file
+and folder that was in the previous tree keeps its colour, so that the
+treemap does not flicker as it grows.
+
+The first partial tree is published FIRST_PUBLISH seconds after the scan
+starts (or when it finishes, if that is sooner), when a useful part of
+the folder has usually been listed. Building a partial tree takes time
+proportional to the directories listed so far, so later trees are published
+at most every PUBLISH_INTERVAL seconds, and never more often than every
+BUILD_FACTOR times the time the last build took, which keeps the building
+to a small share of the scan.
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Optional
+
+from scanner import DEFAULT_WORKERS, Scanner
+from tree_data import FileSystemTree
+
+# The time, in seconds, from the start of the scan to the first published
+# tree, and the shortest time between two published partial trees.
+FIRST_PUBLISH = 0.1
+PUBLISH_INTERVAL = 0.25
+
+# The time between publications is at least this many times the time the
+# last partial tree took to build.
+BUILD_FACTOR = 4
+
+
+class _Cancelled(Exception):
+    """Raised inside the scanning thread to stop a cancelled scan."""
+
+
+class ProgressiveScan:
+    """A scan of a folder running on a background thread.
+
+    === Public Attributes ===
+    path: the absolute path of the folder being scanned.
+    done: True once the scan has finished and its final tree has been
+        published, or the scan has failed or been cancelled.
+    error: the exception that ended the scan, or None.
+    published: the number of trees published so far.
+
+    === Private Attributes ===
+    _scanner: the scanner walking the folder.
+    _thread: the thread running the scan.
+    _latest: the most recently published tree, or None if it has already
+        been returned by poll.
+    _cancelled: True if cancel has been called.
+    _next_publish: the perf_counter time after which the next partial tree
+        may be published.
+    _final: the tree of the finished scan, or None.
+    _previous: the most recently published tree, whose colours the next
+        tree keeps.
+    _ready: set while a published tree has not been returned by poll, or
+        once the scan is done.
+    """
+    path: str
+    done: bool
+    error: Optional[BaseException]
+    published: int
+    _scanner: Scanner
+    _thread: threading.Thread
+    _latest: Optional[FileSystemTree]
+    _cancelled: bool
+    _next_publish: float
+    _final: Optional[FileSystemTree]
+    _previous: Optional[FileSystemTree]
+    _ready: threading.Event
+
+    def __init__(self: ProgressiveScan, path: str,
+                 workers: int = DEFAULT_WORKERS,
+                 follow_symlinks: bool = True,
+                 one_filesystem: bool = False) -> None:
+        """Start scanning the folder <path> on <workers> threads.
+        <follow_symlinks> and <one_filesystem> are as in scanner.Scanner.
+
+        Precondition: <path> is a valid path to a folder on this computer.
+        """
+        self.path = os.path.abspath(path)
+        self.done = False
+        self.error = None
+        self.published = 0
+        self._scanner = Scanner(workers, follow_symlinks=follow_symlinks,
+                                one_filesystem=one_filesystem)
+        self._latest = None
+        self._cancelled = False
+        self._next_publish = 0.0
+        self._final = None
+        self._previous = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def poll(self: ProgressiveScan) -> Optional[FileSystemTree]:
+        """Return the most recently published tree, or None if no tree has
+        been published since the last call."""
+        self._ready.clear()
+        tree, self._latest = self._latest, None
+        if self.done:
+            self._ready.set()
+        return tree
+
+    def next_tree(self: ProgressiveScan) -> Optional[FileSystemTree]:
+        """Wait until a tree is published or the scan is done, and return
+        the result of poll.
+
+        Raise the exception that ended the scan if it failed before any tree
+        was published.
+        """
+        while True:
+            self._ready.wait()
+            done = self.done
+            tree = self.poll()
+            if tree is not None or done:
+                break
+        if tree is None and self.error is not None and not self.published:
+            raise self.error
+        return tree
+
+    def wait(self: ProgressiveScan,
+             timeout: Optional[float] = None) -> Optional[FileSystemTree]:
+        """Wait up to <timeout> seconds (or for ever) for the scan to finish,
+        and return the final tree, or None if the scan has not finished,
+        failed or was cancelled before it finished."""
+        self._thread.join(timeout)
+        return self._final
+
+    def cancel(self: ProgressiveScan) -> None:
+        """Stop the scan as soon as possible. No more trees are published."""
+        self._cancelled = True
+
+    def _run(self: ProgressiveScan) -> None:
+        """Run the scan, publishing partial trees and then the final one."""
+        self._next_publish = time.perf_counter() + FIRST_PUBLISH
+        try:
+            self._scanner.walk(self.path, self._progress)
+            tree = self._build()
+            tree.scan_stats = self._scanner.stats
+            tree.index_aggregates()
+            tree.index_attributes()
+            self._final = tree
+            self._publish(tree)
+        except _Cancelled:
+            pass
+        except Exception as error:  # reported through <error>
+            self.error = error
+        finally:
+            self.done = True
+            self._ready.set()
+
+    def _progress(self: ProgressiveScan, scanner: Scanner) -> None:
+        """Publish a partial tree if it is time to, or stop the scan if it
+        was cancelled."""
+        if self._cancelled:
+            raise _Cancelled()
+        now = time.perf_counter()
+        if now < self._next_publish:
+            return
+        self._publish(self._build())
+        built = time.perf_counter()
+        self._next_publish = built + max(PUBLISH_INTERVAL,
+                                         BUILD_FACTOR * (built - now))
+
+    def _build(self: ProgressiveScan) -> FileSystemTree:
+        """Return the tree of the directories listed so far."""
+        tree = self._scanner.build(self.path, FileSystemTree._make_node)
+        tree._path = self.path
+        if self._previous is not None:
+            _keep_colours(self._previous, tree)
+        return tree
+
+    def _publish(self: ProgressiveScan, tree: FileSystemTree) -> None:
+        """Make <tree> the tree returned by the next poll."""
+        if not self._cancelled:
+            self._previous = tree
+            self._latest = tree
+            self.published += 1
+            self._ready.set()
+
+
+def _keep_colours(old: FileSystemTree, new: FileSystemTree) -> None:
+    """Give every node of <new> the colour of the node with the same path
+    in <old>, if there is one."""
+    stack = [(old, new)]
+    while stack:
+        old, new = stack.pop()
+        new.colour = old.colour
+        if old._subtrees and new._subtrees:
+            by_name = {subtree._root: subtree for subtree in old._subtrees}
+            for subtree in new._subtrees:
+                match = by_name.get(subtree._root)
+                if match is not None:
+                    stack.append((match, subtree))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'extra-imports': ['os', 'threading', 'time', 'scanner',
+                              'tree_data']})
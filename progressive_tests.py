@@ -0,0 +1,66 @@
+import pytest
+
+import progressive
+from benchmarks import make_directory_tree
+from progressive import ProgressiveScan
+from tree_data import FileSystemTree
+
+
+def nodes(tree) -> dict:
+    """Return the colour of every node of <tree> by path, checking that the
+    size of every folder is the sum of the sizes of its subtrees."""
+    result = {}
+    stack = [(tree, '')]
+    while stack:
+        node, path = stack.pop()
+        path = path + '/' + str(node._root)
+        result[path] = (node.colour, node.data_size)
+        if node._subtrees:
+            assert node.data_size == sum(sub.data_size
+                                         for sub in node._subtrees)
+        stack.extend((sub, path) for sub in node._subtrees)
+    return result
+
+
+def test_partial_trees_grow_to_the_full_tree(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(progressive, 'FIRST_PUBLISH', 0.0)
+    monkeypatch.setattr(progressive, 'PUBLISH_INTERVAL', 0.0)
+    monkeypatch.setattr(progressive, 'BUILD_FACTOR', 0)
+    make_directory_tree(str(tmp_path), 500, fanout=5)
+    scan = ProgressiveScan(str(tmp_path), workers=1)
+    trees = []
+    tree = scan.next_tree()
+    while tree is not None:
+        trees.append(tree)
+        tree = scan.next_tree()
+    assert scan.done and scan.error is None
+    # poll only returns the newest tree, so some may have been skipped.
+    assert 1 < len(trees) <= scan.published
+    previous = {}
+    for tree in trees:
+        current = nodes(tree)
+        for path, (colour, _) in current.items():
+            if path in previous:
+                assert previous[path][0] == colour
+        previous = current
+    final = scan.wait()
+    assert final is trees[-1]
+    expected = nodes(FileSystemTree(str(tmp_path)))
+    assert {path: size for path, (_, size) in previous.items()} == \
+        {path: size for path, (_, size) in expected.items()}
+    assert final.scan_stats.files == 500
+
+
+def test_cancel(tmp_path) -> None:
+    make_directory_tree(str(tmp_path), 3000, fanout=5)
+    scan = ProgressiveScan(str(tmp_path), workers=1)
+    scan.cancel()
+    assert scan.wait() is None
+    assert scan.done and scan.error is None
+
+
+def test_failed_scan_raises() -> None:
+    scan = ProgressiveScan('/no/such/folder/here')
+    with pytest.raises(FileNotFoundError):
+        scan.next_tree()
+    assert scan.done and scan.wait() is None
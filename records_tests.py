@@ -0,0 +1,54 @@
+import io
+
+from records import RecordTree, REMAINDER_NAME, iter_records, read_csv, \
+    read_du, read_jsonl, write_csv, write_jsonl
+
+
+def sample_tree() -> RecordTree:
+    """Return a small tree with a deleted leaf."""
+    gone = RecordTree('gone', [], 9)
+    tree = RecordTree('top', [
+        RecordTree('a', [RecordTree('x.txt', [], 3),
+                         RecordTree('y.py', [], 4), gone]),
+        RecordTree('b', [], 5)])
+    gone.delete()
+    return tree
+
+
+def test_jsonl_round_trip(tmp_path) -> None:
+    fname = str(tmp_path / 'tree.jsonl')
+    tree = sample_tree()
+    assert write_jsonl(tree, fname) == 5
+    assert list(iter_records(read_jsonl(fname))) == list(iter_records(tree))
+
+
+def test_csv_round_trip(tmp_path) -> None:
+    fname = str(tmp_path / 'tree.csv')
+    tree = sample_tree()
+    assert write_csv(tree, fname) == 5
+    assert list(iter_records(read_csv(fname))) == list(iter_records(tree))
+
+
+def test_jsonl_blank_lines() -> None:
+    text = '{"path": "r/a", "size": 3}\n\n   \n{"path": "r/b", "size": 4}\n\n'
+    tree = read_jsonl(io.StringIO(text))
+    assert list(iter_records(tree)) == [('r', 7, 0), ('r/a', 3, 1),
+                                        ('r/b', 4, 1)]
+
+
+def test_du_postorder_with_remainder() -> None:
+    text = '4\t/usr/lib/a\n\n2\t/usr/lib/b/c\n10\t/usr/lib/b\n20\t/usr/lib\n'
+    tree = read_du(io.StringIO(text))
+    assert tree._root == 'lib'
+    assert tree.data_size == 20
+    b = tree._subtrees[1]
+    assert [child._root for child in b._subtrees] == ['c', REMAINDER_NAME]
+    assert b.data_size == 10
+
+
+def test_records_in_any_order() -> None:
+    rows = ['{"path": "r/b/y", "size": 2}', '{"path": "r/a", "size": 1}',
+            '{"path": "r/b/x", "size": 5}']
+    tree = read_jsonl(io.StringIO('\n'.join(rows)))
+    assert tree.data_size == 8
+    assert [child.data_size for child in tree._subtrees] == [7, 1]
@@ -0,0 +1,612 @@
+"""Filesystem Scanner for FileSystemTree
+
+=== Module Description ===
+This module contains the scanning engine used to build a FileSystemTree.
+
+Directories are listed with os.scandir, so the type and stat information of
+every entry comes from the DirEntry objects instead of separate calls to
+os.path.isdir and os.path.getsize. The walk uses an explicit work queue
+rather than recursion (deep trees never hit the recursion limit), and the
+directory listings are spread across a pool of worker threads.
+
+The tree is assembled bottom-up once every directory has been listed, and is
+identical to the tree the original recursive FileSystemTree constructor built:
+same names, same sizes, children in os.listdir order, except that files
+with several hard links are only counted once (see below).
+
+A scanner can also be limited to a maximum depth. Directories below that
+depth are not listed into the tree; each is given a size instead, either by
+a size-only walk of its contents (no entries are kept, so this is much
+cheaper than a full scan) or by an estimate made from its own listing.
+
+Files and directories are identified by (st_dev, st_ino). By default a
+file with several hard links is counted once, at the first link found (the
+others get size 0), and a directory reached a second time, through a
+symbolic link or a bind mount, is not listed again, so loops end. A
+scanner can also be told not to follow symbolic links, which are then
+counted as files of their own size, and to stay on the filesystems of the
+directories it was started from. With both, the total size of a tree is
+what du -sbx reports, less the sizes of the directories themselves.
+
+scan_roots scans several roots in one run, and returns their trees. When
+the scan stays on one filesystem, the roots are sharded across worker
+processes, one per device.
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, \
+    Set, Tuple
+
+# The default number of threads used to list directories.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# One listed entry of a directory: (name, is_dir, size, mtime).
+# The size and mtime of a directory entry are always 0; they are filled in
+# from the directory's own listing when the tree is built.
+Entry = Tuple[str, bool, int, float]
+
+# The listing of one directory: (mtime of the directory, its entries).
+Listing = Tuple[float, List[Entry]]
+
+_EMPTY = (0.0, [])
+
+
+class ScanStats:
+    """Counters describing a single scan.
+
+    === Public Attributes ===
+    files: the number of regular files (leaves) found.
+    dirs: the number of directories found.
+    listed: the number of directories actually listed from disk; this is
+        less than dirs when listings were reused from a snapshot.
+    unscanned: the number of directories below the maximum depth of the
+        scan, which were only sized and are not part of dirs.
+    estimated: True if the sizes of those directories are estimates.
+    links: the number of hard links to files already counted, which were
+        given size 0.
+    duplicates: the number of directories not listed because they had
+        already been listed under another path.
+    other_devices: the number of directories not listed because they are
+        on another filesystem.
+    seconds: the wall-clock time the scan took.
+    load_seconds: the time spent loading a snapshot before the scan.
+    """
+    files: int
+    dirs: int
+    listed: int
+    unscanned: int
+    estimated: bool
+    links: int
+    duplicates: int
+    other_devices: int
+    seconds: float
+    load_seconds: float
+
+    def __init__(self: ScanStats) -> None:
+        """Initialize an empty set of counters."""
+        self.files = 0
+        self.dirs = 0
+        self.listed = 0
+        self.unscanned = 0
+        self.estimated = False
+        self.links = 0
+        self.duplicates = 0
+        self.other_devices = 0
+        self.seconds = 0.0
+        self.load_seconds = 0.0
+
+    def add(self: ScanStats, other: ScanStats) -> None:
+        """Add the counts of <other>, a scan of other directories, to these
+        counters. The times are not added."""
+        self.files += other.files
+        self.dirs += other.dirs
+        self.listed += other.listed
+        self.unscanned += other.unscanned
+        self.estimated = self.estimated or other.estimated
+        self.links += other.links
+        self.duplicates += other.duplicates
+        self.other_devices += other.other_devices
+
+    def files_per_second(self: ScanStats) -> float:
+        """Return the scan throughput in files per second."""
+        if self.seconds <= 0:
+            return 0.0
+        return self.files / self.seconds
+
+    def __str__(self: ScanStats) -> str:
+        text = '{} files, {} dirs in {:.3f}s ({:.0f} files/s)'.format(
+            self.files, self.dirs, self.seconds, self.files_per_second())
+        if self.listed != self.dirs:
+            text += ', {} dirs rescanned'.format(self.listed)
+        if self.unscanned:
+            text += ', {} dirs not scanned (sizes {})'.format(
+                self.unscanned,
+                'estimated' if self.estimated else 'aggregated')
+        if self.links:
+            text += ', {} hard links counted once'.format(self.links)
+        if self.duplicates:
+            text += ', {} dirs seen twice'.format(self.duplicates)
+        if self.other_devices:
+            text += ', {} dirs on other filesystems'.format(
+                self.other_devices)
+        if self.load_seconds:
+            text += ', snapshot loaded in {:.3f}s'.format(self.load_seconds)
+        return text
+
+
+def list_directory(path: str) -> Listing:
+    """Return the mtime of the directory <path> and its entries in
+    os.listdir order.
+
+    The stat result cached on each DirEntry is reused, so a regular file costs
+    at most one stat call and a directory usually costs none. A symbolic link
+    whose target does not exist is counted as a file of its own size.
+    """
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                entries.append((entry.name, True, 0, 0.0))
+            else:
+                st = _stat_entry(entry, True)
+                entries.append((entry.name, False, st.st_size, st.st_mtime))
+    return os.stat(path).st_mtime, entries
+
+
+def _stat_entry(entry: os.DirEntry, follow_symlinks: bool) -> os.stat_result:
+    """Return the stat result of <entry>, or of the link itself if it is a
+    symbolic link whose target cannot be read."""
+    try:
+        return entry.stat(follow_symlinks=follow_symlinks)
+    except OSError:
+        return entry.stat(follow_symlinks=False)
+
+
+class Scanner:
+    """A breadth-first, multi-threaded directory walker.
+
+    The walk keeps a queue of directories still to be listed and hands them
+    to a thread pool; every finished listing adds its subdirectories to the
+    queue. The result of a walk is the <listings> dictionary, mapping each
+    directory path to its entries.
+
+    Unless dedup is False, files and directories already found are not
+    counted again, as described above; unless follow_symlinks is True,
+    symbolic links are not followed; and if one_filesystem is True, only
+    directories on the same filesystem as a walked directory are listed.
+
+    If max_depth is set, only directories up to that many levels below the
+    walked directory are listed. Each deeper directory the walk finds is
+    recorded in <unscanned> with its size instead: the total size of its
+    files, from directory_size, or if <estimate> is True, an estimate from
+    its own listing, with each of its subdirectories counted as the mean
+    size of the files directly in a listed directory.
+
+    === Public Attributes ===
+    workers: the number of threads used to list directories.
+    max_depth: the deepest level of directories that is listed, where the
+        walked directory is level 0, or None for no limit.
+    estimate: True if unscanned directories get estimated sizes.
+    follow_symlinks: True if symbolic links to directories are listed, and
+        links to files are counted at the size of their target.
+    one_filesystem: True if only directories on the filesystems of the
+        walked directories are listed.
+    dedup: True if hard links and directories reached twice are counted
+        once.
+    stats: counters for the most recent walk.
+    listings: the listing of every directory found by the most recent walk.
+    unscanned: the size of every directory found below max_depth by the
+        most recent walk.
+    links: the names of the files with more than one link found in each
+        directory by the most recent walk, if it used dedup.
+
+    === Private Attributes ===
+    _reused: the directories of the most recent walk whose listing was not
+        read from disk. Worker threads only ever append to it.
+    _base_depth: the number of separators in the path of the directory
+        being walked, from which the depth of its subdirectories is counted.
+    _seen: the (st_dev, st_ino) of every directory listed or sized, and of
+        every file with more than one link counted, by the most recent walk.
+    _devices: the devices of the walked directories.
+    _lock: the lock worker threads hold while they use _seen or stats.
+    """
+    workers: int
+    max_depth: Optional[int]
+    estimate: bool
+    follow_symlinks: bool
+    one_filesystem: bool
+    dedup: bool
+    stats: ScanStats
+    listings: Dict[str, Listing]
+    unscanned: Dict[str, int]
+    links: Dict[str, Set[str]]
+    _reused: List[str]
+    _base_depth: int
+    _seen: Set[Tuple[int, int]]
+    _devices: Set[int]
+    _lock: threading.Lock
+
+    def __init__(self: Scanner, workers: int = DEFAULT_WORKERS,
+                 max_depth: Optional[int] = None,
+                 estimate: bool = False, follow_symlinks: bool = True,
+                 one_filesystem: bool = False, dedup: bool = True) -> None:
+        """Initialize a scanner that lists directories on <workers> threads,
+        down to <max_depth> levels.
+        """
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.estimate = estimate
+        self.follow_symlinks = follow_symlinks
+        self.one_filesystem = one_filesystem
+        self.dedup = dedup
+        self.stats = ScanStats()
+        self.listings = {}
+        self.unscanned = {}
+        self.links = {}
+        self._reused = []
+        self._base_depth = 0
+        self._seen = set()
+        self._devices = set()
+        self._lock = threading.Lock()
+
+    def list_directory(self: Scanner, path: str) -> Listing:
+        """Return the mtime and entries of the directory <path>.
+
+        Subclasses may override this to list directories differently; the
+        default lists the directory from disk. A directory that is not to
+        be listed, because it was listed before or is on another
+        filesystem, is returned with no entries.
+        """
+        if self.follow_symlinks and not self.one_filesystem and \
+                not self.dedup:
+            return list_directory(path)
+        st = os.stat(path)
+        if self.one_filesystem and st.st_dev not in self._devices:
+            with self._lock:
+                self.stats.other_devices += 1
+            return st.st_mtime, []
+        if self.dedup and not self._first_time((st.st_dev, st.st_ino)):
+            with self._lock:
+                self.stats.duplicates += 1
+            return st.st_mtime, []
+
+        follow = self.follow_symlinks
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=follow):
+                    entries.append((entry.name, True, 0, 0.0))
+                    continue
+                entry_st = _stat_entry(entry, follow)
+                size = entry_st.st_size
+                if self.dedup and entry_st.st_nlink > 1:
+                    size = self._link(path, entry.name, entry_st)
+                entries.append((entry.name, False, size, entry_st.st_mtime))
+        return st.st_mtime, entries
+
+    def _link(self: Scanner, path: str, name: str,
+              st: os.stat_result) -> int:
+        """Record the file <name> in the directory <path>, which has more
+        than one link and the stat result <st>, and return the size it is
+        counted at: its size the first time the file is found in this walk,
+        and 0 after that."""
+        identity = (st.st_dev, st.st_ino)
+        with self._lock:
+            self.links.setdefault(path, set()).add(name)
+            if identity not in self._seen:
+                self._seen.add(identity)
+                return st.st_size
+            self.stats.links += 1
+            return 0
+
+    def _first_time(self: Scanner, identity: Tuple[int, int]) -> bool:
+        """Return True if the file or directory <identity> has not been
+        seen before in this walk, and record that it has now."""
+        with self._lock:
+            if identity in self._seen:
+                return False
+            self._seen.add(identity)
+            return True
+
+    def directory_size(self: Scanner, path: str) -> int:
+        """Return the total size of the regular files below the directory
+        <path>, without building any tree.
+
+        Symbolic links, hard links, directories reached twice and other
+        filesystems are treated as they are by list_directory, and the
+        files and directories found are recorded as seen by this walk, so
+        a loop of symbolic links ends. Directories that cannot be listed
+        are skipped.
+        """
+        follow = self.follow_symlinks
+        total = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                if self.dedup or self.one_filesystem:
+                    st = os.stat(current)
+                    if self.one_filesystem and \
+                            st.st_dev not in self._devices:
+                        continue
+                    if self.dedup and \
+                            not self._first_time((st.st_dev, st.st_ino)):
+                        continue
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=follow):
+                            stack.append(entry.path)
+                            continue
+                        entry_st = _stat_entry(entry, follow)
+                        if self.dedup and entry_st.st_nlink > 1 and \
+                                not self._first_time((entry_st.st_dev,
+                                                      entry_st.st_ino)):
+                            continue
+                        total += entry_st.st_size
+            except OSError:
+                pass
+        return total
+
+    def walk(self: Scanner, path: str,
+             on_progress: Optional[Callable[[Scanner], None]] = None,
+             seen: Iterable[Tuple[int, int]] = ()) -> None:
+        """List every directory below (and including) the directory <path>.
+
+        If <on_progress> is given, it is called with this scanner after each
+        batch of listings has been recorded. The directories and files whose
+        (st_dev, st_ino) is in <seen> have been counted elsewhere, and are
+        treated as already found by this walk.
+        """
+        self.walk_roots([path], on_progress, seen)
+
+    def walk_roots(self: Scanner, paths: Sequence[str],
+                   on_progress: Optional[Callable[[Scanner], None]] = None,
+                   seen: Iterable[Tuple[int, int]] = ()) -> None:
+        """List every directory below (and including) each of the
+        directories <paths>, as one walk, so that a directory or hard link
+        found under several of them is counted once.
+
+        <on_progress> and <seen> are as in walk. A scanner with a max_depth
+        can only walk one directory.
+        """
+        if self.max_depth is not None and len(paths) != 1:
+            raise ValueError('a depth-limited scan has a single root')
+        self.listings = {}
+        self.unscanned = {}
+        self.links = {}
+        self.stats = ScanStats()
+        self._reused = []
+        self._base_depth = paths[0].rstrip(os.sep).count(os.sep)
+        self._seen = set(seen)
+        if self.one_filesystem:
+            self._devices = {os.stat(path).st_dev for path in paths}
+        start = time.perf_counter()
+        if self.workers == 1:
+            queue = list(reversed(paths))
+            while queue:
+                current = queue.pop()
+                self._record(current, self.list_directory(current), queue)
+                if on_progress is not None:
+                    on_progress(self)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = {pool.submit(self.list_directory, path): path
+                           for path in paths}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    queue = []
+                    for future in done:
+                        self._record(pending.pop(future), future.result(),
+                                     queue)
+                    for subdir in queue:
+                        pending[pool.submit(self.list_directory, subdir)] = \
+                            subdir
+                    if on_progress is not None:
+                        on_progress(self)
+        if self.unscanned:
+            self._size_unscanned()
+        self.stats.seconds = time.perf_counter() - start
+        self.stats.listed = self.stats.dirs - len(self._reused)
+
+    def _record(self: Scanner, path: str, listing: Listing,
+                queue: List[str]) -> None:
+        """Record the <listing> of the directory <path>, and add its
+        subdirectories to <queue>.
+        """
+        self.listings[path] = listing
+        self.stats.dirs += 1
+        deep = self.max_depth is not None and \
+            path.count(os.sep) - self._base_depth >= self.max_depth
+        for name, is_dir, _, _ in listing[1]:
+            if not is_dir:
+                self.stats.files += 1
+            elif deep:
+                self.unscanned[os.path.join(path, name)] = 0
+            else:
+                queue.append(os.path.join(path, name))
+
+    def _size_unscanned(self: Scanner) -> None:
+        """Fill in the size of every directory in <unscanned>."""
+        paths = list(self.unscanned)
+        size = _estimate_size if self.estimate else self.directory_size
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            sizes = list(pool.map(size, paths))
+        if self.estimate:
+            # Count each subdirectory as the mean size of the files directly
+            # in a listed directory (including the unscanned ones), and as at
+            # least one byte, so that folders of empty-looking folders still
+            # show up.
+            file_bytes = sum(entry[2] for _, entries in self.listings.values()
+                             for entry in entries)
+            file_bytes += sum(files for files, _ in sizes)
+            mean = max(1.0, file_bytes / (self.stats.dirs + len(sizes)))
+            sizes = [files + round(subdirs * mean) for files, subdirs in sizes]
+        self.unscanned = dict(zip(paths, sizes))
+        self.stats.unscanned = len(paths)
+        self.stats.estimated = self.estimate
+
+    def build(self: Scanner, path: str, make_node: Callable,
+              make_unscanned: Optional[Callable] = None) -> object:
+        """Return the tree for the directory <path> from the recorded
+        listings.
+
+        <make_node> is called as make_node(name, subtrees, size, mtime,
+        is_dir) for every node, children before parents, and with True as
+        a sixth argument for the files in <links>. Directories that
+        were not listed are built as empty directories, except that the
+        directories in <unscanned> are built with their recorded size, by
+        make_unscanned(name, size, estimated) if it is given.
+        """
+        # Collect the directories in breadth-first order, so that walking the
+        # list backwards visits every child before its parent.
+        order = [path]
+        i = 0
+        while i < len(order):
+            current = order[i]
+            for name, is_dir, _, _ in self.listings.get(current, _EMPTY)[1]:
+                if is_dir:
+                    order.append(os.path.join(current, name))
+            i += 1
+
+        built = {}
+        for current in reversed(order):
+            if current in self.unscanned:
+                name = os.path.basename(current)
+                size = self.unscanned[current]
+                if make_unscanned is not None:
+                    built[current] = make_unscanned(name, size,
+                                                    self.estimate)
+                else:
+                    built[current] = make_node(name, [], size, 0.0, True)
+                continue
+            mtime, entries = self.listings.get(current, _EMPTY)
+            linked = self.links.get(current)
+            subtrees = []
+            for name, is_dir, size, file_mtime in entries:
+                if is_dir:
+                    subtrees.append(built.pop(os.path.join(current, name)))
+                elif linked and name in linked:
+                    subtrees.append(make_node(name, [], size, file_mtime,
+                                              False, True))
+                else:
+                    subtrees.append(make_node(name, [], size, file_mtime,
+                                              False))
+            built[current] = make_node(os.path.basename(current), subtrees, 0,
+                                       mtime, True)
+        return built[path]
+
+
+def scan(path: str, make_node: Callable, workers: int = DEFAULT_WORKERS,
+         max_depth: Optional[int] = None, estimate: bool = False,
+         make_unscanned: Optional[Callable] = None,
+         follow_symlinks: bool = True, one_filesystem: bool = False,
+         dedup: bool = True) -> Tuple[object, ScanStats]:
+    """Scan the file or folder <path> and return its tree and scan counters.
+
+    <make_node> is called as make_node(name, subtrees, size, mtime, is_dir)
+    to build each node of the tree, with an extra argument for files with
+    several links (see Scanner.build). If <max_depth> is given, directories
+    more than <max_depth> levels below <path> are not scanned, and are
+    built as described in Scanner and Scanner.build. <follow_symlinks>,
+    <one_filesystem> and <dedup> are as in Scanner.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    if not os.path.isdir(path):
+        return _scan_file(path, make_node)
+    scanner = Scanner(workers, max_depth, estimate, follow_symlinks,
+                      one_filesystem, dedup)
+    scanner.walk(path)
+    return scanner.build(path, make_node, make_unscanned), scanner.stats
+
+
+def scan_roots(paths: Sequence[str], make_node: Callable,
+               processes: Optional[int] = None,
+               workers: int = DEFAULT_WORKERS, follow_symlinks: bool = True,
+               one_filesystem: bool = False, dedup: bool = True) \
+        -> Tuple[List[object], ScanStats]:
+    """Scan each file or folder in <paths> and return their trees, in the
+    same order, and the combined scan counters.
+
+    The folders are walked as one walk (see Scanner.walk_roots), so that
+    with <dedup> a file or folder found under several roots is counted
+    once. If <one_filesystem> is True, the walks of folders on different
+    devices cannot meet (hard links cannot cross devices either), so the
+    folders are grouped by device, and each group is walked in a worker
+    process, at most <processes> (by default, one per CPU) at a time. Only
+    the listings are sent back; the trees are built here with <make_node>,
+    as in scan. <workers> and <follow_symlinks> are as in Scanner.
+
+    Precondition: every path in <paths> is a valid path for this computer,
+    and no path appears twice or inside another path in <paths>.
+    """
+    start = time.perf_counter()
+    groups = {}
+    for path in paths:
+        if os.path.isdir(path):
+            device = os.stat(path).st_dev if one_filesystem else None
+            groups.setdefault(device, []).append(path)
+    jobs = list(groups.values())
+    options = (workers, follow_symlinks, one_filesystem, dedup)
+    if len(jobs) <= 1 or processes == 1:
+        results = [_walk_group(job, *options) for job in jobs]
+    else:
+        with ProcessPoolExecutor(min(len(jobs), processes or
+                                     os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(_walk_group, job, *options)
+                       for job in jobs]
+            results = [future.result() for future in futures]
+
+    stats = ScanStats()
+    trees = {}
+    for job, (listings, links, job_stats) in zip(jobs, results):
+        scanner = Scanner(workers)
+        scanner.listings = listings
+        scanner.links = links
+        for path in job:
+            trees[path] = scanner.build(path, make_node)
+        stats.add(job_stats)
+    for path in paths:
+        if path not in trees:
+            trees[path], file_stats = _scan_file(path, make_node)
+            stats.add(file_stats)
+    stats.seconds = time.perf_counter() - start
+    return [trees[path] for path in paths], stats
+
+
+def _walk_group(paths: List[str], workers: int, follow_symlinks: bool,
+                one_filesystem: bool, dedup: bool) \
+        -> Tuple[Dict[str, Listing], Dict[str, Set[str]], ScanStats]:
+    """Walk the directories <paths> as one walk, and return the listings,
+    linked files and counters. This runs in a worker process of
+    scan_roots."""
+    scanner = Scanner(workers, follow_symlinks=follow_symlinks,
+                      one_filesystem=one_filesystem, dedup=dedup)
+    scanner.walk_roots(paths)
+    return scanner.listings, scanner.links, scanner.stats
+
+
+def _scan_file(path: str, make_node: Callable) -> Tuple[object, ScanStats]:
+    """Return the single node for the file <path>, and its counters."""
+    stats = ScanStats()
+    stats.files = 1
+    st = os.stat(path)
+    return make_node(os.path.basename(path), [], st.st_size, st.st_mtime,
+                     False), stats
+
+
+def _estimate_size(path: str) -> Tuple[int, int]:
+    """Return the total size of the files directly in the directory <path>
+    and the number of its subdirectories, or (0, 0) if it cannot be
+    listed."""
+    try:
+        _, entries = list_directory(path)
+    except OSError:
+        return 0, 0
+    return (sum(size for _, is_dir, size, _ in entries if not is_dir),
+            sum(1 for entry in entries if entry[1]))
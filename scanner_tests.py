@@ -0,0 +1,158 @@
+import os
+import sys
+
+from scanner import Scanner, scan, scan_roots
+from tree_data import ROOTS_NAME, FileSystemTree
+
+
+def write(path: str, size: int) -> None:
+    """Write a file of <size> bytes at <path>."""
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def deep_folder(tmp_path) -> str:
+    """Return a folder with files three levels deep, a hard link and a
+    symbolic link back up to the folder."""
+    top = str(tmp_path / 'top')
+    deep = os.path.join(top, 'a', 'b', 'c')
+    os.makedirs(deep)
+    write(os.path.join(top, 'f'), 1)
+    write(os.path.join(top, 'a', 'g'), 10)
+    write(os.path.join(deep, 'h'), 100)
+    os.link(os.path.join(deep, 'h'), os.path.join(deep, 'h2'))
+    os.symlink(top, os.path.join(deep, 'loop'))
+    return top
+
+
+def test_directory_size_symlink_loop(tmp_path) -> None:
+    top = deep_folder(tmp_path)
+    assert Scanner().directory_size(top) == 111
+    scanner = Scanner(follow_symlinks=False)
+    size = scanner.directory_size(top)
+    assert size == 111 + os.lstat(os.path.join(top, 'a', 'b', 'c',
+                                               'loop')).st_size
+
+
+def test_lazy_tree_sizes_and_expand(tmp_path) -> None:
+    top = deep_folder(tmp_path)
+    tree = FileSystemTree(top, max_depth=1)
+    assert tree.scan_stats.unscanned == 1
+    assert tree.data_size == 111
+    a = [sub for sub in tree._subtrees if sub._root == 'a'][0]
+    b = a._subtrees[[sub._root for sub in a._subtrees].index('b')]
+    assert b._unscanned and b.data_size == 100
+    assert b.expand()
+    assert not b._unscanned
+    assert tree.data_size == 111
+
+
+def listdir_tree(path: str) -> tuple:
+    """Return the name, size and children of <path> as the original
+    recursive FileSystemTree constructor found them with os.listdir."""
+    name = os.path.basename(path)
+    if not os.path.isdir(path):
+        return name, os.path.getsize(path), []
+    children = [listdir_tree(os.path.join(path, child))
+                for child in os.listdir(path)]
+    return name, sum(size for _, size, _ in children), children
+
+
+def as_tuple(tree) -> tuple:
+    """Return the name, size and children of <tree> as listdir_tree
+    does."""
+    return (tree._root, tree.data_size,
+            [as_tuple(subtree) for subtree in tree._subtrees])
+
+
+def test_scan_matches_listdir(tmp_path) -> None:
+    top = str(tmp_path / 'top')
+    for i in range(5):
+        folder = os.path.join(top, 'd{}'.format(i), 'e{}'.format(i % 2))
+        os.makedirs(folder)
+        for j in range(i + 2):
+            write(os.path.join(folder, 'f{}'.format(j)), i * 7 + j)
+    write(os.path.join(top, 'root_file'), 3)
+    expected = listdir_tree(top)
+    for workers in (1, 8):
+        tree, stats = scan(top, FileSystemTree._make_node, workers)
+        assert as_tuple(tree) == expected
+        assert (stats.files, stats.dirs) == (21, 11)
+
+
+def test_scan_deeper_than_recursion_limit(tmp_path) -> None:
+    path = str(tmp_path / 'deep')
+    os.makedirs(path)
+    depth = sys.getrecursionlimit() + 10
+    for _ in range(depth):
+        path = os.path.join(path, 'd')
+        os.mkdir(path)
+    write(os.path.join(path, 'f'), 5)
+    try:
+        scanner = Scanner(workers=4)
+        scanner.walk(str(tmp_path / 'deep'))
+        assert scanner.stats.dirs == depth + 1
+        assert scanner.stats.files == 1
+    finally:
+        # shutil.rmtree, which pytest cleans up with, is recursive.
+        os.remove(os.path.join(path, 'f'))
+        for _ in range(depth + 1):
+            os.rmdir(path)
+            path = os.path.dirname(path)
+
+
+def test_hard_links_counted_once(tmp_path) -> None:
+    top = deep_folder(tmp_path)
+    tree = FileSystemTree(top)
+    assert tree.data_size == 111
+    assert tree.scan_stats.links == 1
+    loop = os.lstat(os.path.join(top, 'a', 'b', 'c', 'loop')).st_size
+    tree, _ = scan(top, FileSystemTree._make_node, follow_symlinks=False,
+                   dedup=False)
+    assert tree.data_size == 211 + loop
+
+
+def two_roots(tmp_path) -> list:
+    """Return two folders sharing a hard-linked file, one with a symbolic
+    link into the other, and a plain file."""
+    first = str(tmp_path / 'first')
+    second = str(tmp_path / 'second')
+    os.makedirs(os.path.join(first, 'sub'))
+    os.makedirs(second)
+    write(os.path.join(first, 'sub', 'big'), 1000)
+    write(os.path.join(first, 'small'), 1)
+    write(os.path.join(second, 'own'), 20)
+    os.link(os.path.join(first, 'sub', 'big'), os.path.join(second, 'big'))
+    os.symlink(os.path.join(first, 'sub'), os.path.join(second, 'ln'))
+    plain = str(tmp_path / 'plain')
+    write(plain, 300)
+    return [first, second, plain]
+
+
+def test_scan_roots_counts_shared_files_once(tmp_path) -> None:
+    paths = two_roots(tmp_path)
+    for processes in (1, 2):
+        for one_filesystem in (False, True):
+            trees, stats = scan_roots(paths, FileSystemTree._make_node,
+                                      processes,
+                                      one_filesystem=one_filesystem)
+            # The shared file is counted under whichever root reaches
+            # it first.
+            assert sum(tree.data_size for tree in trees) == 1321
+            assert trees[2].data_size == 300
+            assert stats.links >= 1
+    trees, _ = scan_roots(paths, FileSystemTree._make_node, dedup=False)
+    assert [tree.data_size for tree in trees] == [1001, 2020, 300]
+
+
+def test_from_roots(tmp_path) -> None:
+    paths = two_roots(tmp_path)
+    tree = FileSystemTree.from_roots(paths + [paths[0],
+                                              os.path.join(paths[0], 'sub')])
+    assert tree._root == ROOTS_NAME
+    assert [sub._root for sub in tree._subtrees] == paths
+    assert tree.data_size == 1321
+    assert tree.size_by() == {'': 1321}
+    assert tree.largest(1)[0].disk_path() in (
+        os.path.join(paths[0], 'sub', 'big'),
+        os.path.join(paths[1], 'big'))
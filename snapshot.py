@@ -0,0 +1,408 @@
+"""Scan Snapshots for FileSystemTree
+
+=== Module Description ===
+This module saves a scanned FileSystemTree to a compact binary snapshot, and
+uses a saved snapshot to rescan a folder incrementally.
+
+A snapshot stores one record per node in breadth-first order, so the children
+of every node are contiguous and come after their parent. The records are kept
+as parallel arrays so that a snapshot can be read straight out of an mmap
+without parsing:
+
+    header        magic, node count, name blob length, root path length,
+                  linked file count
+    parent        int64[n]   index of the parent node, -1 for the root
+    first_child   int64[n]   index of the first child
+    child_count   int64[n]   number of children
+    size          int64[n]   data_size of the node
+    mtime         float64[n] modification time of the file or directory
+    name_end      int64[n]   end offset of the node's name in the name blob
+    linked        int64[k]   index of each file with more than one link
+    is_dir        uint8[n]   1 for directories, 0 for regular files
+    root path     utf-8
+    name blob     utf-8
+
+An incremental rescan only lists a directory from disk when its mtime differs
+from the one in the snapshot; otherwise its entries are taken from the
+snapshot. Creating, deleting or renaming an entry changes the mtime of its
+directory, but rewriting a file in place does not, so the sizes of files in
+unchanged directories are the sizes recorded in the snapshot.
+
+A reused listing is deduplicated as a listing read from disk would be: its
+directory only counts the first time it is reached, and the files in it
+that had more than one link when the snapshot was taken are looked up on
+disk again, since which of their links counts depends on the rest of the
+rescan. Once the walk is done, a file of a reused listing that is a link to
+a file counted from a changed directory (a link made since the snapshot was
+taken) is given size 0. Empty directories are always listed from disk,
+since a directory reached a second time was saved without its entries.
+"""
+
+from __future__ import annotations
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, \
+    Set, Tuple
+
+from scanner import DEFAULT_WORKERS, Listing, Scanner, ScanStats
+
+SNAPSHOT_MAGIC = b'FSTSNAP2'
+_HEADER = struct.Struct('<8sqqqq')
+# The int64 and float64 arrays, in file order.
+_WIDE_ARRAYS = (('parent', 'q'), ('first_child', 'q'), ('child_count', 'q'),
+                ('size', 'q'), ('mtime', 'd'), ('name_end', 'q'))
+
+
+def _encode(name: str) -> bytes:
+    """Return <name> as bytes, keeping undecodable file names intact."""
+    return name.encode('utf-8', 'surrogateescape')
+
+
+def save_snapshot(tree: object, root_path: str, fname: str) -> None:
+    """Save the FileSystemTree <tree>, scanned from <root_path>, to the
+    snapshot file <fname>.
+
+    Empty (deleted) subtrees are left out of the snapshot.
+    """
+    columns = {name: array(code) for name, code in _WIDE_ARRAYS}
+    linked = array('q')
+    is_dir = array('B')
+    blob = bytearray()
+
+    order = [(tree, -1)]
+    i = 0
+    while i < len(order):
+        node, parent = order[i]
+        columns['parent'].append(parent)
+        columns['first_child'].append(len(order))
+        count = 0
+        for sub in node._subtrees:
+            if not sub.is_empty():
+                order.append((sub, i))
+                count += 1
+        columns['child_count'].append(count)
+        columns['size'].append(int(node.data_size))
+        columns['mtime'].append(node._mtime)
+        blob += _encode(str(node._root))
+        columns['name_end'].append(len(blob))
+        is_dir.append(1 if node._is_dir else 0)
+        if node._linked:
+            linked.append(i)
+        i += 1
+
+    root = _encode(os.path.abspath(root_path))
+    with open(fname, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, len(order), len(blob), len(root),
+                             len(linked)))
+        for name, _ in _WIDE_ARRAYS:
+            columns[name].tofile(f)
+        linked.tofile(f)
+        is_dir.tofile(f)
+        f.write(root)
+        f.write(blob)
+
+
+class Snapshot:
+    """A snapshot file mapped into memory.
+
+    === Public Attributes ===
+    root_path: the absolute path of the folder the snapshot was taken of.
+    parent, first_child, child_count, size, mtime, name_end, is_dir:
+        the per-node arrays described in the module docstring, as
+        memoryviews into the mapped file.
+    linked: the index of every file with more than one link, grouped by
+        the index of its directory.
+    load_seconds: the time it took to open and map the snapshot.
+
+    === Private Attributes ===
+    _mmap: the mapped snapshot file.
+    _names: the name blob, as a memoryview into the mapped file.
+    _dirs: the index of every directory node, keyed by its full path.
+        Built on first use.
+    """
+    root_path: str
+    linked: Dict[int, List[int]]
+    load_seconds: float
+    _mmap: mmap.mmap
+    _names: memoryview
+    _dirs: Optional[Dict[str, int]]
+
+    def __init__(self: Snapshot, fname: str) -> None:
+        """Open the snapshot file <fname>.
+
+        Raise ValueError if <fname> is not a snapshot file, or if its
+        length or contents do not match its header, e.g. because it was cut
+        short while being written.
+        """
+        start = time.perf_counter()
+        with open(fname, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        header = None
+        if len(view) >= _HEADER.size:
+            header = _HEADER.unpack_from(view)
+        if header is None or header[0] != SNAPSHOT_MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError('{} is not a snapshot file'.format(fname))
+        _, count, blob_len, root_len, links = header
+        if min(count, blob_len, root_len, links) < 0 or count == 0 or \
+                len(view) != _HEADER.size + 8 * count * len(_WIDE_ARRAYS) + \
+                8 * links + count + root_len + blob_len:
+            view.release()
+            self._mmap.close()
+            raise ValueError('snapshot file {} is truncated or corrupted'
+                             .format(fname))
+
+        offset = _HEADER.size
+        for name, code in _WIDE_ARRAYS:
+            end = offset + 8 * count
+            setattr(self, name, view[offset:end].cast(code))
+            offset = end
+        linked = array('q', bytes(view[offset:offset + 8 * links]))
+        offset += 8 * links
+        self.is_dir = view[offset:offset + count]
+        offset += count
+        self.root_path = bytes(view[offset:offset + root_len]).decode(
+            'utf-8', 'surrogateescape')
+        offset += root_len
+        self._names = view[offset:offset + blob_len]
+        view.release()
+        if self.name_end[count - 1] != blob_len or \
+                any(not 0 < index < count for index in linked):
+            self.close()
+            raise ValueError('snapshot file {} is truncated or corrupted'
+                             .format(fname))
+        self.linked = {}
+        for index in linked:
+            self.linked.setdefault(self.parent[index], []).append(index)
+        self._dirs = None
+        self.load_seconds = time.perf_counter() - start
+
+    def __len__(self: Snapshot) -> int:
+        return len(self.parent)
+
+    def name(self: Snapshot, index: int) -> str:
+        """Return the name of the node at <index>."""
+        start = self.name_end[index - 1] if index > 0 else 0
+        return bytes(self._names[start:self.name_end[index]]).decode(
+            'utf-8', 'surrogateescape')
+
+    def children(self: Snapshot, index: int) -> range:
+        """Return the indices of the children of the node at <index>."""
+        first = self.first_child[index]
+        return range(first, first + self.child_count[index])
+
+    def child_names(self: Snapshot, index: int) -> List[str]:
+        """Return the names of the children of the node at <index>, in
+        order. Quicker than calling name on each child, since the names of
+        the children of a node are stored next to each other."""
+        first = self.first_child[index]
+        count = self.child_count[index]
+        if not count:
+            return []
+        # A child is never the first node, so there is a name before it.
+        start = self.name_end[first - 1]
+        blob = bytes(self._names[start:self.name_end[first + count - 1]])
+        ends = [end - start for end in self.name_end[first:first + count]]
+        text = blob.decode('utf-8', 'surrogateescape')
+        if len(text) == len(blob):
+            # Only one-byte characters, so the offsets are the same.
+            return [text[begin:end] for begin, end in zip([0] + ends, ends)]
+        return [blob[begin:end].decode('utf-8', 'surrogateescape')
+                for begin, end in zip([0] + ends, ends)]
+
+    def find_dir(self: Snapshot, path: str) -> Optional[int]:
+        """Return the index of the directory node with full path <path>, or
+        None if the snapshot has no such directory.
+        """
+        if self._dirs is None:
+            dirs = {self.root_path: 0}
+            order = [(0, self.root_path)]
+            while order:
+                index, dir_path = order.pop()
+                for child in self.children(index):
+                    if self.is_dir[child]:
+                        child_path = os.path.join(dir_path, self.name(child))
+                        dirs[child_path] = child
+                        order.append((child, child_path))
+            self._dirs = dirs
+        return self._dirs.get(path)
+
+    def listing(self: Snapshot, index: int) -> Listing:
+        """Return the listing of the directory node at <index>, in the same
+        form as scanner.list_directory.
+        """
+        entries = []
+        for child in self.children(index):
+            if self.is_dir[child]:
+                entries.append((self.name(child), True, 0, 0.0))
+            else:
+                entries.append((self.name(child), False, self.size[child],
+                                self.mtime[child]))
+        return self.mtime[index], entries
+
+    def to_tree(self: Snapshot, make_node: Callable) -> object:
+        """Return the tree stored in this snapshot, without touching the disk.
+
+        <make_node> is called as in scanner.Scanner.build, children before
+        parents.
+        """
+        linked = {index for files in self.linked.values() for index in files}
+        built = {}
+        for index in range(len(self) - 1, -1, -1):
+            subtrees = [built.pop(child) for child in self.children(index)]
+            node = (self.name(index), subtrees, self.size[index],
+                    self.mtime[index], bool(self.is_dir[index]))
+            if index in linked:
+                node += (True,)
+            built[index] = make_node(*node)
+        return built[0]
+
+    def close(self: Snapshot) -> None:
+        """Unmap the snapshot file."""
+        for name, _ in _WIDE_ARRAYS:
+            getattr(self, name).release()
+        self.is_dir.release()
+        self._names.release()
+        self._mmap.close()
+
+
+class IncrementalScanner(Scanner):
+    """A Scanner that reuses the listings of unchanged directories from a
+    snapshot.
+
+    === Public Attributes ===
+    snapshot: the snapshot of an earlier scan.
+
+    === Private Attributes ===
+    _counted: the (st_dev, st_ino) of every file with more than one link
+        counted at its full size by the most recent walk, grouped by size.
+    """
+    snapshot: Snapshot
+    _counted: Dict[int, Set[Tuple[int, int]]]
+
+    def __init__(self: IncrementalScanner, snapshot: Snapshot,
+                 workers: int = DEFAULT_WORKERS) -> None:
+        """Initialize a scanner that reuses listings from <snapshot>."""
+        Scanner.__init__(self, workers)
+        self.snapshot = snapshot
+        self._counted = {}
+        # Build the directory index now, before worker threads share it.
+        snapshot.find_dir(snapshot.root_path)
+
+    def list_directory(self: IncrementalScanner, path: str) -> Listing:
+        """Return the mtime and entries of the directory <path>, taken from
+        the snapshot if the directory has not changed since it was taken.
+        """
+        snapshot = self.snapshot
+        index = snapshot.find_dir(os.path.abspath(path))
+        if index is None or not snapshot.child_count[index]:
+            return Scanner.list_directory(self, path)
+        st = os.stat(path)
+        if st.st_mtime != snapshot.mtime[index]:
+            return Scanner.list_directory(self, path)
+        if self.dedup and not self._first_time((st.st_dev, st.st_ino)):
+            with self._lock:
+                self.stats.duplicates += 1
+            return st.st_mtime, []
+        self._reused.append(path)
+        mtime, entries = snapshot.listing(index)
+        if self.dedup:
+            first = snapshot.first_child[index]
+            for child in snapshot.linked.get(index, ()):
+                name = entries[child - first][0]
+                try:
+                    file_st = os.stat(os.path.join(path, name))
+                except OSError:
+                    continue
+                entries[child - first] = (name, False,
+                                          self._link(path, name, file_st),
+                                          file_st.st_mtime)
+        return mtime, entries
+
+    def _link(self: IncrementalScanner, path: str, name: str,
+              st: os.stat_result) -> int:
+        """Record the file <name> in the directory <path>, which has more
+        than one link, as in Scanner, and return the size it is counted at.
+        """
+        size = Scanner._link(self, path, name, st)
+        if size:
+            with self._lock:
+                self._counted.setdefault(size, set()).add((st.st_dev,
+                                                           st.st_ino))
+        return size
+
+    def walk_roots(self: IncrementalScanner, paths: Sequence[str],
+                   on_progress: Optional[Callable[[Scanner], None]] = None,
+                   seen: Iterable[Tuple[int, int]] = ()) -> None:
+        """List every directory below (and including) each of the
+        directories <paths>, as in Scanner.
+        """
+        self._counted = {}
+        Scanner.walk_roots(self, paths, on_progress, seen)
+        if self._counted:
+            start = time.perf_counter()
+            self._uncount_new_links()
+            self.stats.seconds += time.perf_counter() - start
+
+    def _uncount_new_links(self: IncrementalScanner) -> None:
+        """Give size 0 to the files of the reused listings that are links
+        to a file in _counted, other than the files the snapshot already
+        knew had several links."""
+        snapshot = self.snapshot
+        for path in self._reused:
+            entries = self.listings[path][1]
+            index = snapshot.find_dir(os.path.abspath(path))
+            first = snapshot.first_child[index]
+            linked = snapshot.linked.get(index, ())
+            known = {child - first for child in linked}
+            for i, (name, is_dir, size, mtime) in enumerate(entries):
+                if is_dir or size not in self._counted or i in known:
+                    continue
+                try:
+                    st = os.stat(os.path.join(path, name))
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) in self._counted[size]:
+                    entries[i] = (name, False, 0, mtime)
+                    self.stats.links += 1
+                    self.links.setdefault(path, set()).add(name)
+
+
+def rescan(path: str, fname: str, make_node: Callable,
+           workers: int = DEFAULT_WORKERS) -> Tuple[object, ScanStats]:
+    """Scan the folder <path>, reusing the snapshot file <fname> for every
+    directory that has not changed, and return its tree and scan counters.
+
+    <make_node> is used as in scanner.scan. If the snapshot does not exist,
+    cannot be read, or was taken of a different folder, the folder is
+    scanned in full.
+
+    Precondition: <path> is a valid path to a folder on this computer.
+    """
+    try:
+        snapshot = Snapshot(fname)
+    except (OSError, ValueError):
+        snapshot = None
+    if snapshot is not None and snapshot.root_path != os.path.abspath(path):
+        snapshot.close()
+        snapshot = None
+
+    if snapshot is None:
+        scanner = Scanner(workers)
+        load_seconds = 0.0
+    else:
+        scanner = IncrementalScanner(snapshot, workers)
+        load_seconds = snapshot.load_seconds
+    scanner.walk(path)
+    tree = scanner.build(path, make_node)
+    if snapshot is not None:
+        scanner.snapshot = None
+        snapshot.close()
+    scanner.stats.load_seconds = load_seconds
+    return tree, scanner.stats
+
@@ -0,0 +1,139 @@
+import os
+import time
+
+from scanner import scan
+from snapshot import Snapshot, rescan
+from tree_data import FileSystemTree
+
+
+def write(path: str, size: int) -> None:
+    """Write a file of <size> bytes at <path>."""
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def make_folder(tmp_path) -> str:
+    """Return a folder with an unchanging subfolder and one that is
+    changed by the tests."""
+    top = str(tmp_path / 'top')
+    for name in ('same', 'changed', 'empty'):
+        os.makedirs(os.path.join(top, name))
+    write(os.path.join(top, 'same', 'big'), 100)
+    write(os.path.join(top, 'same', 'small'), 7)
+    write(os.path.join(top, 'changed', 'x'), 10)
+    return top
+
+
+def shape(tree) -> list:
+    """Return the names and sizes of <tree> in preorder, children sorted."""
+    rows = []
+    stack = [(tree, '')]
+    while stack:
+        node, path = stack.pop()
+        path = path + '/' + str(node._root)
+        rows.append((path, node.data_size))
+        stack.extend((child, path) for child in node._subtrees)
+    return sorted(rows)
+
+
+def rescanned(top: str, fname: str) -> FileSystemTree:
+    """Return the tree of <top> rescanned from <fname>, after changing the
+    mtime of the folder 'changed'."""
+    changed = os.path.join(top, 'changed')
+    later = time.time() + 5
+    os.utime(changed, (later, later))
+    return FileSystemTree(top, snapshot=fname)
+
+
+def test_rescan_unchanged_equals_scan(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    tree = FileSystemTree(top)
+    tree.save_snapshot(top, fname)
+    again = FileSystemTree(top, snapshot=fname)
+    assert shape(again) == shape(tree)
+    assert again.scan_stats.listed == 1
+    snapshot = Snapshot(fname)
+    assert shape(snapshot.to_tree(FileSystemTree._make_node)) == shape(tree)
+    snapshot.close()
+
+
+def test_rescan_sees_changes(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    FileSystemTree(top).save_snapshot(top, fname)
+    write(os.path.join(top, 'changed', 'new'), 5)
+    tree = rescanned(top, fname)
+    assert shape(tree) == shape(FileSystemTree(top))
+    assert tree.data_size == 122
+
+
+def test_new_link_to_reused_file_counted_once(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    FileSystemTree(top).save_snapshot(top, fname)
+    os.link(os.path.join(top, 'same', 'big'),
+            os.path.join(top, 'changed', 'link'))
+    tree = rescanned(top, fname)
+    assert tree.data_size == 117
+    assert tree.data_size == FileSystemTree(top).data_size
+    assert tree.scan_stats.links == 1
+
+
+def test_old_links_recounted(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    os.link(os.path.join(top, 'same', 'big'),
+            os.path.join(top, 'changed', 'link'))
+    FileSystemTree(top).save_snapshot(top, fname)
+    os.remove(os.path.join(top, 'changed', 'link'))
+    os.remove(os.path.join(top, 'same', 'small'))
+    os.link(os.path.join(top, 'same', 'big'),
+            os.path.join(top, 'changed', 'link2'))
+    for _ in range(2):
+        tree = rescanned(top, fname)
+        assert tree.data_size == 110
+        tree.save_snapshot(top, fname)
+
+
+def test_symlinked_folder_counted_once(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    FileSystemTree(top).save_snapshot(top, fname)
+    os.symlink(os.path.join(top, 'same'), os.path.join(top, 'changed', 'ln'))
+    tree = rescanned(top, fname)
+    assert tree.data_size == 117
+    full, _ = scan(top, FileSystemTree._make_node)
+    assert tree.data_size == full.data_size
+
+
+def test_rescan_without_snapshot(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    tree, stats = rescan(top, str(tmp_path / 'missing'),
+                         FileSystemTree._make_node)
+    assert tree.data_size == 117
+    assert stats.listed == stats.dirs == 4
+
+
+def test_truncated_or_corrupted_snapshot(tmp_path) -> None:
+    top = make_folder(tmp_path)
+    fname = str(tmp_path / 'snap')
+    FileSystemTree(top).save_snapshot(top, fname)
+    with open(fname, 'rb') as f:
+        data = f.read()
+    # The last name_end, the sixth array of 7 nodes after a 40 byte header.
+    bad_name_end = bytearray(data)
+    bad_name_end[40 + 8 * 7 * 6 - 8] += 1
+    for contents in (data[:60], data[:-3], data + b'x', b'',
+                     bytes(bad_name_end)):
+        with open(fname, 'wb') as f:
+            f.write(contents)
+        try:
+            Snapshot(fname).close()
+        except ValueError:
+            pass
+        else:
+            assert False, 'a broken snapshot was read'
+        tree, stats = rescan(top, fname, FileSystemTree._make_node)
+        assert shape(tree) == shape(FileSystemTree(top))
+        assert stats.listed == stats.dirs == 4
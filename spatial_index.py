@@ -0,0 +1,119 @@
+"""Spatial Index for Treemap Hit-Testing
+
+=== Module Description ===
+This module contains GridIndex, a uniform grid over the rectangles of one
+treemap layout. It answers "which rectangle contains this point" by checking
+only the rectangles that overlap the grid cell containing the point, instead
+of every rectangle in the layout.
+
+Treemap rectangles tile the display without overlapping, so with roughly one
+cell per rectangle each cell holds only a handful of candidates. Cells are
+never smaller than a few pixels; when there are more rectangles than that
+allows, the extra rectangles are at most a few pixels in size anyway.
+"""
+
+from __future__ import annotations
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+# The smallest area, in pixels, of a grid cell.
+CELL_AREA = 16
+
+
+class GridIndex:
+    """A uniform grid of buckets over a set of rectangles.
+
+    Rectangles are closed on all four sides, as in the original linear scan
+    of find_rect: a point on the shared edge of two rectangles is inside
+    both, and the rectangle that came first in the layout wins.
+
+    === Private Attributes ===
+    _rects: the indexed rectangles, in layout order.
+    _targets: the object returned for each rectangle.
+    _x, _y: the top-left corner of the grid.
+    _cell_w, _cell_h: the size of each grid cell.
+    _cols, _rows: the number of grid cells in each direction.
+    _cells: the indices of the rectangles overlapping each non-empty cell,
+        keyed by row * _cols + col. The indices in each bucket are increasing.
+    """
+    _rects: Sequence[Rect]
+    _targets: Sequence[object]
+    _x: float
+    _y: float
+    _cell_w: float
+    _cell_h: float
+    _cols: int
+    _rows: int
+    _cells: Dict[int, List[int]]
+
+    def __init__(self: GridIndex, bounds: Rect, rects: Sequence[Rect],
+                 targets: Sequence[object]) -> None:
+        """Index <rects>, which lie inside <bounds>; a query that hits
+        rects[i] returns targets[i].
+        """
+        self._rects = rects
+        self._targets = targets
+        self._x, self._y, width, height = bounds
+        width = max(width, 1)
+        height = max(height, 1)
+        # About one cell per rectangle, with cells as square as possible and
+        # no smaller than CELL_AREA pixels.
+        cells = max(1, min(len(rects), width * height // CELL_AREA))
+        self._cols = max(1, min(width, round(math.sqrt(cells * width /
+                                                       height))))
+        self._rows = max(1, min(height, math.ceil(cells / self._cols)))
+        self._cell_w = width / self._cols
+        self._cell_h = height / self._rows
+
+        self._cells = {}
+        # Slice-and-dice gives wide folders many identical zero-width (or
+        # zero-height) slivers that can each span a whole row or column of
+        # cells. Only the first of identical rectangles can ever be returned,
+        # so the others are not indexed.
+        degenerate = set()
+        for i, (x, y, w, h) in enumerate(rects):
+            if w <= 0 or h <= 0:
+                if (x, y, w, h) in degenerate:
+                    continue
+                degenerate.add((x, y, w, h))
+            col0, row0 = self._cell(x, y)
+            col1, row1 = self._cell(x + w, y + h)
+            if col0 == col1 and row0 == row1:
+                bucket = self._cells.get(row0 * self._cols + col0)
+                if bucket is None:
+                    self._cells[row0 * self._cols + col0] = [i]
+                else:
+                    bucket.append(i)
+                continue
+            for row in range(row0, row1 + 1):
+                base = row * self._cols
+                for col in range(col0, col1 + 1):
+                    bucket = self._cells.get(base + col)
+                    if bucket is None:
+                        self._cells[base + col] = [i]
+                    else:
+                        bucket.append(i)
+
+    def __len__(self: GridIndex) -> int:
+        return len(self._rects)
+
+    def _cell(self: GridIndex, x: float, y: float) -> Tuple[int, int]:
+        """Return the (column, row) of the cell containing (x, y), clamped to
+        the grid."""
+        col = int((x - self._x) // self._cell_w)
+        row = int((y - self._y) // self._cell_h)
+        return (min(max(col, 0), self._cols - 1),
+                min(max(row, 0), self._rows - 1))
+
+    def query(self: GridIndex, pos: Tuple[int, int]) -> Optional[object]:
+        """Return the target of the first rectangle containing <pos>, or None
+        if no rectangle contains it."""
+        x, y = pos[0], pos[1]
+        col, row = self._cell(x, y)
+        for i in self._cells.get(row * self._cols + col, ()):
+            rec_x, rec_y, rec_w, rec_h = self._rects[i]
+            if rec_x <= x <= rec_x + rec_w and rec_y <= y <= rec_y + rec_h:
+                return self._targets[i]
+        return None
@@ -0,0 +1,63 @@
+import random
+
+from benchmarks import RECT, make_tree
+from layout_strategies import SQUARIFIED
+from spatial_index import GridIndex
+
+
+def linear(rects: list, pos: tuple):
+    """Return the index of the first of <rects> containing <pos>, as the
+    original find_rect scan did, or None."""
+    x, y = pos
+    for i, (rx, ry, w, h) in enumerate(rects):
+        if rx <= x <= rx + w and ry <= y <= ry + h:
+            return i
+    return None
+
+
+def points(rnd: random.Random, rects: list, count: int) -> list:
+    """Return <count> random points in RECT and just outside it, and the
+    corners of <rects>."""
+    x, y, w, h = RECT
+    result = [(rnd.randint(x - 5, x + w + 5), rnd.randint(y - 5, y + h + 5))
+              for _ in range(count)]
+    for rx, ry, rw, rh in rects[:200]:
+        result.extend([(rx, ry), (rx + rw, ry + rh)])
+    return result
+
+
+def test_query_matches_linear_scan() -> None:
+    rnd = random.Random(0)
+    for shape in ('wide', 'balanced', 'deep'):
+        for strategy in (None, SQUARIFIED):
+            tree = make_tree(shape, 2000)
+            rects = [r for r, _ in tree.generate_treemap(RECT, strategy)]
+            index = GridIndex(RECT, rects, list(range(len(rects))))
+            for pos in points(rnd, rects, 2000):
+                assert index.query(pos) == linear(rects, pos)
+
+
+def test_overlapping_rectangles_first_wins() -> None:
+    rnd = random.Random(1)
+    rects = []
+    for _ in range(300):
+        x, y = rnd.randint(0, 1000), rnd.randint(0, 700)
+        rects.append((x, y, rnd.randint(0, 200), rnd.randint(0, 200)))
+    index = GridIndex(RECT, rects, list(range(len(rects))))
+    assert len(index) == 300
+    for pos in points(rnd, rects, 3000):
+        assert index.query(pos) == linear(rects, pos)
+
+
+def test_find_rect_after_relayout() -> None:
+    tree = make_tree('balanced', 1000)
+    tree.generate_treemap(RECT)
+    leaves = list(tree._layout_leaves)
+    leaves[0].set_size(10 ** 9)
+    rects = [r for r, _ in tree.generate_treemap(RECT)]
+    rnd = random.Random(2)
+    for pos in points(rnd, rects, 500):
+        i = linear(rects, pos)
+        expected = None if i is None else tree._layout_leaves[i]
+        assert tree.find_rect(pos) is expected
+    assert tree.find_rect((500, 300)) is leaves[0]
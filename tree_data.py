@@ -16,10 +16,24 @@ from __future__ import annotations
 import os
 from random import randint
 import math
+import time
+import heapq
 
-from typing import Tuple, List, Optional
+from typing import Callable, Dict, Iterator, Tuple, List, Optional, Set
 
-leafs = {}
+from scanner import DEFAULT_WORKERS, ScanStats, Scanner, scan, scan_roots
+from snapshot import rescan, save_snapshot
+from spatial_index import GridIndex
+from layout_strategies import LayoutStrategy, SLICE_AND_DICE
+from aggregates import AggregateIndex
+import profiling
+
+# The name of the root that FileSystemTree.from_roots puts above its roots.
+ROOTS_NAME = '(roots)'
+
+# A tree removes its deleted subtrees from _subtrees once more than this
+# fraction of them have been deleted.
+COMPACT_FRACTION = 0.5
 
 
 class AbstractTree:
@@ -56,12 +70,58 @@ class AbstractTree:
       a bit easier).
 
     - if _parent_tree is not empty, then self is in _parent_tree._subtrees
+
+    === Layout Attributes ===
+    These are only set on trees that have been laid out; every other tree
+    shares the class defaults.
+
+    _layout_bounds: the rect of the most recent generate_treemap call on this
+        tree, or None.
+    _layout_pass: the _LayoutPass of that call, or None.
+    _layout_output: the rectangles and colours of that call.
+    _layout_leaves: the tree drawn in each rectangle of _layout_output: a
+        leaf, or a subtree drawn as a single aggregate rectangle.
+    _hit_index: the spatial index over _layout_output used by find_rect, or
+        None if it has not been built since the most recent layout.
+
+    _placed: how this tree was placed by the most recent layout pass that
+        laid it out, as a (pass, rect, at, count, source) tuple: the
+        _LayoutPass, the rect this tree was given, the position of its first
+        rectangle in the pass output relative to the first rectangle of its
+        parent tree, the number of rectangles it produced, and the pass that
+        computed those rectangles, which is an earlier pass if they were
+        copied. The subtrees of this tree were last placed by <source>. Kept
+        as one tuple so that a layout sets one attribute per tree.
+    _dirty: True if the size of this tree, or of any of its descendants,
+        changed since it was last laid out.
+
+    === Deletion Attributes ===
+    _tombstones: the number of deleted (empty) trees in _subtrees that have
+        not yet been removed from it. Like the layout attributes, it is only
+        set on trees that have had a subtree deleted.
+
+    === Query Attributes ===
+    _aggregates: the AggregateIndex of this tree, if this tree is the root
+        of an indexed tree, or None. Only set on such roots.
+    _attributes: the AttributeIndex used by filtered, if this tree is the
+        root of a tree that has been filtered, or None. Only set on such
+        roots.
     """
     data_size: int
     colour: (int, int, int)
     _root: Optional[object]
     _subtrees: List[AbstractTree]
     _parent_tree: Optional[AbstractTree]
+    _layout_bounds: Optional[Tuple[int, int, int, int]] = None
+    _layout_pass: Optional[_LayoutPass] = None
+    _layout_output: list = ()
+    _layout_leaves: List[AbstractTree] = ()
+    _hit_index: Optional[GridIndex] = None
+    _placed: tuple = (None, None, 0, 0, None)
+    _dirty: bool = False
+    _tombstones: int = 0
+    _aggregates: Optional[AggregateIndex] = None
+    _attributes: Optional[AttributeIndex] = None
 
     def __init__(self: AbstractTree, root: Optional[object],
                  subtrees: List[AbstractTree], data_size: int = 0) -> None:
@@ -92,16 +152,31 @@ class AbstractTree:
                 sub._parent_tree = self
 
     def __str__(self, level=0):
-        ret = "\t" * level + str(self._root) + ' ' + str(self.data_size) + "\n"
-        for child in self._subtrees:
-            ret += child.__str__(level + 1)
-        return ret
+        return ''.join(self.iter_lines(level))
+
+    def iter_lines(self: AbstractTree, level: int = 0) -> Iterator[str]:
+        """Yield the lines of str(self) one at a time: each tree in preorder,
+        indented by one tab per level below this tree plus <level>, as
+        'root data_size'.
+
+        The lines are produced without recursion, so this works on trees of
+        any depth, and without building the whole text.
+        """
+        stack = [(self, level)]
+        while stack:
+            tree, depth = stack.pop()
+            yield "\t" * depth + str(tree._root) + ' ' + \
+                str(tree.data_size) + "\n"
+            stack.extend((child, depth + 1)
+                         for child in reversed(tree._subtrees))
 
     def is_empty(self: AbstractTree) -> bool:
         """Return True if this tree is empty."""
         return self._root is None
 
-    def generate_treemap(self: AbstractTree, rect: Tuple[int, int, int, int]) \
+    def generate_treemap(self: AbstractTree, rect: Tuple[int, int, int, int],
+                         strategy: Optional[LayoutStrategy] = None,
+                         min_area: int = 0) \
             -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
         """Run the treemap algorithm on this tree and return the rectangles.
 
@@ -110,60 +185,149 @@ class AbstractTree:
 
         One tuple should be returned per non-empty leaf in this tree.
 
+        <strategy> decides how the rectangle of each tree is divided between
+        its subtrees; the default is slice-and-dice. See layout_strategies.
+
+        If <min_area> is positive, a subtree whose rectangle has an area
+        below <min_area> pixels is not recursed into: it is returned as a
+        single rectangle in its own colour, and find_rect returns the subtree
+        itself for it. Trees whose rectangle has no area are left out
+        entirely. The number of rectangles, and the time taken, are then
+        bounded by the size of <rect> rather than the size of the tree.
+
+        The layout is remembered by this tree, so that find_rect can search
+        the rectangles of the most recent layout.
+
         @type self: AbstractTree
         @type rect: (int, int, int, int)
             Input is in the pygame format: (x, y, width, height)
         @rtype: list[((int, int, int, int), (int, int, int))]
         """
-        output = []
-
-        if self.data_size <= 0 or self.is_empty():
-            return []
-        elif not self._subtrees:
-            leafs[self] = rect
-            return [(rect, self.colour)]
-
-        x, y, width, height = rect
-        i = 0
-
-        while i < len(self._subtrees):
-            subtree = self._subtrees[i]
-
-            if width > height:
-
-                if i == len(self._subtrees) - 1:
-                    new_width = abs(width - x)
-                    output.extend(
-                        subtree.generate_treemap((x, y, new_width, height)))
-                else:
-                    new_width = int(
-                        (subtree.data_size / self.data_size) * width)
-                    output.extend(
-                        subtree.generate_treemap((x, y, new_width, height)))
-                    x += new_width
-
-            else:  # if height >= width
-
-                if i == len(self._subtrees) - 1:
-                    new_height = abs(height - y)
-                    output.extend(
-                        subtree.generate_treemap((x, y, width, new_height)))
-                else:
-                    new_height = int(
-                        (subtree.data_size / self.data_size) * height)
-                    output.extend(
-                        subtree.generate_treemap((x, y, width, new_height)))
-                    y += new_height
-
-            i += 1
-        return output
-
-        # Read the handout carefully to help get started identifying base cases,
-        # and the outline of a recursive step.
-        #
-        # Programming tip: use "tuple unpacking assignment" to easily extract
-        # coordinates of a rectangle, as follows.
-        # x, y, width, height = rect
+        profiler = profiling.current
+        if profiler is not None:
+            start = time.perf_counter()
+        if strategy is None:
+            strategy = SLICE_AND_DICE
+        previous = self._layout_pass
+        if previous is not None and (previous.strategy is not strategy or
+                                     previous.min_area != min_area):
+            previous = None
+        layout = _LayoutPass(self._layout_output, self._layout_leaves,
+                             strategy, min_area)
+        if previous is not None and self._placed[0] is previous:
+            self._layout(rect, layout, 0, 0)
+        else:
+            self._layout(rect, layout, None, 0)
+        self._layout_bounds = rect
+        self._layout_pass = layout
+        self._layout_output, self._layout_leaves = layout.finish()
+        self._hit_index = None
+        if profiler is not None:
+            profiler.record('layout', start,
+                            rectangles=len(self._layout_output),
+                            visited=layout.visited)
+        return list(self._layout_output)
+
+    def _layout(self: AbstractTree, rect: Tuple[int, int, int, int],
+                layout: _LayoutPass, old_start: Optional[int],
+                parent_start: int) -> None:
+        """Append the treemap rectangles of this tree, laid out in <rect>, to
+        the output of <layout>.
+
+        <old_start> is the position of this tree's first rectangle in the
+        output of the previous layout, or None if this tree was not part of
+        the previous layout. If this tree is not dirty and was given the same
+        rect last time, its rectangles are copied from the previous layout
+        instead of being computed again.
+
+        <parent_start> is the position of the parent tree's first rectangle
+        in the output of <layout>.
+        """
+        output = layout.output
+        start = len(output)
+        placed = self._placed
+        if old_start is not None and not self._dirty and placed[1] == rect:
+            end = old_start + placed[3]
+            output.extend(layout.old_output[old_start:end])
+            layout.leaves.extend(layout.old_leaves[old_start:end])
+            source = placed[4]
+            layout.sources.add(source)
+        else:
+            source = layout
+            layout.visited += 1
+            if self._dirty:
+                self._dirty = False
+            if self.data_size <= 0 or self.is_empty():
+                pass
+            elif not self._subtrees or rect[2] * rect[3] < layout.min_area:
+                # A leaf, or a subtree too small to show its leaves.
+                if layout.min_area <= 0 or (rect[2] > 0 and rect[3] > 0):
+                    output.append((rect, self.colour))
+                    layout.leaves.append(self)
+            else:
+                self._layout_subtrees(rect, layout, old_start, start)
+        self._placed = (layout, rect, start - parent_start,
+                        len(output) - start, source)
+
+    def _layout_subtrees(self: AbstractTree, rect: Tuple[int, int, int, int],
+                         layout: _LayoutPass, old_start: Optional[int],
+                         start: int) -> None:
+        """Lay out the subtrees of this tree in <rect>, and append their
+        rectangles to the output of <layout>.
+
+        <old_start> is as in _layout, and <start> is the position of this
+        tree's first rectangle in the output of <layout>.
+
+        Precondition: this tree is not empty, has subtrees and has a positive
+        data_size.
+        """
+        subtrees = self._subtrees
+        sub_rects = layout.strategy.split(
+            rect, [subtree.data_size for subtree in subtrees], self.data_size)
+        # The subtrees were placed by the pass that last computed this tree,
+        # which may be older than the previous pass if that one copied it.
+        source = self._placed[4]
+        if source is None:
+            old_start = None
+        cull = layout.min_area > 0
+        for subtree, sub_rect in zip(subtrees, sub_rects):
+            if cull and (sub_rect[2] <= 0 or sub_rect[3] <= 0):
+                # Not drawn, and not recorded in _placed: the next layout
+                # cannot copy it, so it is laid out in full if it reappears.
+                continue
+            placed = subtree._placed
+            if old_start is not None and placed[0] is source:
+                subtree._layout(sub_rect, layout, old_start + placed[2], start)
+            else:
+                subtree._layout(sub_rect, layout, None, start)
+
+    def iter_treemap(self: AbstractTree, rect: Tuple[int, int, int, int],
+                     strategy: Optional[LayoutStrategy] = None,
+                     min_area: int = 0) \
+            -> Iterator[Tuple[Tuple[int, int, int, int],
+                              Tuple[int, int, int]]]:
+        """Yield the rectangles of generate_treemap(rect, strategy, min_area)
+        one at a time, in the same order.
+
+        The rectangles are computed as they are yielded, so the whole layout
+        is never held in memory, and the layout remembered for find_rect is
+        left unchanged.
+        """
+        if strategy is None:
+            strategy = SLICE_AND_DICE
+        stack = [(self, rect)]
+        while stack:
+            tree, rect = stack.pop()
+            if tree.data_size <= 0 or tree.is_empty():
+                continue
+            if not tree._subtrees or rect[2] * rect[3] < min_area:
+                if min_area <= 0 or (rect[2] > 0 and rect[3] > 0):
+                    yield rect, tree.colour
+                continue
+            sub_rects = strategy.split(
+                rect, [subtree.data_size for subtree in tree._subtrees],
+                tree.data_size)
+            stack.extend(reversed(list(zip(tree._subtrees, sub_rects))))
 
     def get_separator(self: AbstractTree) -> str:
         """Return the string used to separate nodes in the string
@@ -179,13 +343,46 @@ class AbstractTree:
 
     def find_rect(self: AbstractTree, mouse_pos: Tuple) -> AbstractTree:
         """return the tree that corresponds to the rectangle that
-        the mouse was clicked on"""
-        x = mouse_pos[0]
-        y = mouse_pos[1]
-        for i in leafs:
-            rec_x, rec_y, rec_w, rec_h = leafs[i]
-            if rec_x <= x <= (rec_x + rec_w) and rec_y <= y <= (rec_y + rec_h):
-                return i
+        the mouse was clicked on
+
+        This is a leaf, or a whole subtree if the layout drew it as a single
+        rectangle (see generate_treemap).
+
+        Only the rectangles of the most recent generate_treemap call on this
+        tree are searched; return None if there is no such rectangle. The
+        spatial index over those rectangles is built on the first search
+        after each layout.
+        """
+        profiler = profiling.current
+        if profiler is not None:
+            start = time.perf_counter()
+        if self._hit_index is None:
+            if self._layout_bounds is None:
+                return None
+            self._hit_index = GridIndex(
+                self._layout_bounds, [r for r, _ in self._layout_output],
+                self._layout_leaves)
+        tree = self._hit_index.query(mouse_pos)
+        if profiler is not None:
+            profiler.record('hit_test', start)
+        return tree
+
+    def expand(self: AbstractTree) -> bool:
+        """Load the subtrees of this tree if they have not been loaded yet,
+        and return True if this tree changed.
+
+        Trees that are always fully loaded have nothing to do; subclasses
+        that load their contents lazily override this.
+        """
+        return False
+
+    def is_unloaded(self: AbstractTree) -> bool:
+        """Return True if this tree has no subtrees only because they have
+        not been loaded yet (see expand), so that it is not really a leaf.
+
+        Trees that are always fully loaded never are.
+        """
+        return False
 
     def get_path(self: AbstractTree) -> str:
         """return complete path of given tree"""
@@ -199,34 +396,323 @@ class AbstractTree:
             path += str(i) + self.get_separator()
         return path[:-3]
 
+    def invalidate_layout(self: AbstractTree) -> None:
+        """Record that the size of this tree changed, so that it and its
+        ancestors are laid out again by the next generate_treemap call.
+
+        Code that changes data_size directly must call this afterwards.
+        """
+        x = self
+        while x:
+            x._dirty = True
+            x = x._parent_tree
+
     def del_update_parents(self: AbstractTree) -> None:
         size = self.data_size
         x = self._parent_tree
         while x:
             x.data_size -= size
             x = x._parent_tree
+        self.invalidate_layout()
+        index = self._aggregate_index()
+        if index is not None:
+            index.removed(self)
 
     def delete_leaf(self: AbstractTree) -> None:
-        """delete the specified leaf"""
+        """delete the specified leaf
+
+        The leaf stays in its parent's subtrees as an empty tree (a
+        tombstone) until the parent compacts its subtrees; see _bury.
+        """
+        parent = self._parent_tree
+        self.invalidate_layout()
         self._root = None
         self.data_size = 0
+        self._subtrees = []
+        if parent is not None:
+            parent._bury(self)
+
+    def delete(self: AbstractTree) -> None:
+        """Delete this tree, a leaf or a whole subtree, and update the sizes
+        of its ancestors to match.
+
+        A subtree left with no subtrees by the deletion is deleted as well,
+        and so on up the tree; the root of the whole tree is never deleted
+        this way. The deleted trees are emptied, so their descendants can be
+        freed.
+        """
+        node = self
+        while True:
+            parent = node._parent_tree
+            node.del_update_parents()
+            node.delete_leaf()
+            if parent is None or parent._parent_tree is None or \
+                    len(parent._subtrees) > parent._tombstones:
+                return
+            node = parent
+
+    def _bury(self: AbstractTree, subtree: AbstractTree) -> None:
+        """Record that <subtree>, one of the subtrees of this tree, has just
+        been deleted.
+
+        Once more than COMPACT_FRACTION of the subtrees are tombstones, they
+        are all removed from _subtrees at once, so that the cost of laying
+        out and hit-testing this tree stays proportional to its live
+        subtrees, and each deletion costs O(1) time on average.
+        """
+        subtree._parent_tree = None
+        self._tombstones += 1
+        if self._tombstones > len(self._subtrees) * COMPACT_FRACTION:
+            self._subtrees = [sub for sub in self._subtrees
+                              if not sub.is_empty()]
+            self._tombstones = 0
+
+    def _unbury(self: AbstractTree, subtree: AbstractTree,
+                siblings: List[AbstractTree], tombstones: int) -> None:
+        """Put <subtree>, which _bury recorded as deleted from this tree,
+        back among its subtrees, where <siblings> and <tombstones> are the
+        _subtrees and _tombstones of this tree just before it was deleted.
+
+        Precondition: every change made to the subtrees of this tree since
+        then has been undone.
+        """
+        subtree._parent_tree = self
+        self._subtrees = siblings
+        self._tombstones = tombstones
 
-    def adjust_size(self: AbstractTree, case: bool) -> None:
-        """Adjust the size of the specified leaf based on the case"""
-        if case:
-            new_size = (self.data_size * 0.01)
-            self.data_size += new_size
-            x = self._parent_tree
-            while x:
-                x.data_size += new_size
-                x = x._parent_tree
-        else:
-            new_size = (self.data_size * 0.01)
-            self.data_size -= new_size
-            x = self._parent_tree
-            while x:
-                x.data_size -= new_size
-                x = x._parent_tree
+    def adjust_size(self: AbstractTree, case: bool, times: int = 1) -> None:
+        """Adjust the size of the specified leaf based on the case
+
+        The leaf is given adjusted_size(case, times). The <times> steps are
+        applied to the leaf first, and its ancestors are then updated once
+        for all of them.
+        """
+        self.set_size(self.adjusted_size(case, times))
+
+    def adjusted_size(self: AbstractTree, case: bool, times: int = 1) -> int:
+        """Return the size this leaf would have after <times> steps that
+        grow it (if <case> is True) or shrink it by 1%.
+
+        Each step is rounded to a whole number, and is at least 1, so that
+        sizes stay whole numbers and the size of a tree stays exactly the
+        sum of the sizes of its subtrees. Shrinking stops at 1.
+        """
+        size = round(self.data_size)
+        for _ in range(times):
+            step = max(1, round(size / 100))
+            if case:
+                size += step
+            else:
+                size = max(size - step, min(size, 1))
+        return size
+
+    def set_size(self: AbstractTree, size: int) -> None:
+        """Set the data_size of this leaf to <size>, and update the sizes of
+        its ancestors to match."""
+        old_size = self.data_size
+        change = size - old_size
+        self.data_size = size
+        x = self._parent_tree
+        while x:
+            x.data_size += change
+            x = x._parent_tree
+        self.invalidate_layout()
+        index = self._aggregate_index()
+        if index is not None:
+            index.resized(self, old_size)
+
+    def add_subtree(self: AbstractTree, subtree: AbstractTree) -> None:
+        """Add <subtree> as the last subtree of this tree, and update the
+        sizes of this tree and its ancestors to match.
+
+        Precondition: <subtree> is not part of another tree.
+        """
+        subtree._parent_tree = self
+        self._subtrees.append(subtree)
+        x = self
+        while x:
+            x.data_size += subtree.data_size
+            x = x._parent_tree
+        self.invalidate_layout()
+        index = self._aggregate_index()
+        if index is not None:
+            index.added(subtree)
+
+    def remove_subtree(self: AbstractTree, subtree: AbstractTree) -> None:
+        """Remove <subtree> from the subtrees of this tree, and update the
+        sizes of this tree and its ancestors to match.
+
+        Unlike delete_leaf, <subtree> keeps its contents and may be added to
+        another tree afterwards.
+
+        Precondition: <subtree> is a subtree of this tree.
+        """
+        subtree.del_update_parents()
+        self._subtrees.remove(subtree)
+        subtree._parent_tree = None
+        self.invalidate_layout()
+
+    def leaf_key(self: AbstractTree) -> Optional[object]:
+        """Return the key this leaf is grouped under by size_by, or None to
+        leave it out. Leaves are not grouped by default."""
+        return None
+
+    def leaf_time(self: AbstractTree) -> Optional[float]:
+        """Return the time this leaf was last modified, as a number of
+        seconds since the epoch, for filters on modification time, or None
+        if it is not known. Not known by default."""
+        return None
+
+    def filtered(self: AbstractTree, leaf_filter: LeafFilter,
+                 reindex: bool = False) -> FilteredTree:
+        """Return a view of this tree showing only the leaves that match
+        <leaf_filter>, without copying or changing the tree.
+
+        The view is answered from the AttributeIndex of this tree, which
+        is built by index_attributes if this tree has none yet. Pass
+        <reindex> as True after the tree has been edited, to build a new
+        index.
+
+        Precondition: this tree is the root of its tree.
+        """
+        # filters defines FilteredTree as a subclass of AbstractTree, so it
+        # can only be imported once this module has been.
+        from filters import FilteredTree
+        if reindex or self._attributes is None:
+            self.index_attributes()
+        return FilteredTree(self._attributes, leaf_filter)
+
+    def index_attributes(self: AbstractTree) -> AttributeIndex:
+        """Build an AttributeIndex of the nodes of this tree and the sizes,
+        leaf_keys and leaf_times of its leaves as they are now, for
+        filtered, and attach it, replacing any older one. Unlike an
+        AggregateIndex, it is not kept up to date as the tree is edited.
+
+        Precondition: this tree is the root of its tree.
+        """
+        from filters import AttributeIndex
+        self._attributes = AttributeIndex(self)
+        for name in ('size', 'time'):
+            self._attributes.sorted_by(name)
+        return self._attributes
+
+    def index_aggregates(self: AbstractTree) -> AggregateIndex:
+        """Build an AggregateIndex for this tree, grouping leaves by
+        leaf_key, and attach it, so that largest and size_by are answered
+        from it and kept up to date as the tree is edited.
+
+        Precondition: this tree is the root of its tree.
+        """
+        index = AggregateIndex()
+        index.attach(self)
+        return index
+
+    def largest(self: AbstractTree, k: int = 10,
+                subtrees: bool = False) -> List[AbstractTree]:
+        """Return the <k> largest leaves of this tree, or the <k> largest
+        of it and its descendants that have subtrees if <subtrees> is True,
+        largest first.
+
+        If this tree has an AggregateIndex, the answer comes from its heaps;
+        otherwise the tree is walked.
+        """
+        if self._aggregates is not None:
+            return self._aggregates.largest(k, subtrees)
+        nodes = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_empty():
+                continue
+            if bool(node._subtrees) == subtrees:
+                nodes.append(node)
+            stack.extend(node._subtrees)
+        return heapq.nlargest(k, nodes, key=lambda node: node.data_size)
+
+    def size_by(self: AbstractTree,
+                key: Optional[Callable[[AbstractTree], Optional[object]]]
+                = None) -> Dict[object, float]:
+        """Return the total size of the leaves of this tree grouped by
+        <key>, which gives the key of a leaf, or None to leave it out. If
+        <key> is None, leaves are grouped by leaf_key.
+
+        If <key> is None and this tree has an AggregateIndex, the totals
+        come from its counters; otherwise the tree is walked.
+        """
+        if key is None and self._aggregates is not None:
+            return self._aggregates.totals()
+        totals = {}
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_empty():
+                continue
+            if node._subtrees:
+                stack.extend(node._subtrees)
+                continue
+            group = node.leaf_key() if key is None else key(node)
+            if group is not None:
+                totals[group] = totals.get(group, 0) + node.data_size
+        return totals
+
+    def _aggregate_index(self: AbstractTree) -> Optional[AggregateIndex]:
+        """Return the AggregateIndex of the tree this tree is part of, or
+        None if it has none."""
+        x = self
+        while x._parent_tree is not None:
+            x = x._parent_tree
+        return x._aggregates
+
+
+class _LayoutPass:
+    """The state of a single generate_treemap call.
+
+    After the call, the pass is kept only as a marker: every tree laid out by
+    the call refers to it through _placed, which is how the next call
+    knows which cached rectangles belong to its previous layout.
+
+    === Attributes ===
+    strategy: the layout strategy of this pass.
+    min_area: the area below which a subtree is drawn as one rectangle, or 0.
+    output: the rectangles and colours produced so far.
+    leaves: the tree drawn in each rectangle of output.
+    old_output: the output of the previous call on the same tree.
+    old_leaves: the leaves of that call.
+    visited: the number of trees whose layout was computed rather than
+        copied from the previous pass.
+    sources: the passes that computed the rectangles this pass copied. The
+        subtrees of the copied trees refer to them through _placed, so they
+        are kept alive for trees that refer to passes weakly (CompactTree).
+    """
+    strategy: LayoutStrategy
+    min_area: int
+    output: list
+    leaves: List[AbstractTree]
+    old_output: list
+    old_leaves: List[AbstractTree]
+    visited: int
+    sources: Set[_LayoutPass]
+
+    def __init__(self: _LayoutPass, old_output: list,
+                 old_leaves: List[AbstractTree], strategy: LayoutStrategy,
+                 min_area: int = 0) -> None:
+        """Initialize a pass with <strategy> and <min_area> that may reuse
+        <old_output> and <old_leaves> from the previous pass."""
+        self.strategy = strategy
+        self.min_area = min_area
+        self.output = []
+        self.leaves = []
+        self.old_output = old_output
+        self.old_leaves = old_leaves
+        self.visited = 0
+        self.sources = set()
+
+    def finish(self: _LayoutPass) -> Tuple[list, List[AbstractTree]]:
+        """Return the output and leaves of this pass, and drop every
+        reference this pass holds to layout data."""
+        result = self.output, self.leaves
+        self.output = self.leaves = self.old_output = self.old_leaves = ()
+        return result
 
 
 class FileSystemTree(AbstractTree):
@@ -240,25 +726,232 @@ class FileSystemTree(AbstractTree):
 
     The data_size attribute for regular files as simply the size of the file,
     as reported by os.path.getsize.
-    """
 
-    def __init__(self: FileSystemTree, path: str) -> None:
+    A tree scanned by the constructor has an AggregateIndex, built during the
+    scan, which groups files by extension (see leaf_key).
+
+    A lazy tree is scanned only down to a maximum depth. The folders below
+    that depth are unscanned: they have no subtrees, and their data_size is
+    the total size of their files or an estimate of it (see scanner.Scanner).
+    An unscanned folder is scanned, to the same depth below it, when expand
+    is called on it.
+
+    === Public Attributes ===
+    scan_stats: the counters of the scan that built this tree, or None if
+        this tree is not the root of a scan.
+
+    === Private Attributes ===
+    _mtime: the modification time of the file or folder when it was scanned.
+    _is_dir: True if this tree represents a folder.
+    _linked: True if this tree is a file with more than one link, which is
+        only counted at the first link found by a scan.
+    _unscanned: True if this tree is a folder whose contents have not been
+        scanned yet.
+    _estimated: True if this tree is unscanned and its data_size is an
+        estimate.
+    _path: the path this tree was scanned from, if it is the root of a scan,
+        or '' if it is the root above the roots of a multi-root scan, whose
+        subtrees are named by their full paths.
+    _max_depth: the depth limit of a lazy tree, if this is its root, or
+        None.
+    _estimate: True if the unscanned folders of a lazy tree get estimated
+        sizes, if this is its root.
+    """
+    scan_stats: Optional[ScanStats] = None
+    _mtime: float = 0.0
+    _is_dir: bool = False
+    _linked: bool = False
+    _unscanned: bool = False
+    _estimated: bool = False
+    _path: Optional[str] = None
+    _max_depth: Optional[int] = None
+    _estimate: bool = False
+
+    def __init__(self: FileSystemTree, path: str,
+                 workers: int = DEFAULT_WORKERS,
+                 snapshot: Optional[str] = None,
+                 max_depth: Optional[int] = None,
+                 estimate: bool = False, follow_symlinks: bool = True,
+                 one_filesystem: bool = False, dedup: bool = True) -> None:
         """Store the file tree structure contained in the given file or folder.
 
+        The folder is scanned by the scanner module on <workers> threads.
+        If <snapshot> names a snapshot file saved by save_snapshot, only the
+        directories that changed since the snapshot was taken are listed
+        from disk. The counters of the scan are stored in scan_stats.
+
+        If <max_depth> is given, the tree is lazy: folders more than
+        <max_depth> levels below <path> are left unscanned, and their sizes
+        are estimated if <estimate> is True. A lazy tree cannot be combined
+        with a snapshot.
+
+        <follow_symlinks>, <one_filesystem> and <dedup> are as in
+        scanner.Scanner; a scan using a snapshot always uses the defaults.
+
         Precondition: <path> is a valid path for this computer.
         """
-        trees = []
-        if os.path.isdir(path):
-            trees = []
-            size = 0
-            for filename in os.listdir(path):
-                subitem = os.path.join(path, filename)
-                trees.append(FileSystemTree(subitem))
-            for tree in trees:
-                size += tree.data_size
-            super().__init__(os.path.basename(path), trees, size)
+        if max_depth is not None and snapshot is not None:
+            raise ValueError('a lazy FileSystemTree cannot use a snapshot')
+        # The aggregate index is filled in as the nodes are built.
+        index = AggregateIndex()
+
+        def make_node(*args: object) -> FileSystemTree:
+            return index.observe(FileSystemTree._make_node(*args))
+
+        def make_unscanned(*args: object) -> FileSystemTree:
+            return index.observe(FileSystemTree._make_unscanned(*args))
+
+        if snapshot is not None and os.path.isdir(path):
+            tree, self.scan_stats = rescan(path, snapshot, make_node, workers)
         else:
-            super().__init__(os.path.basename(path), [], os.path.getsize(path))
+            tree, self.scan_stats = scan(path, make_node, workers, max_depth,
+                                         estimate, make_unscanned,
+                                         follow_symlinks, one_filesystem,
+                                         dedup)
+        super().__init__(tree._root, tree._subtrees, tree.data_size)
+        self._mtime = tree._mtime
+        self._is_dir = tree._is_dir
+        self._path = os.path.abspath(path)
+        if max_depth is not None:
+            self._max_depth = max_depth
+            self._estimate = estimate
+        index.attach(self, tree)
+
+    @classmethod
+    def from_roots(cls, paths: List[str], processes: Optional[int] = None,
+                   workers: int = DEFAULT_WORKERS,
+                   follow_symlinks: bool = True,
+                   one_filesystem: bool = False,
+                   dedup: bool = True) -> FileSystemTree:
+        """Return a tree with a subtree for each file or folder in <paths>,
+        named by its full path, under a root named ROOTS_NAME.
+
+        The roots are scanned by scanner.scan_roots, with one worker process
+        per device if <one_filesystem> is True; see there for <processes>
+        and the other arguments. A file or folder found under more than one
+        root is counted once, and a path inside another of the <paths> is
+        only shown as part of that one.
+
+        Precondition: every path in <paths> is a valid path for this
+        computer.
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        paths = [path for path in dict.fromkeys(paths)
+                 if not any(path.startswith(os.path.join(other, ''))
+                            for other in paths)]
+        index = AggregateIndex()
+
+        def make_node(*args: object) -> FileSystemTree:
+            return index.observe(cls._make_node(*args))
+
+        trees, stats = scan_roots(paths, make_node, processes, workers,
+                                  follow_symlinks, one_filesystem, dedup)
+        for tree, path in zip(trees, paths):
+            tree._root = path
+        root = make_node(ROOTS_NAME, trees, 0, 0.0, True)
+        root._path = ''
+        root.scan_stats = stats
+        index.attach(root, root)
+        return root
+
+    @classmethod
+    def _make_node(cls, name: str, subtrees: List[FileSystemTree],
+                   size: int, mtime: float, is_dir: bool,
+                   linked: bool = False) -> FileSystemTree:
+        """Return a new FileSystemTree node without touching the disk."""
+        node = cls.__new__(cls)
+        AbstractTree.__init__(node, name, subtrees, size)
+        node._mtime = mtime
+        node._is_dir = is_dir
+        if linked:
+            node._linked = True
+        return node
+
+    @classmethod
+    def _make_unscanned(cls, name: str, size: int,
+                        estimated: bool) -> FileSystemTree:
+        """Return a new node for an unscanned folder of a lazy tree."""
+        node = cls._make_node(name, [], size, 0.0, True)
+        node._unscanned = True
+        node._estimated = estimated
+        return node
+
+    def save_snapshot(self: FileSystemTree, path: str, fname: str) -> None:
+        """Save this tree, scanned from <path>, to the snapshot file <fname>.
+
+        A lazy tree cannot be saved, since its unscanned folders would be
+        saved as empty.
+        """
+        if self._max_depth is not None:
+            raise ValueError('a lazy FileSystemTree cannot be saved')
+        save_snapshot(self, path, fname)
+
+    def disk_path(self: FileSystemTree) -> str:
+        """Return the path on disk of the file or folder of this tree.
+
+        Precondition: this tree is part of a tree built by FileSystemTree.
+        """
+        names = []
+        node = self
+        while node._parent_tree is not None:
+            names.append(node._root)
+            node = node._parent_tree
+        return os.path.join(node._path, *reversed(names))
+
+    def expand(self: FileSystemTree) -> bool:
+        """Scan this folder if it was left unscanned by a lazy scan, and
+        return True if it was.
+
+        The folder is scanned to the same depth below it as its tree was,
+        and the sizes of its ancestors are updated to its real size. Its
+        ancestors count as already found, so a symbolic link back up to one
+        of them is not followed again.
+        """
+        if not self._unscanned:
+            return False
+        ancestors = []
+        root = self
+        while root._parent_tree is not None:
+            root = root._parent_tree
+            ancestors.append(os.stat(root.disk_path()))
+        path = self.disk_path()
+        scanner = Scanner(DEFAULT_WORKERS, root._max_depth, root._estimate)
+        scanner.walk(path, seen=[(st.st_dev, st.st_ino) for st in ancestors])
+        tree = scanner.build(path, FileSystemTree._make_node,
+                             FileSystemTree._make_unscanned)
+        for subtree in tree._subtrees:
+            subtree._parent_tree = self
+        self._subtrees = tree._subtrees
+        self._mtime = tree._mtime
+        self._unscanned = False
+        self._estimated = False
+        index = self._aggregate_index()
+        if index is not None:
+            for subtree in self._subtrees:
+                index.added(subtree)
+        self.set_size(tree.data_size)
+        return True
+
+    def is_unloaded(self: FileSystemTree) -> bool:
+        """Return True if this folder was left unscanned by a lazy scan."""
+        return self._unscanned
+
+    def leaf_key(self: FileSystemTree) -> Optional[str]:
+        """Return the lower-case extension of this file, including the dot,
+        or '' if it has none, or None if this tree is a folder."""
+        if self._is_dir:
+            return None
+        # The same as os.path.splitext(name)[1], without its overhead.
+        name = str(self._root)
+        dot = name.rfind('.')
+        if dot <= 0 or not name[:dot].lstrip('.'):
+            return ''
+        return name[dot:].lower()
+
+    def leaf_time(self: FileSystemTree) -> Optional[float]:
+        """Return the modification time of this file or folder when it was
+        scanned."""
+        return self._mtime
 
     def get_separator(self: AbstractTree) -> str:
         """Return the string used to separate nodes in the string
@@ -275,5 +968,7 @@ if __name__ == '__main__':
 
     python_ta.check_all(
         config={
-            'extra-imports': ['os', 'random', 'math'],
+            'extra-imports': ['os', 'random', 'math', 'scanner', 'snapshot',
+                              'spatial_index', 'layout_strategies', 'time',
+                              'profiling', 'heapq', 'aggregates'],
             'generated-members': 'pygame.*'})
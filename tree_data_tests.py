@@ -1,4 +1,9 @@
+import random
+
 import tree_data
+from benchmarks import RECT, make_tree
+from compact_tree import CompactTree
+from layout_strategies import SQUARIFIED
 
 
 def print_size(self, level=0):
@@ -7,3 +12,131 @@ def print_size(self, level=0):
         ret += child.print_size(level + 1)
     return ret
 
+
+
+def test_incremental_layout_matches_full_layout() -> None:
+    rnd = random.Random(0)
+    for strategy, min_area in ((None, 0), (SQUARIFIED, 0), (None, 16)):
+        tree = make_tree('balanced', 3000)
+        for _ in range(20):
+            leaves = [leaf for leaf in tree._layout_leaves
+                      if not leaf._subtrees]
+            if leaves:
+                leaf = rnd.choice(leaves)
+                if rnd.random() < 0.2:
+                    leaf.delete_leaf()
+                else:
+                    leaf.adjust_size(rnd.random() < 0.5)
+            output = tree.generate_treemap(RECT, strategy, min_area)
+            assert output == list(tree.iter_treemap(RECT, strategy,
+                                                    min_area))
+
+
+def test_unchanged_subtrees_are_copied() -> None:
+    for tree in (make_tree('balanced', 3000),
+                 CompactTree.from_tree(make_tree('balanced', 3000))):
+        tree.generate_treemap(RECT)
+        nodes = tree._layout_pass.visited
+        tree.generate_treemap(RECT)
+        assert tree._layout_pass.visited == 0
+        folder = tree._subtrees[1]._subtrees[2]._subtrees[3]
+        for _ in range(3):
+            # Moving size between two siblings only lays out their parent,
+            # its ancestors and (after rounding) its subtrees again.
+            first, second = folder._subtrees[:2]
+            first.set_size(first.data_size + 10)
+            second.set_size(second.data_size - 10)
+            assert tree.generate_treemap(RECT) == \
+                list(tree.iter_treemap(RECT))
+            assert 6 <= tree._layout_pass.visited <= 4 + len(folder._subtrees)
+        tree.generate_treemap((0, 0, 800, 600))
+        assert tree._layout_pass.visited == nodes
+
+
+def test_culled_layout() -> None:
+    for shape in ('wide', 'balanced', 'deep'):
+        for strategy in (None, SQUARIFIED):
+            tree = make_tree(shape, 20000, 'zipf')
+            output = tree.generate_treemap(RECT, strategy, 64)
+            assert len(output) < RECT[2] * RECT[3]
+            assert all(w > 0 and h > 0 for (_, _, w, h), _ in output)
+            if strategy is SQUARIFIED:
+                # Slice-and-dice keeps the original sizing of the last
+                # subtree, which does not tile rects away from the origin.
+                assert sum(w * h for (_, _, w, h), _ in output) == \
+                    RECT[2] * RECT[3]
+            assert output == list(tree.iter_treemap(RECT, strategy, 64))
+            for (rect, colour), node in zip(output, tree._layout_leaves):
+                assert colour == node.colour
+                if node._subtrees:
+                    assert rect[2] * rect[3] < 64
+
+
+def test_find_rect_returns_culled_subtree() -> None:
+    tree = make_tree('balanced', 20000)
+    output = tree.generate_treemap(RECT, min_area=400)
+    assert len(output) < 20000
+    for i, ((x, y, w, h), _) in enumerate(output):
+        node = tree._layout_leaves[i]
+        if node._subtrees:
+            assert tree.find_rect((x + w // 2, y + h // 2)) is node
+            break
+    else:
+        assert False, 'no subtree was culled'
+    assert tree.generate_treemap(RECT, min_area=0) == \
+        tree.generate_treemap(RECT)
+
+
+def live_sizes_match(tree) -> bool:
+    """Return whether every live folder in <tree> is the sum of its live
+    subtrees."""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        live = [sub for sub in node._subtrees if not sub.is_empty()]
+        if live and node.data_size != sum(sub.data_size for sub in live):
+            return False
+        stack.extend(live)
+    return True
+
+
+def test_tombstones_compacted() -> None:
+    tree = make_tree('wide', 2000)
+    folder = max(tree._subtrees, key=lambda sub: len(sub._subtrees))
+    count = len(folder._subtrees)
+    for i in range(count - 1):
+        folder._subtrees[-1 if i % 2 else 0].delete()
+        live = [sub for sub in folder._subtrees if not sub.is_empty()]
+        assert len(live) == count - i - 1
+        assert folder._tombstones == len(folder._subtrees) - len(live)
+        assert folder._tombstones <= len(folder._subtrees) * \
+            tree_data.COMPACT_FRACTION
+    assert live_sizes_match(tree)
+    assert tree.generate_treemap(RECT) == list(tree.iter_treemap(RECT))
+    assert all(not leaf.is_empty() for leaf in tree._layout_leaves)
+
+
+def test_delete_collapses_empty_folders() -> None:
+    for tree in (make_tree('deep', 1000),
+                 CompactTree.from_tree(make_tree('deep', 1000))):
+        size = tree.data_size
+        folder = tree
+        while any(sub._subtrees for sub in folder._subtrees):
+            folder = [sub for sub in folder._subtrees if sub._subtrees][0]
+        leaves = list(folder._subtrees)
+        removed = sum(leaf.data_size for leaf in leaves)
+        for leaf in leaves:
+            leaf.delete()
+        assert folder.is_empty()
+        size -= removed
+        assert tree.data_size == size
+        assert live_sizes_match(tree)
+
+        subtree = tree._subtrees[-1]
+        removed = subtree.data_size
+        subtree.delete()
+        assert subtree.is_empty() and not tree.is_empty()
+        assert tree.data_size == size - removed
+        assert live_sizes_match(tree)
+        tree.generate_treemap(RECT)
+        assert subtree not in tree._layout_leaves
@@ -0,0 +1,347 @@
+"""Tree Diffs
+
+=== Module Description ===
+This module compares two scans of the same folder, e.g. yesterday's and
+today's, and builds a DiffTree of what changed between them, which the
+visualiser draws like any other tree: the area of each file is how much it
+grew or shrank, and its colour shows which (see growth_colour).
+
+Each scan can be a tree (a FileSystemTree, or any AbstractTree) or a
+snapshot.Snapshot, so that a scan saved yesterday can be compared with one
+made now without loading it as a tree. Nodes are matched by path: the root
+of one scan with the root of the other, and then, in each pair of matching
+folders, the entries with the same name. The entries of each folder are
+sorted by name and matched in one merge pass, so a folder with k entries
+costs O(k log k) time, and nothing is ever looked up by path. Folders whose
+entries come in the same order in both scans, as they usually do, are not
+sorted at all.
+
+Only what changed is kept: files that were added, removed, or changed size,
+and the folders above them. The folders are compared depth first, holding
+only the entries of the folders on the path being compared, so apart from
+the scans themselves, the memory used is proportional to the number of
+changes and not to the size of the scans.
+"""
+
+from __future__ import annotations
+from typing import Iterator, List, Optional, Tuple, Union
+
+from snapshot import Snapshot
+from tree_data import AbstractTree, FileSystemTree
+
+# The separator shown between the names in the path of a DiffTree.
+SEPARATOR = ' -> '
+
+# The brightness of the colour of a tree whose size changed by none of its
+# old size, up to 255 for one that was added or removed (see growth_colour).
+GROWTH_DIM = 70
+
+# The leaf_key of a DiffTree leaf, by how its file changed.
+ADDED = 'added'
+REMOVED = 'removed'
+GROWN = 'grown'
+SHRUNK = 'shrunk'
+
+# One of the scans compared by diff_trees.
+Scan = Union[AbstractTree, Snapshot]
+
+
+class DiffTree(AbstractTree):
+    """A file or folder that changed between two scans.
+
+    The data_size of a file is how much its size changed, in either
+    direction, and so the data_size of a folder is the total change of the
+    files in it that changed, not the change in its total size: a file that
+    grew by 10 and one that shrank by 10 give their folder a data_size of 20
+    and a growth of 0.
+
+    === Public Attributes ===
+    old_size: the size in the old scan, or None if it was not there.
+    new_size: the size in the new scan, or None if it is not there.
+
+    === Private Attributes ===
+    _is_dir: True if this tree is a folder. A name that is a file in one
+        scan and a folder in the other gives two trees.
+    """
+    old_size: Optional[int]
+    new_size: Optional[int]
+    _is_dir: bool = False
+
+    def __init__(self: DiffTree, name: str, subtrees: List[DiffTree],
+                 old_size: Optional[int], new_size: Optional[int],
+                 is_dir: bool = False) -> None:
+        """Initialize a DiffTree named <name> with the given subtrees, for a
+        file or folder whose size was <old_size> and is <new_size>.
+
+        The data_size of a file is the difference between the two sizes,
+        and that of a folder is, as for any AbstractTree, the total
+        data_size of its subtrees (0 if it has none).
+        """
+        AbstractTree.__init__(
+            self, name, subtrees,
+            0 if is_dir else abs((new_size or 0) - (old_size or 0)))
+        self.old_size = old_size
+        self.new_size = new_size
+        self._is_dir = is_dir
+        self.colour = growth_colour(old_size or 0, new_size or 0)
+
+    def growth(self: DiffTree) -> int:
+        """Return how much the size of this file or folder grew, which is
+        negative if it shrank."""
+        return (self.new_size or 0) - (self.old_size or 0)
+
+    def leaf_key(self: DiffTree) -> Optional[str]:
+        """Return how this file changed: ADDED, REMOVED, GROWN or SHRUNK, or
+        None if this tree is a folder."""
+        if self._is_dir:
+            return None
+        if self.old_size is None:
+            return ADDED
+        if self.new_size is None:
+            return REMOVED
+        return GROWN if self.new_size > self.old_size else SHRUNK
+
+    def describe(self: DiffTree) -> str:
+        """Return a description of the change, e.g. '+2048 (1024 -> 3072)'
+        or '-1024 (removed)'."""
+        if self.old_size is None:
+            sizes = 'added'
+        elif self.new_size is None:
+            sizes = 'removed'
+        else:
+            sizes = '{} -> {}'.format(self.old_size, self.new_size)
+        return '{:+} ({})'.format(self.growth(), sizes)
+
+    def get_separator(self: DiffTree) -> str:
+        """Return the string used to separate nodes in paths."""
+        return SEPARATOR
+
+
+def growth_colour(old_size: float, new_size: float) -> Tuple[int, int, int]:
+    """Return the colour of a tree whose size went from <old_size> to
+    <new_size>: green if it grew, red if it shrank and grey if it did not
+    change, brighter the larger the change is compared to the larger of the
+    two sizes."""
+    larger = max(old_size, new_size)
+    if larger <= 0 or old_size == new_size:
+        return GROWTH_DIM, GROWTH_DIM, GROWTH_DIM
+    level = round(GROWTH_DIM + (255 - GROWTH_DIM) *
+                  abs(new_size - old_size) / larger)
+    return (0, level, 0) if new_size > old_size else (level, 0, 0)
+
+
+def diff_trees(old: Scan, new: Scan) -> DiffTree:
+    """Return the DiffTree of the changes from the scan <old> to the scan
+    <new>, each a tree or a Snapshot. The root of the DiffTree is the root
+    of <new>, matched with the root of <old> whatever their names; if
+    nothing changed, it has no subtrees and a data_size of 0.
+    """
+    old_side = _side(old)
+    new_side = _side(new)
+    old_root = old_side.root()
+    new_root = new_side.root()
+    # The folders being compared, from the roots down to the deepest: its
+    # name, its node on each side (None if it is only on the other), the
+    # entries of it still to compare, and its changed subtrees so far.
+    stack = [(new_side.name(new_root), old_root, new_root,
+              _pairs(old_side, old_root, new_side, new_root), [])]
+    while True:
+        name, old_dir, new_dir, pairs, changed = stack[-1]
+        for entry in pairs:
+            entry_name, old_node, new_node, old_size, new_size, is_dir = entry
+            if not is_dir:
+                changed.append(DiffTree(entry_name, [], old_size, new_size))
+            else:
+                stack.append((entry_name, old_node, new_node,
+                              _pairs(old_side, old_node, new_side, new_node),
+                              []))
+                break
+        else:
+            stack.pop()
+            tree = DiffTree(
+                name, changed,
+                None if old_dir is None else old_side.size(old_dir),
+                None if new_dir is None else new_side.size(new_dir), True)
+            if not stack:
+                return tree
+            if changed:
+                stack[-1][4].append(tree)
+
+
+def _pairs(old_side: _Side, old_dir: Optional[object],
+           new_side: _Side, new_dir: Optional[object]) -> Iterator[tuple]:
+    """Return an iterator over the entries of the folder <old_dir> of
+    <old_side> and the folder <new_dir> of <new_side>, matched by name, that
+    may have changed: (name, old node, new node, old size, new size, is_dir)
+    for each changed file, with None for the node and size on a side it is
+    not on, and (name, old node, new node, None, None, True) for each folder
+    on either side. A name that is a file on one side and a folder on the
+    other gives one entry for each."""
+    old_names, old_nodes, old_sizes, old_dirs = old_side.entries(old_dir)
+    new_names, new_nodes, new_sizes, new_dirs = new_side.entries(new_dir)
+    if old_names == new_names:
+        # The same entries in the same order.
+        return (entry for i in range(len(new_names))
+                if new_dirs[i] or old_dirs[i] or old_sizes[i] != new_sizes[i]
+                for entry in _match(new_names[i],
+                                    old_nodes[i], old_sizes[i], old_dirs[i],
+                                    new_nodes[i], new_sizes[i], new_dirs[i]))
+    return _merge(old_names, old_nodes, old_sizes, old_dirs,
+                  new_names, new_nodes, new_sizes, new_dirs)
+
+
+def _merge(old_names: List[str], old_nodes: List[object],
+           old_sizes: List[int], old_dirs: List[bool],
+           new_names: List[str], new_nodes: List[object],
+           new_sizes: List[int], new_dirs: List[bool]) -> Iterator[tuple]:
+    """Yield the entries of _pairs for two folders whose entries are in a
+    different order, by sorting each by name and merging them."""
+    old_order = sorted(range(len(old_names)), key=old_names.__getitem__)
+    new_order = sorted(range(len(new_names)), key=new_names.__getitem__)
+    i = j = 0
+    while i < len(old_order) or j < len(new_order):
+        if j == len(new_order) or \
+                i < len(old_order) and \
+                old_names[old_order[i]] < new_names[new_order[j]]:
+            k = old_order[i]
+            yield from _match(old_names[k], old_nodes[k], old_sizes[k],
+                              old_dirs[k], None, None, False)
+            i += 1
+        elif i == len(old_order) or \
+                new_names[new_order[j]] < old_names[old_order[i]]:
+            k = new_order[j]
+            yield from _match(new_names[k], None, None, False,
+                              new_nodes[k], new_sizes[k], new_dirs[k])
+            j += 1
+        else:
+            k, m = old_order[i], new_order[j]
+            if old_dirs[k] or new_dirs[m] or old_sizes[k] != new_sizes[m]:
+                yield from _match(new_names[m],
+                                  old_nodes[k], old_sizes[k], old_dirs[k],
+                                  new_nodes[m], new_sizes[m], new_dirs[m])
+            i += 1
+            j += 1
+
+
+def _match(name: str, old_node: Optional[object], old_size: Optional[int],
+           old_dir: bool, new_node: Optional[object],
+           new_size: Optional[int], new_dir: bool) -> List[tuple]:
+    """Return the entries of _pairs for the entry <name> of a folder, given
+    its node, size and kind on each side (a None node if it is not on that
+    side)."""
+    if old_node is not None and new_node is not None and old_dir != new_dir:
+        # A file replaced by a folder, or the other way around.
+        return (_match(name, old_node, old_size, old_dir, None, None, False) +
+                _match(name, None, None, False, new_node, new_size, new_dir))
+    if old_dir or new_dir:
+        return [(name, old_node, new_node, None, None, True)]
+    return [(name, old_node, new_node,
+             None if old_node is None else old_size,
+             None if new_node is None else new_size, False)]
+
+
+class _Side:
+    """One of the scans compared by diff_trees, as seen by the merge."""
+
+    def root(self: _Side) -> object:
+        """Return the node of the root of the scan."""
+        raise NotImplementedError
+
+    def name(self: _Side, node: object) -> str:
+        """Return the name of <node>."""
+        raise NotImplementedError
+
+    def size(self: _Side, node: object) -> int:
+        """Return the size of <node>."""
+        raise NotImplementedError
+
+    def entries(self: _Side, node: Optional[object]) \
+            -> Tuple[List[str], List[object], List[int], List[bool]]:
+        """Return the names, nodes, sizes and kinds (True for folders) of
+        the entries of the folder <node>, in the order they are stored; no
+        entries if <node> is None."""
+        raise NotImplementedError
+
+
+class _TreeSide(_Side):
+    """A scan that is a tree.
+
+    A node of a FileSystemTree is a folder if it was scanned as one, and a
+    node of another tree if it has subtrees.
+
+    === Attributes ===
+    tree: the root of the tree.
+    """
+    tree: AbstractTree
+
+    def __init__(self: _TreeSide, tree: AbstractTree) -> None:
+        """Initialize a side for the tree <tree>."""
+        self.tree = tree
+
+    def root(self: _TreeSide) -> AbstractTree:
+        return self.tree
+
+    def name(self: _TreeSide, node: AbstractTree) -> str:
+        return str(node._root)
+
+    def size(self: _TreeSide, node: AbstractTree) -> int:
+        return node.data_size
+
+    def entries(self: _TreeSide, node: Optional[AbstractTree]) \
+            -> Tuple[List[str], List[AbstractTree], List[int], List[bool]]:
+        if node is None:
+            return [], [], [], []
+        nodes = [subtree for subtree in node._subtrees
+                 if subtree._root is not None]
+        if isinstance(node, FileSystemTree):
+            dirs = [subtree._is_dir for subtree in nodes]
+        else:
+            dirs = [bool(subtree._subtrees) for subtree in nodes]
+        return ([str(subtree._root) for subtree in nodes], nodes,
+                [subtree.data_size for subtree in nodes], dirs)
+
+
+class _SnapshotSide(_Side):
+    """A scan that is a Snapshot, whose nodes are their indexes.
+
+    === Attributes ===
+    snapshot: the snapshot.
+    """
+    snapshot: Snapshot
+
+    def __init__(self: _SnapshotSide, snapshot: Snapshot) -> None:
+        """Initialize a side for <snapshot>."""
+        self.snapshot = snapshot
+
+    def root(self: _SnapshotSide) -> int:
+        return 0
+
+    def name(self: _SnapshotSide, node: int) -> str:
+        return self.snapshot.name(node)
+
+    def size(self: _SnapshotSide, node: int) -> int:
+        return self.snapshot.size[node]
+
+    def entries(self: _SnapshotSide, node: Optional[int]) \
+            -> Tuple[List[str], range, List[int], List[bool]]:
+        if node is None:
+            return [], range(0), [], []
+        snapshot = self.snapshot
+        children = snapshot.children(node)
+        return (snapshot.child_names(node), children,
+                snapshot.size[children.start:children.stop].tolist(),
+                [bool(flag) for flag in
+                 snapshot.is_dir[children.start:children.stop]])
+
+
+def _side(scan: Scan) -> _Side:
+    """Return the side of the merge for <scan>."""
+    if isinstance(scan, Snapshot):
+        return _SnapshotSide(scan)
+    return _TreeSide(scan)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['snapshot', 'tree_data']})
@@ -0,0 +1,111 @@
+import os
+import random
+
+from benchmarks import RECT, make_tree
+from snapshot import Snapshot
+from tree_data import FileSystemTree
+from tree_diff import ADDED, GROWN, REMOVED, SHRUNK, diff_trees
+
+
+def files(tree, path: str = '') -> dict:
+    """Return the size of each live leaf of <tree> by its path below the
+    root."""
+    result = {}
+    for sub in tree._subtrees:
+        if sub.is_empty():
+            continue
+        name = path + '/' + str(sub._root)
+        if sub._subtrees or getattr(sub, '_is_dir', False):
+            result.update(files(sub, name))
+        else:
+            result[name] = sub.data_size
+    return result
+
+
+def changes(diff, path: str = '') -> dict:
+    """Return the old and new size of each leaf of <diff> by its path."""
+    result = {}
+    for sub in diff._subtrees:
+        name = path + '/' + str(sub._root)
+        if sub._is_dir:
+            assert sub._subtrees
+            assert sub.data_size == sum(child.data_size
+                                        for child in sub._subtrees)
+            result.update(changes(sub, name))
+        else:
+            assert sub.data_size == abs(sub.growth())
+            result[name] = (sub.old_size, sub.new_size)
+    return result
+
+
+def expected_changes(old, new) -> dict:
+    """Return the changes from <old> to <new> by comparing every path."""
+    old_files, new_files = files(old), files(new)
+    return {name: (old_files.get(name), new_files.get(name))
+            for name in set(old_files) | set(new_files)
+            if old_files.get(name) != new_files.get(name)}
+
+
+def test_diff_matches_path_comparison() -> None:
+    rnd = random.Random(0)
+    old = make_tree('balanced', 1000)
+    new = make_tree('balanced', 1000)
+    assert diff_trees(old, new)._subtrees == []
+    new.generate_treemap(RECT)
+    leaves = list(new._layout_leaves)
+    for leaf in rnd.sample(leaves, 60):
+        if rnd.random() < 0.3:
+            leaf.delete()
+        else:
+            leaf.set_size(rnd.randint(0, 2000))
+    new._subtrees[3]._subtrees.reverse()
+    new._subtrees[4].add_subtree(make_tree('wide', 5, seed=1))
+    diff = diff_trees(old, new)
+    assert changes(diff) == expected_changes(old, new)
+    output = diff.generate_treemap(RECT)
+    assert output == list(diff.iter_treemap(RECT))
+
+
+def write(path: str, size: int) -> None:
+    """Write a file of <size> bytes at <path>."""
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_diff_of_scans_and_snapshots(tmp_path) -> None:
+    top = str(tmp_path / 'top')
+    os.makedirs(os.path.join(top, 'sub'))
+    for name, size in (('same', 5), ('grows', 10), ('shrinks', 10),
+                       ('goes', 4), ('sub/kind', 3)):
+        write(os.path.join(top, name), size)
+    old = FileSystemTree(top)
+    fname = str(tmp_path / 'snap')
+    old.save_snapshot(top, fname)
+
+    write(os.path.join(top, 'grows'), 30)
+    write(os.path.join(top, 'shrinks'), 1)
+    os.remove(os.path.join(top, 'goes'))
+    write(os.path.join(top, 'comes'), 8)
+    os.remove(os.path.join(top, 'sub', 'kind'))
+    os.mkdir(os.path.join(top, 'sub', 'kind'))
+    write(os.path.join(top, 'sub', 'kind', 'inner'), 2)
+    new = FileSystemTree(top)
+
+    snapshot = Snapshot(fname)
+    for diff in (diff_trees(old, new), diff_trees(snapshot, new)):
+        by_name = {sub._root: sub for sub in diff._subtrees}
+        assert sorted(by_name) == ['comes', 'goes', 'grows', 'shrinks', 'sub']
+        assert [by_name[name].leaf_key() for name in
+                ('comes', 'goes', 'grows', 'shrinks')] == \
+            [ADDED, REMOVED, GROWN, SHRUNK]
+        assert by_name['grows'].describe() == '+20 (10 -> 30)'
+        assert by_name['goes'].describe() == '-4 (removed)'
+        assert by_name['grows'].colour[1] > 0 == by_name['grows'].colour[0]
+        assert by_name['shrinks'].colour[0] > 0 == \
+            by_name['shrinks'].colour[1]
+        # A file replaced by a folder is removed, and the folder added.
+        kinds = sorted((sub._is_dir, sub.describe())
+                       for sub in by_name['sub']._subtrees)
+        assert kinds == [(False, '-3 (removed)'), (True, '+2 (added)')]
+        assert diff.data_size == 8 + 4 + 20 + 9 + 3 + 2
+    snapshot.close()
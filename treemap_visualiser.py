@@ -13,9 +13,27 @@ and detecting user events like mouse clicks and key presses and responding
 to them.
 """
 
+from __future__ import annotations
+import os
+import math
+import time
+import heapq
+from functools import lru_cache
+from itertools import groupby
+from random import choice
+from typing import Callable, List, Optional, Tuple, Union
+
 import pygame
 from tree_data import FileSystemTree, AbstractTree
 from population import PopulationTree
+from watcher import TreeWatcher
+from progressive import ProgressiveScan
+from journal import EditJournal
+from filters import FilteredTree, LeafFilter, unchanged_for, with_keys
+from snapshot import Snapshot
+from tree_diff import DiffTree, diff_trees
+from layout_strategies import STRATEGIES, LayoutStrategy
+import profiling
 
 # Screen dimensions and coordinates
 
@@ -25,126 +43,1197 @@ HEIGHT = 768
 FONT_HEIGHT = 30  # The height of the text display.
 TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 
+# Subtrees whose rectangle has a smaller area, in pixels, are drawn as a
+# single rectangle instead of one rectangle per leaf.
+MIN_AREA = 64
+
+# The most frames drawn per second, and the longest time in milliseconds
+# between checks for filesystem changes when watching a folder.
+MAX_FPS = 60
+WATCH_INTERVAL = 100
+
+# The delay and interval, in milliseconds, of repeated arrow key presses
+# while a key is held down.
+KEY_REPEAT_DELAY = 300
+KEY_REPEAT_INTERVAL = 30
+
+# The queries whose results are shown in the text display by pressing T, in
+# turn, and the number of results shown.
+QUERIES = ('largest', 'largest subtrees', 'size by type')
+QUERY_RESULTS = 5
+
+# The speed, in years per second, at which the years of a PopulationTree
+# are played, and the width in characters of the year slider.
+YEARS_PER_SECOND = 2
+YEAR_SLIDER = 20
+
+# The filters that pressing F shows, in turn, before showing every leaf
+# again: the leaves of the same type as the selected leaf (for files, the
+# same extension), the files of at least FILTER_MIN_SIZE bytes, and the
+# files not modified for FILTER_AGE seconds. A filter that hides the
+# selected leaf deselects it, so the one that needs it comes first.
+FILTERS = ('same type', 'large', 'old')
+FILTER_MIN_SIZE = 100 * 2 ** 20
+FILTER_AGE = 365 * 24 * 60 * 60
+
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
 
-def run_visualisation(tree: AbstractTree) -> None:
-    """Display an interactive graphical display of the given tree's treemap."""
+def run_visualisation(tree: AbstractTree,
+                      watcher: Optional[TreeWatcher] = None,
+                      engine: str = 'recursive',
+                      strategy: str = 'slice-and-dice',
+                      min_area: int = MIN_AREA,
+                      trace: Optional[str] = None,
+                      scan: Optional[ProgressiveScan] = None) -> LoopStats:
+    """Display an interactive graphical display of the given tree's treemap,
+    and return the counters of its event loop once the window is closed.
+
+    If <watcher> is given, the changes it detects are applied to <tree> and
+    shown while the visualisation runs.
+
+    <engine> selects the layout engine: 'recursive' (generate_treemap),
+    'numpy' (numpy_layout.generate_treemap_numpy, which requires NumPy) or
+    'parallel' (parallel_layout.generate_treemap_parallel, for very large
+    trees on machines with several cores).
+    <strategy> names the layout strategy in layout_strategies.STRATEGIES:
+    'slice-and-dice' or 'squarified'. Subtrees drawn smaller than <min_area>
+    pixels are shown as one rectangle, and clicking it selects the subtree.
+
+    If <trace> names a file, profiling is on for the whole run, and the
+    recorded phases are written to <trace> when the window is closed (see
+    profiling.Profiler.dump_trace).
+
+    If <scan> is given, <tree> is a partial tree it published, and the trees
+    it publishes later replace <tree> as they arrive (see event_loop).
+    """
+    if trace is not None:
+        profiling.enable()
+    layout = get_layout_engine(engine, strategy, min_area)
+
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    renderer = TreemapRenderer(screen)
 
     # Render the initial display of the static treemap.
-    render_display(screen, tree, '')
+    render_display(screen, tree, '', layout, renderer)
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    stats = event_loop(screen, tree, watcher, layout, renderer, scan)
+    if trace is not None:
+        profiling.disable().dump_trace(trace)
+    return stats
+
+
+def get_layout_engine(engine: str, strategy: str = 'slice-and-dice',
+                      min_area: int = 0) -> Callable:
+    """Return the layout function called <engine>, using the layout strategy
+    called <strategy> and the minimum area <min_area>.
+
+    A layout function is called as layout(tree, rect) and returns the same
+    rectangles as tree.generate_treemap(rect, STRATEGIES[strategy], min_area).
+
+    The numpy engine only supports the slice-and-dice strategy. The parallel
+    engine only lays out a tree in parallel the first time; see
+    _first_layout_parallel.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown layout strategy: {}'.format(strategy))
+    if engine == 'recursive':
+        if strategy == 'slice-and-dice' and min_area == 0:
+            return AbstractTree.generate_treemap
+        layout_strategy = STRATEGIES[strategy]
+        return lambda tree, rect: tree.generate_treemap(rect, layout_strategy,
+                                                        min_area)
+    elif engine == 'numpy':
+        if strategy != 'slice-and-dice':
+            raise ValueError('the numpy engine only supports slice-and-dice')
+        from numpy_layout import generate_treemap_numpy
+        if min_area == 0:
+            return generate_treemap_numpy
+        return lambda tree, rect: generate_treemap_numpy(tree, rect, min_area)
+    elif engine == 'parallel':
+        from parallel_layout import generate_treemap_parallel
+        layout_strategy = STRATEGIES[strategy]
+        return lambda tree, rect: _first_layout_parallel(
+            generate_treemap_parallel, tree, rect, layout_strategy, min_area)
+    raise ValueError('unknown layout engine: {}'.format(engine))
+
+
+def _first_layout_parallel(parallel: Callable, tree: AbstractTree,
+                           rect: Tuple[int, int, int, int],
+                           strategy: LayoutStrategy, min_area: int) -> list:
+    """Lay out <tree> with <parallel> (generate_treemap_parallel) if it
+    has never been laid out, and with generate_treemap otherwise.
+
+    Every parallel layout forks a new pool from this process, which has
+    threads once pygame is running, and leaves no incremental layout cache.
+    After the first layout, generate_treemap lays the tree out in full once
+    more to build its cache, and from then on only lays out again what
+    changed, which is far quicker than forking a pool for every redraw.
+    """
+    if tree._layout_bounds is None:
+        return parallel(tree, rect, strategy, min_area)
+    return tree.generate_treemap(rect, strategy, min_area)
 
 
 def render_display(screen: pygame.Surface, tree: AbstractTree,
-                   text: str) -> None:
+                   text: str,
+                   layout: Callable = AbstractTree.generate_treemap,
+                   renderer: Optional[TreemapRenderer] = None) -> None:
     """Render a treemap and text display to the given screen.
 
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
+
+    The treemap is laid out by <layout>; see get_layout_engine.
+
+    If <renderer> is given, it must draw to <screen>, and only the parts of
+    the screen that changed since its previous frame are redrawn. Otherwise
+    the whole screen is drawn.
+    """
+    if renderer is None:
+        renderer = TreemapRenderer(screen)
+    renderer.render(tree, text, layout)
+
+
+class TreemapRenderer:
+    """Draws treemaps and the text display to a pygame screen, redrawing only
+    what changed since the previous frame.
+
+    The treemap is drawn to an off-screen surface. Each frame, the new
+    rectangles are compared with the rectangles already drawn: the region
+    covering the rectangles that appeared or disappeared is cleared, the
+    rectangles overlapping it are drawn again in layout order, and only that
+    region is copied to the screen. The text display is only drawn again
+    when the text changes. pygame.display.update is then called on the
+    changed regions alone.
+
+    If profiling is on, the time spent drawing the treemap ('draw'), the
+    text ('text') and updating the display ('present') is recorded, and each
+    frame is closed with end_frame.
+
+    === Public Attributes ===
+    frames: the number of frames rendered.
+    render_seconds: the total time spent rendering them.
+    last_frame_seconds: the time spent rendering the most recent frame.
+    show_hud: True if the breakdown of the previous frame is shown at the
+        right of the text display while profiling is on.
+
+    === Private Attributes ===
+    _screen: the surface being drawn to.
+    _treemap: the off-screen surface holding the drawn treemap.
+    _drawn: the rectangles and colours drawn on _treemap, or None if
+        nothing has been drawn yet.
+    _text: the text and HUD text drawn on _screen, or None if nothing has
+        been drawn yet.
     """
-    # First, clear the screen
-    pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
-                     (0, 0, WIDTH, HEIGHT))
-    # TODO: Implement this function!
-    rectangles = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
+    frames: int
+    render_seconds: float
+    last_frame_seconds: float
+    show_hud: bool
+    _screen: pygame.Surface
+    _treemap: pygame.Surface
+    _drawn: Optional[list]
+    _text: Optional[Tuple[str, str]]
+
+    def __init__(self: TreemapRenderer, screen: pygame.Surface) -> None:
+        """Initialize a renderer that draws to <screen>."""
+        self.frames = 0
+        self.render_seconds = 0.0
+        self.last_frame_seconds = 0.0
+        self.show_hud = False
+        self._screen = screen
+        self._treemap = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        self._drawn = None
+        self._text = None
+
+    def render(self: TreemapRenderer, tree: AbstractTree, text: str,
+               layout: Callable = AbstractTree.generate_treemap) -> None:
+        """Lay out <tree> with <layout> and show it, with <text> below it."""
+        start = time.perf_counter()
+        profiler = profiling.current
+        dirty = []
+        rectangles = layout(tree, (0, 0, WIDTH, TREEMAP_HEIGHT))
+
+        phase_start = time.perf_counter()
+        region = self._draw_treemap(rectangles)
+        if region is not None:
+            self._screen.blit(self._treemap, region, region)
+            dirty.append(region)
+        if profiler is not None:
+            profiler.record('draw', phase_start)
+            phase_start = time.perf_counter()
+
+        hud = ''
+        if self.show_hud and profiler is not None:
+            hud = profiler.frame_summary()
+        if (text, hud) != self._text:
+            dirty.append(_render_text(self._screen, text, hud))
+            self._text = (text, hud)
+        if profiler is not None:
+            profiler.record('text', phase_start)
+            phase_start = time.perf_counter()
+
+        if dirty:
+            pygame.display.update(dirty)
+        if profiler is not None:
+            profiler.record('present', phase_start)
+            profiler.end_frame()
 
-    for rectangle in rectangles:
-        pygame.draw.rect(screen, rectangle[1], rectangle[0])
+        self.last_frame_seconds = time.perf_counter() - start
+        self.render_seconds += self.last_frame_seconds
+        self.frames += 1
 
-    _render_text(screen, text)
-    # This must be called *after* all other pygame functions have run.
-    pygame.display.flip()
+    def invalidate(self: TreemapRenderer) -> None:
+        """Make the next frame redraw the whole screen, e.g. after something
+        else has drawn over it."""
+        self._drawn = None
+        self._text = None
 
+    def _draw_treemap(self: TreemapRenderer, rectangles: list) \
+            -> Optional[pygame.Rect]:
+        """Bring the off-screen treemap up to date with <rectangles>, and
+        return the region that changed, or None if nothing changed."""
+        drawn = self._drawn
+        self._drawn = rectangles
+        full = pygame.Rect(0, 0, WIDTH, TREEMAP_HEIGHT)
+        surface = self._treemap
+        if drawn is not None:
+            if rectangles == drawn:
+                return None
+            changed = set(drawn).symmetric_difference(rectangles)
+            if changed:
+                region = pygame.Rect(changed.pop()[0]).unionall(
+                    [rect for rect, _ in changed]).clip(full)
+            else:
+                # The same rectangles in a different order.
+                region = full
+            if region.w * region.h * 2 < full.w * full.h:
+                black = pygame.color.THECOLORS['black']
+                surface.set_clip(region)
+                surface.fill(black, region)
+                rects = [rect for rect, _ in rectangles]
+                for i in region.collidelistall(rects):
+                    pygame.draw.rect(surface, rectangles[i][1], rects[i])
+                surface.set_clip(None)
+                return region
 
-def _render_text(screen: pygame.Surface, text: str) -> None:
-    """Render text at the bottom of the display."""
-    # The font we want to use
-    font = pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 8)
-    text_surface = font.render(text, 1, pygame.color.THECOLORS['white'])
+        surface.fill(pygame.color.THECOLORS['black'])
+        for rectangle in rectangles:
+            pygame.draw.rect(surface, rectangle[1], rectangle[0])
+        return full
+
+
+@lru_cache(maxsize=None)
+def _get_font(size: int) -> pygame.font.Font:
+    """Return the treemap font in <size>. Looking up a system font is slow,
+    so each size is only looked up once."""
+    return pygame.font.SysFont(FONT_FAMILY, size)
+
+
+@lru_cache(maxsize=64)
+def _text_surface(text: str) -> pygame.Surface:
+    """Return <text> rendered in the font of the text display."""
+    font = _get_font(FONT_HEIGHT - 8)
+    return font.render(text, 1, pygame.color.THECOLORS['white'])
+
+
+def _render_text(screen: pygame.Surface, text: str,
+                 hud: str = '') -> pygame.Rect:
+    """Render text at the bottom of the display, with <hud> at its right
+    end, and return the area of the display it covers."""
+    area = pygame.Rect(0, TREEMAP_HEIGHT, WIDTH, FONT_HEIGHT)
+    screen.fill(pygame.color.THECOLORS['black'], area)
 
     # Where to render the text_surface
     text_pos = (0, HEIGHT - FONT_HEIGHT + 4)
-    screen.blit(text_surface, text_pos)
+    screen.blit(_text_surface(text), text_pos)
+    if hud:
+        hud_surface = _text_surface(hud)
+        screen.blit(hud_surface, (WIDTH - hud_surface.get_width(),
+                                  text_pos[1]))
+    return area
+
+
+def measure_render(tree: AbstractTree, frames: int = 100,
+                   layout: Callable = AbstractTree.generate_treemap) \
+        -> Tuple[float, float]:
+    """Render <tree> once, then <frames> more times, each after growing a
+    random leaf with adjust_size, and return the time taken by the first
+    frame and the mean time of the others, in seconds.
+
+    Unless another SDL video driver is chosen, this uses the dummy driver,
+    so it needs no display.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    renderer = TreemapRenderer(screen)
+    renderer.render(tree, '', layout)
+    first = renderer.last_frame_seconds
+    for _ in range(frames):
+        leaves = [leaf for leaf in tree._layout_leaves if not leaf._subtrees]
+        if leaves:
+            leaf = choice(leaves)
+            leaf.adjust_size(True)
+            text = _describe(leaf)
+        else:
+            text = ''
+        renderer.render(tree, text, layout)
+    return first, (renderer.render_seconds - first) / max(frames, 1)
+
+
+class LoopStats:
+    """Counters describing one run of event_loop.
+
+    === Public Attributes ===
+    events: the number of events handled.
+    frames: the number of frames rendered.
+    resizes: the number of resizes made for arrow key presses; presses in
+        the same direction handled one after another in the same frame share
+        one resize.
+    key_presses: the number of arrow key presses, including repeats.
+    seconds: the wall-clock time the loop ran.
+    idle_seconds: the time spent waiting for events or for the next frame.
+    idle_cpu_seconds: the CPU time the process used while idle.
+    latency_total: the sum, over all frames, of the time from receiving the
+        first event of the frame to the end of rendering it.
+    latency_max: the longest such time.
+    """
+    events: int
+    frames: int
+    resizes: int
+    key_presses: int
+    seconds: float
+    idle_seconds: float
+    idle_cpu_seconds: float
+    latency_total: float
+    latency_max: float
+
+    def __init__(self: LoopStats) -> None:
+        """Initialize an empty set of counters."""
+        self.events = 0
+        self.frames = 0
+        self.resizes = 0
+        self.key_presses = 0
+        self.seconds = 0.0
+        self.idle_seconds = 0.0
+        self.idle_cpu_seconds = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def idle_cpu_percent(self: LoopStats) -> float:
+        """Return the CPU use while idle, as a percentage of one core."""
+        if self.idle_seconds <= 0:
+            return 0.0
+        return 100 * self.idle_cpu_seconds / self.idle_seconds
 
+    def mean_latency(self: LoopStats) -> float:
+        """Return the mean input-to-frame latency in seconds."""
+        if self.frames == 0:
+            return 0.0
+        return self.latency_total / self.frames
 
-def event_loop(screen: pygame.Surface, tree: AbstractTree) -> None:
+    def __str__(self: LoopStats) -> str:
+        return ('{} events, {} frames in {:.1f}s; idle CPU {:.1f}%, '
+                'latency {:.1f}ms mean, {:.1f}ms max; '
+                '{} key presses in {} resizes').format(
+                    self.events, self.frames, self.seconds,
+                    self.idle_cpu_percent(), 1000 * self.mean_latency(),
+                    1000 * self.latency_max, self.key_presses, self.resizes)
+
+
+def event_loop(screen: pygame.Surface, tree: AbstractTree,
+               watcher: Optional[TreeWatcher] = None,
+               layout: Callable = AbstractTree.generate_treemap,
+               renderer: Optional[TreemapRenderer] = None,
+               scan: Optional[ProgressiveScan] = None) -> LoopStats:
     """Respond to events (mouse clicks, key presses) and update the display.
 
     Note that the event loop is an *infinite loop*: it continually waits for
     the next event, determines the event's type, and then updates the state
     of the visualisation or the tree itself, updating the display if necessary.
-    This loop ends when the user closes the window.
+    This loop ends when the user closes the window, and returns the
+    counters of the run.
+
+    The loop sleeps until an event arrives, then handles every queued event
+    before drawing at most one frame, and draws no more than MAX_FPS frames
+    per second. Arrow key presses, including key repeats, that arrive
+    together are applied to the selected leaf in the order they arrived,
+    and each run of presses in the same direction as one resize.
+
+    Z (or scrolling up) zooms in: the view is re-rooted one level down,
+    at the subtree containing the selection (or, when scrolling, the
+    rectangle under the mouse). A folder left unscanned by a lazy
+    FileSystemTree is scanned when it is zoomed into. X, Backspace (or
+    scrolling down) zooms back out by one level.
+
+    Pressing T shows the answer to one of QUERIES about the displayed tree
+    in the text display, a different one each time: its largest leaves, its
+    largest subtrees, or the total size of its leaves of each kind (for
+    files, each extension). These come from the tree's AggregateIndex when
+    it has one (see AbstractTree.largest and size_by).
+
+    Resizing and deleting are made through an EditJournal: Ctrl+Z undoes
+    the most recent resize or delete that has not been undone, and Ctrl+Y
+    (or Ctrl+Shift+Z) redoes the most recently undone one. Changes made by
+    the watcher, or by moving between years, cannot be undone, and clear
+    the journal.
+
+    Pressing F shows only the leaves that match one of FILTERS, a different
+    one each time, and then every leaf again (see AbstractTree.filtered);
+    the text display shows the filter and the total size of the leaves it
+    matches. The index the filters use is built by the first F press, and
+    again after the tree has been edited; other presses only take time
+    proportional to the number of leaves matched. While a filter is shown,
+    arrow keys, deleting, undoing and redoing are ignored, and changes made
+    by the watcher or by moving between years are shown filtered.
+
+    If <tree> is a PopulationTree, Space plays its years, from the one shown
+    to the latest (or from the oldest, if the latest is shown), at
+    YEARS_PER_SECOND, and pauses the playback; Left and Right show the
+    previous and next year. While playing, a frame is drawn every
+    1 / MAX_FPS seconds, moving smoothly between years: each frame only
+    sets the sizes of the countries (PopulationTree.show_year), so the
+    treemap is laid out again incrementally. The text display shows the
+    year on a slider.
+
+    Pressing H toggles the performance HUD, which turns profiling on while
+    it is shown (unless it was already on) and shows the breakdown of the
+    previous frame in the text display. While profiling is on, the
+    handlers of watcher changes ('watch'), clicks ('select', 'delete'),
+    arrow keys ('resize'), zooming ('zoom'), queries ('query'), undoing and
+    redoing ('undo'), filters ('filter') and moving between years ('year')
+    are timed; the 'hit_test' phase of a click is included in its handler's
+    time.
+
+    If <watcher> is given, it is polled for filesystem changes at least every
+    WATCH_INTERVAL milliseconds. The treemap is laid out by <layout>, and
+    drawn by <renderer>, which must draw to <screen>; a new renderer is used
+    if it is not given.
+
+    If <scan> is given, <tree> is a partial tree published by that scan. The
+    scan is polled for newer trees at least every WATCH_INTERVAL
+    milliseconds, and each one replaces the displayed tree; the selection
+    and the view move to the nodes with the same paths in the new tree.
+    Selecting, zooming and quitting work while the scan runs, but arrow
+    keys and deleting are ignored until it has finished, since changes to a
+    partial tree would be lost when the next tree arrives, and so are
+    filters, since each new tree would need a new index. If the scan fails,
+    the error is shown in the text display.
     """
-    # We strongly recommend using a variable to keep track of the currently-
-    # selected leaf (type AbstractTree | None).
-    # But feel free to remove it, and/or add new variables, to help keep
-    # track of the state of the program.
-    selected_leaf = None
-    text = ''
+    if renderer is None:
+        renderer = TreemapRenderer(screen)
+    state = _LoopState(tree, scan)
+    stats = LoopStats()
+    clock = pygame.time.Clock()
+    pygame.key.set_repeat(KEY_REPEAT_DELAY, KEY_REPEAT_INTERVAL)
+    started = time.perf_counter()
 
     while True:
-        # Wait for an event
-        event = pygame.event.poll()
+        events, received = _wait_for_events(state, watcher is not None,
+                                            stats)
+        state.redraw = False
+        if watcher is not None:
+            _poll_watcher(state, watcher)
+        if state.scan is not None:
+            _poll_scan(state)
+        if state.played is not None:
+            _play(state)
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                stats.seconds = time.perf_counter() - started
+                return stats
+            _handle_event(state, event, renderer, stats)
+
+        if _apply_presses(state, stats):
+            state.text = _describe(state.selected)
+            state.redraw = True
+
+        if state.redraw:
+            _draw_frame(screen, state, layout, renderer, stats, received,
+                        clock)
+
+
+class _LoopState:
+    """The state of a run of event_loop, which the helpers handling its
+    events update.
+
+    === Public Attributes ===
+    tree: the tree visualised; while a scan runs, each tree it publishes
+        replaces it.
+    view: the tree whose treemap is displayed: <tree>, the view of <tree>
+        under the filter shown, or one of their subtrees.
+    selected: the selected leaf or subtree, or None.
+    text: the text display.
+    redraw: True if the display must be drawn again after the events being
+        handled.
+    journal: the journal that edits of <tree> are made through.
+    scan: the scan publishing <tree>, or None if there is none or it has
+        finished.
+    presses: the arrow key presses not yet applied to <selected>, in the
+        order they arrived: True for Up and False for Down.
+    query: the position in QUERIES of the query shown by the next T press.
+    timeline: the tree whose years can be played, or None.
+    played: the perf_counter time the playback last moved on, or None
+        while it is paused.
+    filtered: the view of <tree> under the filter shown, or None if there
+        is none.
+    filter_at: the position in FILTERS of the filter shown, or -1.
+    edited: True if <tree> has been edited since its AttributeIndex, if
+        any, was built.
+    hud_profiler: the profiler turned on by the HUD, or None if it is off.
+    """
+    tree: AbstractTree
+    view: AbstractTree
+    selected: Optional[AbstractTree]
+    text: str
+    redraw: bool
+    journal: EditJournal
+    scan: Optional[ProgressiveScan]
+    presses: List[bool]
+    query: int
+    timeline: Optional[PopulationTree]
+    played: Optional[float]
+    filtered: Optional[FilteredTree]
+    filter_at: int
+    edited: bool
+    hud_profiler: Optional[profiling.Profiler]
+
+    def __init__(self: _LoopState, tree: AbstractTree,
+                 scan: Optional[ProgressiveScan]) -> None:
+        """Initialize the state of a loop showing <tree>, published by
+        <scan> if it is not None."""
+        self.tree = tree
+        self.view = tree
+        self.selected = None
+        self.text = ''
+        self.redraw = False
+        self.journal = EditJournal(tree)
+        self.scan = scan
+        self.presses = []
+        self.query = 0
+        self.timeline = tree if isinstance(tree, PopulationTree) and \
+            tree.years else None
+        self.played = None
+        self.filtered = None
+        self.filter_at = -1
+        self.edited = False
+        self.hud_profiler = None
+
+
+def _wait_for_events(state: _LoopState, watching: bool,
+                     stats: LoopStats) -> Tuple[list, float]:
+    """Sleep until an event arrives, or until the next frame of the
+    playback or the next poll of the watcher (if <watching> is True) or of
+    the scan is due. Return the queued events and the perf_counter time
+    the sleep ended, and record it in <stats>."""
+    idle_wall, idle_cpu = time.perf_counter(), time.process_time()
+    if state.played is not None:
+        timeout = 1000 // MAX_FPS
+    else:
+        timeout = WATCH_INTERVAL if watching or state.scan else 0
+    event = pygame.event.wait(timeout)
+    received = time.perf_counter()
+    stats.idle_seconds += received - idle_wall
+    stats.idle_cpu_seconds += time.process_time() - idle_cpu
+
+    events = pygame.event.get()
+    if event.type != pygame.NOEVENT:
+        events.insert(0, event)
+    stats.events += len(events)
+    return events, received
+
+
+def _draw_frame(screen: pygame.Surface, state: _LoopState,
+                layout: Callable, renderer: TreemapRenderer,
+                stats: LoopStats, received: float,
+                clock: pygame.time.Clock) -> None:
+    """Draw the display of <state> and record the frame, whose first event
+    was received at <received>, in <stats>. Then sleep off the rest of the
+    frame with <clock>; events arriving meanwhile are handled together in
+    the next pass."""
+    render_display(screen, state.view, state.text, layout, renderer)
+    latency = time.perf_counter() - received
+    stats.frames += 1
+    stats.latency_total += latency
+    stats.latency_max = max(stats.latency_max, latency)
+
+    idle_wall, idle_cpu = time.perf_counter(), time.process_time()
+    clock.tick(MAX_FPS)
+    stats.idle_seconds += time.perf_counter() - idle_wall
+    stats.idle_cpu_seconds += time.process_time() - idle_cpu
+
+
+def _record(phase: str, start: float) -> None:
+    """Record <phase>, which started at <start>, if profiling is on."""
+    if profiling.current is not None:
+        profiling.current.record(phase, start)
+
+
+def _handle_event(state: _LoopState, event: pygame.event.Event,
+                  renderer: TreemapRenderer, stats: LoopStats) -> None:
+    """Update <state> for <event>, which is not a QUIT event."""
+    key = event.key if event.type == pygame.KEYDOWN else None
+    zoom = _zoom_step(event)
+    if key == pygame.K_h:
+        _toggle_hud(state, renderer)
+    elif key == pygame.K_t:
+        _show_query(state)
+    elif state.timeline is not None and \
+            key in (pygame.K_SPACE, pygame.K_LEFT, pygame.K_RIGHT):
+        _move_year(state, key)
+    elif key == pygame.K_f and state.scan is None:
+        _toggle_filter(state, stats)
+    elif key in (pygame.K_z, pygame.K_y) and event.mod & pygame.KMOD_CTRL:
+        if state.filtered is None:
+            _undo_redo(state, key == pygame.K_y or
+                       bool(event.mod & pygame.KMOD_SHIFT), stats)
+    elif zoom:
+        _zoom(state, event, zoom, stats)
+    elif key in (pygame.K_UP, pygame.K_DOWN):
+        # Only leaves can be resized; a selected subtree cannot.
+        if state.selected and not state.selected._subtrees and \
+                state.scan is None and state.filtered is None:
+            state.presses.append(key == pygame.K_UP)
+    elif event.type == pygame.MOUSEBUTTONUP and event.button in (1, 3):
+        _click(state, event, stats)
+
+
+def _poll_watcher(state: _LoopState, watcher: TreeWatcher) -> None:
+    """Show the changes <watcher> made to the tree of <state>, if any."""
+    phase_start = time.perf_counter()
+    if watcher.poll():
+        _changed_outside(state)
+        if state.filtered is not None:
+            state.text = _filter_text(state.tree, state.filtered)
+        if state.selected is not None and state.selected.is_empty():
+            state.selected = None
+            state.text = ''
+        shown = state.filtered or state.tree
+        if not _contains(shown, state.view):
+            state.view = shown
+        state.redraw = True
+    _record('watch', phase_start)
+
+
+def _poll_scan(state: _LoopState) -> None:
+    """Show the newest tree published by state.scan, if it published one
+    since the last poll, keeping the selection and the view on the nodes
+    with the same paths, and stop polling once the scan has finished."""
+    scan = state.scan
+    finished = scan.done
+    new_tree = scan.poll()
+    if new_tree is not None:
+        if state.selected is not None:
+            state.selected = _same_node(new_tree, state.selected)
+        state.view = _same_node(new_tree, state.view) or new_tree
+        state.tree = new_tree
+        state.journal = EditJournal(new_tree)
+        state.edited = False
+        if state.selected is not None:
+            state.text = _describe(state.selected)
+        elif state.view is not new_tree:
+            state.text = _describe(state.view)
+        else:
+            state.text = ''
+        state.redraw = True
+    if finished:
+        if scan.error is not None:
+            state.text = 'scan failed: {}'.format(scan.error)
+            state.redraw = True
+        state.scan = None
+
+
+def _play(state: _LoopState) -> None:
+    """Move the playback of the years of state.timeline on to now."""
+    phase_start = time.perf_counter()
+    timeline = state.timeline
+    last = len(timeline.years) - 1
+    position = min(timeline.position +
+                   (phase_start - state.played) * YEARS_PER_SECOND, last)
+    state.played = phase_start if position < last else None
+    timeline.show_year(position)
+    _changed_outside(state)
+    state.text = _year_text(timeline, state.selected)
+    state.redraw = True
+    _record('year', phase_start)
 
-        if event.type == pygame.QUIT:
-            return
 
-        if event.type == pygame.MOUSEBUTTONUP and event.button == 1:  # left click to select or deselect
-            leaf = tree.find_rect(pygame.mouse.get_pos())
+def _move_year(state: _LoopState, key: int) -> None:
+    """Play or pause the years of state.timeline for Space, or show the
+    previous or next year for the Left or Right arrow <key>."""
+    phase_start = time.perf_counter()
+    timeline = state.timeline
+    last = len(timeline.years) - 1
+    if key != pygame.K_SPACE:
+        state.played = None
+        if key == pygame.K_LEFT:
+            position = max(math.ceil(timeline.position) - 1, 0)
+        else:
+            position = min(int(timeline.position) + 1, last)
+        timeline.show_year(position)
+    elif state.played is not None:
+        state.played = None
+    else:
+        if timeline.position >= last:
+            timeline.show_year(0)
+        state.played = phase_start
+    _changed_outside(state)
+    state.text = _year_text(timeline, state.selected)
+    state.redraw = True
+    _record('year', phase_start)
 
-            if selected_leaf == leaf:  # deselect
-                selected_leaf = None
-                text = ''
-                render_display(screen, tree, text)
 
-            else:  # select
-                selected_leaf = leaf
-                text = selected_leaf.get_path() + '  ' + '(' + \
-                       str(selected_leaf.data_size) + ')'
-                render_display(screen, tree, text)
+def _toggle_filter(state: _LoopState, stats: LoopStats) -> None:
+    """Show the filter after the one shown in FILTERS, or every leaf after
+    the last one, after applying the queued arrow key presses."""
+    _apply_presses(state, stats)
+    phase_start = time.perf_counter()
+    state.selected = _source(state.selected)
+    state.view = _source(state.view)
+    state.filter_at, leaf_filter = _next_filter(state.filter_at,
+                                                state.selected)
+    if leaf_filter is None:
+        state.filtered = None
+    else:
+        state.filtered = state.tree.filtered(leaf_filter, state.edited)
+        state.edited = False
+        state.view, state.selected = _filter_view(
+            state.filtered, state.view, state.selected)
+    state.text = _filter_text(state.tree, state.filtered)
+    state.redraw = True
+    _record('filter', phase_start)
 
-        if event.type == pygame.MOUSEBUTTONUP and event.button == 3:  # right click to delete
-            leaf = tree.find_rect(pygame.mouse.get_pos())
-            leaf.del_update_parents()
-            leaf.delete_leaf()
-            render_display(screen, tree, text)
 
-        if event.type == pygame.KEYUP:  # Key Press
-            if selected_leaf:
+def _changed_outside(state: _LoopState) -> None:
+    """Clear state.journal after state.tree was changed other than
+    through it, and show the changed tree under the filter shown, if any.
+    """
+    state.journal.clear()
+    if state.filtered is None:
+        state.edited = True
+    else:
+        state.filtered, state.view, state.selected = _refilter(
+            state.tree, state.filtered, state.view, state.selected)
+
+
+def _toggle_hud(state: _LoopState, renderer: TreemapRenderer) -> None:
+    """Show or hide the performance HUD drawn by <renderer>, turning
+    profiling on while it is shown if it was off."""
+    renderer.show_hud = not renderer.show_hud
+    if renderer.show_hud and profiling.current is None:
+        state.hud_profiler = profiling.enable()
+    elif not renderer.show_hud and state.hud_profiler is not None:
+        profiling.disable()
+        state.hud_profiler = None
+    state.redraw = True
+
+
+def _show_query(state: _LoopState) -> None:
+    """Show the results of the next of QUERIES about the displayed tree."""
+    phase_start = time.perf_counter()
+    state.text = _query_text(state.view, QUERIES[state.query])
+    state.query = (state.query + 1) % len(QUERIES)
+    state.redraw = True
+    _record('query', phase_start)
+
+
+def _zoom_step(event: pygame.event.Event) -> int:
+    """Return 1 if <event> zooms in, -1 if it zooms out, or 0 otherwise."""
+    if event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_z:
+            return 1
+        if event.key in (pygame.K_x, pygame.K_BACKSPACE):
+            return -1
+    elif event.type == pygame.MOUSEWHEEL and event.y:
+        return 1 if event.y > 0 else -1
+    return 0
+
+
+def _zoom(state: _LoopState, event: pygame.event.Event, zoom: int,
+          stats: LoopStats) -> None:
+    """Zoom in one level (if <zoom> is 1) or out, for <event>."""
+    _apply_presses(state, stats)
+    phase_start = time.perf_counter()
+    view = state.view
+    if zoom < 0:
+        new_view = view._parent_tree or view
+    elif event.type == pygame.MOUSEWHEEL:
+        new_view = _zoom_in(view, view.find_rect(pygame.mouse.get_pos()))
+    else:
+        new_view = _zoom_in(view, state.selected)
+    if new_view is not view:
+        state.view = new_view
+        state.selected = None
+        state.text = _describe(new_view) if new_view._parent_tree else ''
+        state.redraw = True
+    _record('zoom', phase_start)
 
-                if event.key == pygame.K_UP:  # Up Arrow
 
-                    selected_leaf.adjust_size(True)
-                    text = selected_leaf.get_path() + '  ' + '(' + \
-                           str(selected_leaf.data_size) + ')'
-                    render_display(screen, tree, text)
+def _click(state: _LoopState, event: pygame.event.Event,
+           stats: LoopStats) -> None:
+    """Select or deselect the leaf under a left click, or delete the leaf
+    under a right click."""
+    # A click acts on the layout on the screen, so apply any pending
+    # resizes first without drawing them.
+    _apply_presses(state, stats)
 
-                if event.key == pygame.K_DOWN:  # Down Arrow
+    phase_start = time.perf_counter()
+    leaf = state.view.find_rect(event.pos)
+    if event.button == 1:  # left click to select or deselect
+        if leaf is None or state.selected == leaf:  # deselect
+            state.selected = None
+            state.text = ''
+        else:  # select
+            state.selected = leaf
+            state.text = _describe(leaf)
+        state.redraw = True
+        _record('select', phase_start)
 
-                    selected_leaf.adjust_size(False)
-                    text = selected_leaf.get_path() + '  ' + '(' + \
-                           str(selected_leaf.data_size) + ')'
-                    render_display(screen, tree, text)
+    elif leaf is not None and state.scan is None and state.filtered is None:
+        # right click to delete
+        state.journal.delete(leaf)
+        state.edited = True
+        if _drop_removed(state):
+            state.text = ''
+        state.redraw = True
+        _record('delete', phase_start)
 
-        # TODO: detect and respond to other types of events.
-        # Remember to call render_display if any data_sizes change,
-        # as the treemap will change in this case.
+
+def _undo_redo(state: _LoopState, redo: bool, stats: LoopStats) -> None:
+    """Redo (if <redo> is True) or undo an edit made through
+    state.journal, after applying the queued arrow key presses."""
+    _apply_presses(state, stats)
+    phase_start = time.perf_counter()
+    if state.journal.redo() if redo else state.journal.undo():
+        state.edited = True
+        _drop_removed(state)
+        if state.selected is not None:
+            state.text = _describe(state.selected)
+        elif state.view is not state.tree:
+            state.text = _describe(state.view)
+        else:
+            state.text = ''
+        state.redraw = True
+    _record('undo', phase_start)
+
+
+def _drop_removed(state: _LoopState) -> bool:
+    """Deselect the selected tree, and show the whole tree instead of the
+    displayed one, if they are no longer in state.tree after an edit.
+    Return True if either was."""
+    dropped = False
+    if state.selected is not None and \
+            not _contains(state.tree, state.selected):
+        state.selected = None
+        dropped = True
+    if not _contains(state.tree, state.view):
+        state.view = state.tree
+        dropped = True
+    return dropped
+
+
+def _apply_presses(state: _LoopState, stats: LoopStats) -> bool:
+    """Apply the queued arrow key presses to the selected leaf, and return
+    True if there were any."""
+    if _resize(state.journal, state.selected, state.presses, stats):
+        state.edited = True
+        return True
+    return False
+
+
+def _resize(journal: EditJournal, leaf: Optional[AbstractTree],
+            presses: List[bool], stats: LoopStats) -> bool:
+    """Apply the arrow key <presses> to <leaf> through <journal>, in order,
+    True for Up and False for Down, and empty <presses>. Return True if
+    there were any.
+
+    Each run of presses in the same direction is applied as one resize.
+    """
+    if not presses:
+        return False
+    profiler = profiling.current
+    start = time.perf_counter()
+    for case, run in groupby(presses):
+        journal.adjust(leaf, case, len(list(run)))
+        stats.resizes += 1
+    stats.key_presses += len(presses)
+    presses.clear()
+    if profiler is not None:
+        profiler.record('resize', start)
+    return True
 
 
-def run_treemap_file_system(path: str) -> None:
+def _zoom_in(view: AbstractTree,
+             target: Optional[AbstractTree]) -> AbstractTree:
+    """Return the subtree of <view> that contains <target>, expanding it
+    first, or <view> itself if there is no such subtree with subtrees of its
+    own."""
+    step = target
+    while step is not None and step._parent_tree is not view:
+        step = step._parent_tree
+    if step is None:
+        return view
+    step.expand()
+    return step if step._subtrees else view
+
+
+def _contains(tree: AbstractTree, subtree: AbstractTree) -> bool:
+    """Return True if <subtree> is <tree> or a non-empty subtree inside it.
+    """
+    if subtree.is_empty():
+        return False
+    while subtree is not None and subtree is not tree:
+        subtree = subtree._parent_tree
+    return subtree is tree
+
+
+def _same_node(tree: AbstractTree,
+               node: AbstractTree) -> Optional[AbstractTree]:
+    """Return the node of <tree> with the same path as <node> has in its
+    own tree, or None if there is no such node."""
+    names = []
+    while node._parent_tree is not None:
+        names.append(node._root)
+        node = node._parent_tree
+    node = tree
+    for name in reversed(names):
+        node = next((subtree for subtree in node._subtrees
+                     if subtree._root == name), None)
+        if node is None:
+            return None
+    return node
+
+
+def _query_text(tree: AbstractTree, query: str) -> str:
+    """Return the text displayed for the results of <query>, one of
+    QUERIES, about <tree>."""
+    if query == 'size by type':
+        totals = tree.size_by()
+        parts = ['{} {}'.format(key or '(none)', round(size))
+                 for key, size in heapq.nlargest(
+                     QUERY_RESULTS, totals.items(), key=lambda item: item[1])]
+    else:
+        parts = ['{} {}'.format(node._root, round(node.data_size))
+                 for node in tree.largest(QUERY_RESULTS,
+                                          query == 'largest subtrees')]
+    return query + ': ' + (', '.join(parts) or 'none')
+
+
+def _year_text(tree: PopulationTree,
+               selected: Optional[AbstractTree]) -> str:
+    """Return the text displayed while moving between the years of <tree>:
+    the year shown on a slider, followed by the description of <selected>,
+    if it is not None."""
+    last = len(tree.years) - 1
+    filled = round(YEAR_SLIDER * tree.position / last) if last \
+        else YEAR_SLIDER
+    text = '{}  {} [{}{}] {}'.format(
+        tree.year_label(), tree.years[0], '=' * filled,
+        '-' * (YEAR_SLIDER - filled), tree.years[-1])
+    if selected is not None:
+        text += '  ' + _describe(selected)
+    return text
+
+
+def _next_filter(position: int, selected: Optional[AbstractTree]) \
+        -> Tuple[int, Optional[LeafFilter]]:
+    """Return the position in FILTERS of the filter shown after the one at
+    <position> (-1 for none), and that filter, skipping 'same type' if
+    <selected> has no type; or -1 and None after the last filter."""
+    for position in range(position + 1, len(FILTERS)):
+        if FILTERS[position] == 'large':
+            return position, LeafFilter('at least {} MB'.format(
+                FILTER_MIN_SIZE >> 20), min_size=FILTER_MIN_SIZE)
+        if FILTERS[position] == 'old':
+            return position, unchanged_for(FILTER_AGE)
+        key = selected.leaf_key() if selected is not None else None
+        if key is not None:
+            return position, with_keys(key)
+    return -1, None
+
+
+def _refilter(tree: AbstractTree, filtered: FilteredTree,
+              view: AbstractTree, selected: Optional[AbstractTree]) \
+        -> Tuple[FilteredTree, AbstractTree, Optional[AbstractTree]]:
+    """Return a new view of <tree>, which has been edited since <filtered>
+    was made, under the same filter, with a new index, and the views in it
+    of <view> and <selected> (see _filter_view)."""
+    filtered = tree.filtered(filtered.leaf_filter, True)
+    return (filtered,) + _filter_view(filtered, view, selected)
+
+
+def _source(tree: Optional[AbstractTree]) -> Optional[AbstractTree]:
+    """Return the tree <tree> is a view of, if it is a FilteredTree, or
+    <tree> itself."""
+    return tree.source if isinstance(tree, FilteredTree) else tree
+
+
+def _filter_view(filtered: FilteredTree, view: AbstractTree,
+                 selected: Optional[AbstractTree]) \
+        -> Tuple[AbstractTree, Optional[AbstractTree]]:
+    """Return the views in <filtered> of the displayed tree <view> and the
+    selection <selected>, which may be trees or views of an older filter:
+    <filtered> itself if <view> has no matching leaves, and None if
+    <selected> has none or is not in the new view."""
+    new_view = filtered.view_of(_source(view)) or filtered
+    if selected is not None:
+        selected = new_view.view_of(_source(selected))
+    return new_view, selected
+
+
+def _filter_text(tree: AbstractTree, filtered: Optional[FilteredTree]) -> str:
+    """Return the text displayed when <filtered>, a view of <tree>, is
+    shown, or '' if it is None."""
+    if filtered is None:
+        return ''
+    return 'filter: {}  ({} of {})'.format(
+        filtered.leaf_filter.name, round(filtered.data_size),
+        round(tree.data_size))
+
+
+def _describe(tree: AbstractTree) -> str:
+    """Return the text displayed when <tree> is selected. For a DiffTree,
+    this shows how it changed rather than its data_size."""
+    source = _source(tree)
+    if isinstance(source, DiffTree):
+        return tree.get_path() + '  ' + source.describe()
+    return tree.get_path() + '  ' + '(' + str(tree.data_size) + ')'
+
+
+def run_treemap_file_system(path: Union[str, List[str]],
+                            snapshot: Optional[str] = None,
+                            watch: bool = False,
+                            max_depth: Optional[int] = None,
+                            estimate: bool = False,
+                            progressive: bool = True,
+                            follow_symlinks: bool = True,
+                            one_filesystem: bool = False,
+                            verbose: bool = False) -> None:
     """Run a treemap visualisation for the given path's file structure.
 
-    Precondition: <path> is a valid path to a file or folder.
+    If <path> is a list of paths, they are all scanned, and shown under one
+    root (see FileSystemTree.from_roots); none of the options below but
+    <follow_symlinks> and <one_filesystem> can be used then.
+
+    Symbolic links are followed if <follow_symlinks> is True, and only the
+    filesystem of each scanned folder is scanned if <one_filesystem> is
+    True. Hard links, and folders reached twice, are always counted once.
+
+    If <snapshot> names a snapshot file, it is used to rescan only the
+    directories that changed since the last run, and is then updated with
+    the new scan.
+
+    If <watch> is True and <path> is a folder, the treemap is kept up to date
+    with changes to the folder while it is displayed (Linux only).
+
+    If <max_depth> is given, only folders up to <max_depth> levels below
+    <path> are scanned before the treemap is shown; deeper folders are sized
+    (or, if <estimate> is True, have their sizes estimated) and are scanned
+    when they are zoomed into. This cannot be combined with <snapshot> or
+    <watch>.
+
+    Otherwise, if <progressive> is True and <path> is a folder, the folder
+    is scanned in the background: the window opens as soon as the folder
+    itself has been listed, and the treemap grows as the scan goes on (see
+    progressive.ProgressiveScan).
+
+    If <verbose> is True, the statistics of the scan (see
+    scanner.ScanStats) and of the event loop (see LoopStats) are printed.
+
+    Precondition: <path> is a valid path to a file or folder, or a list of
+    such paths.
+    """
+    if not isinstance(path, str):
+        if snapshot is not None or watch or max_depth is not None:
+            raise ValueError('several roots can only be scanned in full')
+        file_tree = FileSystemTree.from_roots(path,
+                                              follow_symlinks=follow_symlinks,
+                                              one_filesystem=one_filesystem)
+        if verbose:
+            print(file_tree.scan_stats)
+        stats = run_visualisation(file_tree)
+        if verbose:
+            print(stats)
+        return
+    if max_depth is not None and (snapshot is not None or watch):
+        raise ValueError('lazy scanning cannot be combined with snapshots '
+                         'or watching')
+    if progressive and snapshot is None and not watch and \
+            max_depth is None and os.path.isdir(path):
+        scan = ProgressiveScan(path, follow_symlinks=follow_symlinks,
+                               one_filesystem=one_filesystem)
+        try:
+            stats = run_visualisation(scan.next_tree(), scan=scan)
+        finally:
+            scan.cancel()
+        final_tree = scan.wait(0)
+        if verbose:
+            if final_tree is not None:
+                print(final_tree.scan_stats)
+            print(stats)
+        return
+    file_tree = FileSystemTree(path, snapshot=snapshot, max_depth=max_depth,
+                               estimate=estimate,
+                               follow_symlinks=follow_symlinks,
+                               one_filesystem=one_filesystem)
+    if verbose:
+        print(file_tree.scan_stats)
+    if snapshot is not None and os.path.isdir(path):
+        file_tree.save_snapshot(path, snapshot)
+    watcher = None
+    if watch and os.path.isdir(path):
+        watcher = TreeWatcher(file_tree, path)
+    try:
+        stats = run_visualisation(file_tree, watcher)
+    finally:
+        if watcher is not None:
+            watcher.close()
+    if verbose:
+        print(stats)
+
+
+def run_treemap_diff(old: str, new: str, verbose: bool = False) -> None:
+    """Run a treemap visualisation of what changed from <old> to <new>, each
+    a snapshot file saved by FileSystemTree.save_snapshot or a file or
+    folder to scan now (see tree_diff.diff_trees). Files that grew are drawn
+    in green and files that shrank in red, with areas proportional to the
+    change.
+
+    For example, to see what grew since yesterday, save a snapshot of a
+    folder each day (run_treemap_file_system(path, snapshot=...) does), copy
+    it aside, and compare the copy with the folder:
+        run_treemap_diff('yesterday.snap', path)
+
+    If <verbose> is True, the total growth, in bytes, and the statistics of
+    the event loop (see LoopStats) are printed.
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
+    scans = []
+    try:
+        for path in (old, new):
+            if os.path.isfile(path):
+                try:
+                    scans.append(Snapshot(path))
+                    continue
+                except ValueError:
+                    pass  # not a snapshot, so a file to scan
+            scans.append(FileSystemTree(path))
+        diff_tree = diff_trees(scans[0], scans[1])
+    finally:
+        for scan in scans:
+            if isinstance(scan, Snapshot):
+                scan.close()
+        scans.clear()
+    if verbose:
+        print('{:+} bytes'.format(diff_tree.growth()))
+    stats = run_visualisation(diff_tree)
+    if verbose:
+        print(stats)
 
 
 def run_treemap_population() -> None:
@@ -158,7 +1247,11 @@ if __name__ == '__main__':
 
     python_ta.check_all(
         config={
-            'extra-imports': ['pygame', 'tree_data', 'population'],
+            'extra-imports': ['os', 'math', 'time', 'heapq', 'functools',
+                              'itertools', 'random', 'pygame', 'tree_data',
+                              'population', 'watcher', 'progressive',
+                              'journal', 'filters', 'snapshot', 'tree_diff',
+                              'layout_strategies', 'profiling'],
             'generated-members': 'pygame.*'})
 
     # '/Users/macowner/Desktop/UTM/SECOND YEAR/CSC148/assignments/a2' (OSX)
@@ -0,0 +1,242 @@
+import os
+
+import pygame
+
+from benchmarks import RECT, make_tree
+from journal import EditJournal
+from layout_strategies import SQUARIFIED
+from progressive import ProgressiveScan
+from tree_data import FileSystemTree
+from treemap_visualiser import HEIGHT, TREEMAP_HEIGHT, WIDTH, LoopStats, \
+    TreemapRenderer, _LoopState, _changed_outside, _drop_removed, \
+    _handle_event, _poll_scan, _resize, _text_surface, _toggle_filter, \
+    _undo_redo, event_loop, get_layout_engine, measure_render
+
+
+def arrow(up: bool) -> pygame.event.Event:
+    """Return a press of the Up (if <up> is True) or Down arrow key."""
+    return pygame.event.Event(pygame.KEYDOWN, mod=0,
+                              key=pygame.K_UP if up else pygame.K_DOWN)
+
+
+def click(pos: tuple) -> pygame.event.Event:
+    """Return a left click at <pos>."""
+    return pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=pos)
+
+
+def key(key: int, mod: int = 0) -> pygame.event.Event:
+    """Return a press of <key> with the modifiers <mod>."""
+    return pygame.event.Event(pygame.KEYDOWN, key=key, mod=mod)
+
+
+def resized(size: int, presses: list) -> int:
+    """Return the size of a leaf of <size> after <presses>, one at a
+    time."""
+    tree = make_tree('wide', 1)
+    leaf = tree._subtrees[0]
+    leaf.set_size(size)
+    for case in presses:
+        leaf.adjust_size(case)
+    return leaf.data_size
+
+
+def test_resize_in_arrival_order() -> None:
+    tree = make_tree('wide', 10)
+    leaf = tree._subtrees[0]
+    leaf.set_size(1000)
+    presses = [True] * 3 + [False] * 20 + [True] * 5
+    expected = resized(1000, presses)
+    stats = LoopStats()
+    journal = EditJournal(tree)
+    assert _resize(journal, leaf, presses, stats)
+    assert leaf.data_size == expected
+    assert presses == []
+    assert (stats.resizes, stats.key_presses) == (3, 28)
+    assert not _resize(journal, leaf, presses, stats)
+    for _ in range(3):
+        assert journal.undo()
+    assert leaf.data_size == 1000
+
+
+def test_event_loop_applies_presses_in_order() -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    tree = make_tree('wide', 10)
+    (x, y, _, _), _ = tree.generate_treemap(
+        (0, 0, WIDTH, TREEMAP_HEIGHT))[0]
+    leaf = tree.find_rect((x, y))
+    presses = [False] * 30 + [True] * 30
+    expected = resized(leaf.data_size, presses)
+    pygame.event.clear()
+    # The second click applies the presses queued before it.
+    for event in [click((x, y))] + [arrow(up) for up in presses] + \
+            [click((x, y)), pygame.event.Event(pygame.QUIT)]:
+        pygame.event.post(event)
+    stats = event_loop(screen, tree)
+    assert leaf.data_size == expected
+    assert (stats.resizes, stats.key_presses) == (2, 60)
+    assert tree.data_size == sum(sub.data_size for sub in tree._subtrees)
+
+
+def test_handle_event_zoom_query_and_hud() -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    renderer = TreemapRenderer(pygame.display.set_mode((WIDTH, HEIGHT)))
+    tree = make_tree('balanced', 1000)
+    state = _LoopState(tree, None)
+    stats = LoopStats()
+    (x, y, _, _), _ = tree.generate_treemap(
+        (0, 0, WIDTH, TREEMAP_HEIGHT))[0]
+    _handle_event(state, click((x, y)), renderer, stats)
+    leaf = state.selected
+    assert leaf is not None and state.redraw
+    _handle_event(state, key(pygame.K_z), renderer, stats)
+    assert state.view._parent_tree is tree
+    assert leaf.get_path().startswith(state.view.get_path())
+    assert state.selected is None
+    _handle_event(state, key(pygame.K_BACKSPACE), renderer, stats)
+    assert state.view is tree and state.text == ''
+    _handle_event(state, key(pygame.K_t), renderer, stats)
+    assert state.text.startswith('largest: ') and state.query == 1
+    _handle_event(state, key(pygame.K_h), renderer, stats)
+    assert renderer.show_hud and state.hud_profiler is not None
+    _handle_event(state, key(pygame.K_h), renderer, stats)
+    assert not renderer.show_hud and state.hud_profiler is None
+
+
+def test_poll_scan_keeps_selection(tmp_path) -> None:
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        for i in range(3):
+            (tmp_path / name / str(i)).write_bytes(b'x' * (i + 1))
+    scan = ProgressiveScan(str(tmp_path))
+    state = _LoopState(scan.next_tree(), scan)
+    state.view = state.tree._subtrees[0]
+    state.selected = state.view
+    path = state.selected.get_path()
+    final = scan.wait()
+    while state.scan is not None:
+        _poll_scan(state)
+    assert state.tree is final
+    assert state.selected.get_path() == path
+    assert state.view is state.selected
+    assert state.journal.tree is final
+    assert state.tree.data_size == FileSystemTree(str(tmp_path)).data_size
+
+
+def test_delete_undo_and_redo_through_the_loop() -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    renderer = TreemapRenderer(pygame.display.set_mode((WIDTH, HEIGHT)))
+    tree = make_tree('balanced', 1000)
+    size = tree.data_size
+    state = _LoopState(tree, None)
+    stats = LoopStats()
+    (x, y, _, _), _ = tree.generate_treemap(
+        (0, 0, WIDTH, TREEMAP_HEIGHT))[0]
+    _handle_event(state, click((x, y)), renderer, stats)
+    leaf, leaf_size = state.selected, state.selected.data_size
+    _handle_event(state, pygame.event.Event(
+        pygame.MOUSEBUTTONUP, button=3, pos=(x, y)), renderer, stats)
+    assert leaf.is_empty() and tree.data_size == size - leaf_size
+    assert state.selected is None and state.text == ''
+    _handle_event(state, key(pygame.K_z, pygame.KMOD_CTRL), renderer, stats)
+    assert tree.data_size == size and state.view is tree
+    _handle_event(state, key(pygame.K_z, pygame.KMOD_CTRL |
+                             pygame.KMOD_SHIFT), renderer, stats)
+    assert tree.data_size == size - leaf_size
+    _undo_redo(state, False, stats)
+    assert tree.data_size == size
+
+    folder = tree._subtrees[0]
+    state.view = state.selected = folder
+    state.journal.delete(folder)
+    assert _drop_removed(state)
+    assert state.selected is None
+    assert state.view is tree
+
+
+def test_toggle_filter_and_change_outside(tmp_path) -> None:
+    for name, size in (('a.txt', 10), ('b.txt', 20), ('c.py', 5)):
+        (tmp_path / name).write_bytes(b'x' * size)
+    tree = FileSystemTree(str(tmp_path))
+    state = _LoopState(tree, None)
+    stats = LoopStats()
+    leaf = [sub for sub in tree._subtrees if sub._root == 'a.txt'][0]
+    state.selected = leaf
+    _toggle_filter(state, stats)
+    assert state.filter_at == 0 and state.filtered.data_size == 30
+    assert state.text.startswith('filter: ')
+    assert state.selected.source is leaf
+
+    leaf.set_size(40)
+    _changed_outside(state)
+    assert state.filtered.data_size == 60
+    assert state.selected.source is leaf
+    for _ in range(3):
+        _toggle_filter(state, stats)
+    assert state.filtered is None and state.filter_at == -1
+    # The 'large' filter hid the selected leaf, which deselected it.
+    assert state.view is tree and state.selected is None
+    assert state.text == ''
+
+
+def test_dirty_rendering_matches_full_redraw() -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    renderer = TreemapRenderer(screen)
+    tree = make_tree('balanced', 2000)
+    renderer.render(tree, 'first')
+    leaves = [leaf for leaf in tree._layout_leaves if not leaf._subtrees]
+    for i, leaf in enumerate(leaves[:60:6]):
+        leaf.adjust_size(i % 2 == 0, 20)
+        if i == 4:
+            leaves[i + 40].delete_leaf()
+        renderer.render(tree, 'frame {}'.format(i))
+        drawn = pygame.image.tostring(screen, 'RGB')
+        renderer.invalidate()
+        renderer.render(tree, 'frame {}'.format(i))
+        assert pygame.image.tostring(screen, 'RGB') == drawn
+    assert renderer.frames == 21
+    assert _text_surface('frame 3') is _text_surface('frame 3')
+
+
+def test_measure_render() -> None:
+    first, mean = measure_render(make_tree('balanced', 1000), 5)
+    assert first > 0 and mean > 0
+
+
+def test_poll_scan_reports_failure() -> None:
+    scan = ProgressiveScan('/no/such/folder/here')
+    scan.wait()
+    tree = make_tree('wide', 3)
+    state = _LoopState(tree, scan)
+    _poll_scan(state)
+    assert state.scan is None and state.tree is tree
+    assert state.text.startswith('scan failed: ') and state.redraw
+
+
+def test_parallel_engine_only_forks_for_first_layout(monkeypatch) -> None:
+    import parallel_layout
+    calls = []
+    parallel = parallel_layout.generate_treemap_parallel
+
+    def counted(*args, **kwargs):
+        calls.append(args[0])
+        return parallel(*args, **kwargs)
+
+    monkeypatch.setattr(parallel_layout, 'generate_treemap_parallel',
+                        counted)
+    layout = get_layout_engine('parallel', 'squarified', 4)
+    tree = make_tree('balanced', 3000)
+    expected = list(tree.iter_treemap(RECT, SQUARIFIED, 4))
+    assert layout(tree, RECT) == expected
+    leaf = tree._subtrees[1]._subtrees[2]._subtrees[3]
+    for _ in range(3):
+        leaf.adjust_size(True)
+        assert layout(tree, RECT) == list(tree.iter_treemap(RECT, SQUARIFIED,
+                                                             4))
+    assert calls == [tree]
+    assert tree._layout_pass.visited < 100
@@ -0,0 +1,316 @@
+"""Live Watch Mode for FileSystemTree
+
+=== Module Description ===
+This module keeps a FileSystemTree up to date with the folder it was scanned
+from, using Linux inotify.
+
+Every folder of the tree gets an inotify watch. Events are not applied one by
+one: they are collected until the filesystem has been quiet for QUIET_PERIOD
+seconds (or until MAX_DELAY seconds have passed since the first one), and
+then every (folder, name) pair that was touched is reconciled once against
+the disk. A large untar therefore causes a handful of updates to the tree
+rather than one per event. Renames inside the watched folder are applied by
+moving the existing subtree, so the moved folder is not scanned again.
+
+Sizes of ancestors are kept consistent through AbstractTree.set_size,
+add_subtree and remove_subtree, which walk up the parents in the same way as
+del_update_parents and adjust_size.
+"""
+
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+import stat
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from scanner import scan
+from tree_data import FileSystemTree
+
+# inotify event masks, from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR)
+
+# Apply a burst of events once no new event has arrived for this long...
+QUIET_PERIOD = 0.2
+# ...or once this long has passed since the first event of the burst.
+MAX_DELAY = 1.0
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_libc() -> ctypes.CDLL:
+    """Return the C library, with the inotify functions' signatures set."""
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class TreeWatcher:
+    """Applies inotify events for a folder to its FileSystemTree.
+
+    === Public Attributes ===
+    tree: the tree being kept up to date.
+    root_path: the path the tree was scanned from.
+    updates: the number of batches of events applied so far.
+    unwatched: the number of folders that could not be watched, e.g. because
+        the inotify watch limit was reached.
+
+    === Private Attributes ===
+    _libc: the C library.
+    _fd: the inotify file descriptor.
+    _watches: the folder node for each watch descriptor.
+    _descriptors: the watch descriptor for each watched folder node.
+    _pending: the raw events of the current burst, as
+        (watch descriptor, mask, cookie, name) tuples.
+    _first_event: the time the first event of the current burst arrived.
+    _last_event: the time the latest event of the current burst arrived.
+    """
+    tree: FileSystemTree
+    root_path: str
+    updates: int
+    unwatched: int
+    _fd: int
+    _watches: Dict[int, FileSystemTree]
+    _descriptors: Dict[FileSystemTree, int]
+    _pending: List[Tuple[int, int, int, str]]
+    _first_event: float
+    _last_event: float
+
+    def __init__(self: TreeWatcher, tree: FileSystemTree,
+                 root_path: str) -> None:
+        """Start watching <root_path>, the folder <tree> was scanned from.
+
+        Raise OSError if inotify is not available.
+        """
+        self.tree = tree
+        self.root_path = root_path
+        self.updates = 0
+        self.unwatched = 0
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}
+        self._descriptors = {}
+        self._pending = []
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._watch_subtree(tree)
+
+    def close(self: TreeWatcher) -> None:
+        """Stop watching the folder."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches = {}
+        self._descriptors = {}
+
+    def path_of(self: TreeWatcher, node: FileSystemTree) -> str:
+        """Return the full path of <node> on disk."""
+        names = []
+        while node._parent_tree is not None:
+            names.append(str(node._root))
+            node = node._parent_tree
+        return os.path.join(self.root_path, *reversed(names))
+
+    def poll(self: TreeWatcher) -> bool:
+        """Read any new events without blocking, and apply the current burst
+        of events if it is complete.
+
+        Return True if the tree was changed.
+        """
+        now = time.monotonic()
+        if self._read_events():
+            if not self._first_event:
+                self._first_event = now
+            self._last_event = now
+        if not self._pending:
+            return False
+        if now - self._last_event < QUIET_PERIOD and \
+                now - self._first_event < MAX_DELAY:
+            return False
+        events, self._pending = self._pending, []
+        self._first_event = 0.0
+        self._apply(events)
+        self.updates += 1
+        return True
+
+    def _read_events(self: TreeWatcher) -> bool:
+        """Move all available events into the pending burst.
+
+        Return True if any event was read.
+        """
+        got_any = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return got_any
+            if not data:
+                return got_any
+            got_any = True
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._pending.append((wd, mask, cookie, name))
+
+    def _apply(self: TreeWatcher,
+               events: List[Tuple[int, int, int, str]]) -> None:
+        """Apply a burst of raw <events> to the tree."""
+        touched = {}
+        moved_from = {}
+        moves = []
+        for wd, mask, cookie, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: reconcile every entry of every folder.
+                for node in list(self._watches.values()):
+                    self._reconcile_folder(node)
+                return
+            if mask & IN_IGNORED:
+                node = self._watches.pop(wd, None)
+                if node is not None:
+                    self._descriptors.pop(node, None)
+                continue
+            node = self._watches.get(wd)
+            if node is None or not name:
+                continue
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = (node, name)
+            elif mask & IN_MOVED_TO and cookie in moved_from:
+                moves.append((moved_from.pop(cookie), (node, name)))
+            touched.setdefault(node, set()).add(name)
+
+        for (old_parent, old_name), (new_parent, new_name) in moves:
+            self._move(old_parent, old_name, new_parent, new_name)
+        for node, names in touched.items():
+            if not node.is_empty():
+                for name in names:
+                    self._reconcile(node, name)
+
+    def _move(self: TreeWatcher, old_parent: FileSystemTree, old_name: str,
+              new_parent: FileSystemTree, new_name: str) -> None:
+        """Move the entry <old_name> of <old_parent> to be the entry
+        <new_name> of <new_parent>, without scanning it again.
+        """
+        child = _find_child(old_parent, old_name)
+        if child is None or old_parent.is_empty() or new_parent.is_empty():
+            return
+        replaced = _find_child(new_parent, new_name)
+        if replaced is not None:
+            self._unwatch_subtree(replaced)
+            new_parent.remove_subtree(replaced)
+        old_parent.remove_subtree(child)
+        child._root = new_name
+        new_parent.add_subtree(child)
+
+    def _reconcile_folder(self: TreeWatcher, node: FileSystemTree) -> None:
+        """Reconcile every entry of the folder <node> against the disk."""
+        try:
+            names = set(os.listdir(self.path_of(node)))
+        except OSError:
+            return
+        names.update(str(sub._root) for sub in node._subtrees
+                     if not sub.is_empty())
+        for name in names:
+            self._reconcile(node, name)
+
+    def _reconcile(self: TreeWatcher, parent: FileSystemTree,
+                   name: str) -> None:
+        """Make the entry <name> of the folder <parent> match the disk."""
+        child = _find_child(parent, name)
+        path = os.path.join(self.path_of(parent), name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+
+        if child is not None:
+            # A folder whose watch was dropped has been deleted and perhaps
+            # recreated, so it is scanned again.
+            if st is not None and \
+                    stat.S_ISDIR(st.st_mode) == bool(child._is_dir) and \
+                    (not child._is_dir or child in self._descriptors):
+                if not child._is_dir and child.data_size != st.st_size:
+                    child.set_size(st.st_size)
+                    child._mtime = st.st_mtime
+                return
+            self._unwatch_subtree(child)
+            parent.remove_subtree(child)
+
+        if st is None:
+            return
+        if stat.S_ISDIR(st.st_mode):
+            # Scanned as a part of the watched tree, not as a tree of its
+            # own, so that add_subtree reports its nodes to the tree's
+            # AggregateIndex.
+            try:
+                new, _ = scan(path, FileSystemTree._make_node)
+            except OSError:
+                return
+            new._root = name
+            parent.add_subtree(new)
+            self._watch_subtree(new)
+        else:
+            parent.add_subtree(FileSystemTree._make_node(
+                name, [], st.st_size, st.st_mtime, False))
+
+    def _watch_subtree(self: TreeWatcher, tree: FileSystemTree) -> None:
+        """Add a watch for every folder in <tree>."""
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if not node._is_dir or node.is_empty():
+                continue
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(self.path_of(node)), WATCH_MASK)
+            if wd < 0:
+                self.unwatched += 1
+            else:
+                self._watches[wd] = node
+                self._descriptors[node] = wd
+            stack.extend(node._subtrees)
+
+    def _unwatch_subtree(self: TreeWatcher, tree: FileSystemTree) -> None:
+        """Remove the watches of every folder in <tree>."""
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            wd = self._descriptors.pop(node, None)
+            if wd is not None:
+                self._watches.pop(wd, None)
+                self._libc.inotify_rm_watch(self._fd, wd)
+            stack.extend(node._subtrees)
+
+
+def _find_child(parent: FileSystemTree, name: str) \
+        -> Optional[FileSystemTree]:
+    """Return the non-empty subtree of <parent> called <name>, or None."""
+    for sub in parent._subtrees:
+        if sub._root == name:
+            return sub
+    return None
+
@@ -0,0 +1,101 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import watcher
+from tree_data import FileSystemTree
+
+
+def shape(tree) -> list:
+    """Return the paths and sizes of <tree>, sorted."""
+    rows = []
+    stack = [(tree, '')]
+    while stack:
+        node, path = stack.pop()
+        path = path + '/' + str(node._root)
+        rows.append((path, node.data_size))
+        stack.extend((child, path) for child in node._subtrees)
+    return sorted(rows)
+
+
+def settle(tree_watcher: watcher.TreeWatcher) -> None:
+    """Poll <tree_watcher> until it applies a burst of events."""
+    deadline = time.monotonic() + 5
+    while not tree_watcher.poll():
+        assert time.monotonic() < deadline, 'no changes applied'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def watched(tmp_path, monkeypatch):
+    """Yield a watched folder, its tree and its watcher."""
+    monkeypatch.setattr(watcher, 'QUIET_PERIOD', 0.02)
+    top = str(tmp_path / 'top')
+    os.makedirs(os.path.join(top, 'a', 'b'))
+    with open(os.path.join(top, 'a', 'f'), 'wb') as f:
+        f.write(b'x' * 10)
+    tree = FileSystemTree(top)
+    try:
+        tree_watcher = watcher.TreeWatcher(tree, top)
+    except OSError:
+        pytest.skip('inotify is not available')
+    yield top, tree, tree_watcher
+    tree_watcher.close()
+
+
+def test_changes_applied(watched) -> None:
+    top, tree, tree_watcher = watched
+    with open(os.path.join(top, 'a', 'b', 'g'), 'wb') as f:
+        f.write(b'x' * 25)
+    with open(os.path.join(top, 'a', 'f'), 'ab') as f:
+        f.write(b'x' * 5)
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+    assert tree.data_size == 40
+
+    os.remove(os.path.join(top, 'a', 'f'))
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+    assert tree.data_size == 25
+
+
+def test_rename_and_new_folders(watched) -> None:
+    top, tree, tree_watcher = watched
+    os.rename(os.path.join(top, 'a'), os.path.join(top, 'c'))
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+
+    os.makedirs(os.path.join(top, 'c', 'new'))
+    settle(tree_watcher)
+    with open(os.path.join(top, 'c', 'new', 'h'), 'wb') as f:
+        f.write(b'x' * 7)
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+
+    shutil.rmtree(os.path.join(top, 'c'))
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+    assert tree.data_size == 0
+
+
+def test_new_folder_joins_aggregate_index(watched) -> None:
+    top, tree, tree_watcher = watched
+    new = os.path.join(top, 'new')
+    os.makedirs(os.path.join(new, 'deeper'))
+    with open(os.path.join(new, 'deeper', 'big.log'), 'wb') as f:
+        f.write(b'x' * 100)
+    settle(tree_watcher)
+    assert shape(tree) == shape(FileSystemTree(top))
+    folder = watcher._find_child(tree, 'new')
+    assert folder._aggregates is None
+    assert tree.largest(1)[0]._root == 'big.log'
+    assert tree.size_by() == {'': 10, '.log': 100}
+
+    with open(os.path.join(new, 'small.log'), 'wb') as f:
+        f.write(b'x' * 200)
+    settle(tree_watcher)
+    assert [leaf._root for leaf in folder.largest(2)] == \
+        ['small.log', 'big.log']
+    assert tree.size_by() == {'': 10, '.log': 300}